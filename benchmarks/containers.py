@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Compares the memory and time of the column backed `MediaContainer` with the previous object per container layout.
+
+Usage: python3 benchmarks/containers.py [--num-files N] [--num-courses N]
+
+Synthetic containers are created for a single account. Nothing is written to the database or the file system.
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Tuple
+
+
+class LegacyMediaContainer:
+    """
+    The layout of `MediaContainer` before it became a view of `ContainerTable`.
+    """
+    _name: str
+    url: str
+    download_url: str
+    path: Path
+    time: int
+    course: Any
+    media_type: Any
+    size: int
+    _links: List[LegacyMediaContainer]
+    checksum: Optional[str]
+    current_size: Optional[int]
+    _stop: bool
+    _done: bool
+    _newly_downloaded: bool
+    _newly_discovered: bool
+
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self, _name: str, url: str, download_url: str, path: Path, time: int, course: Any, media_type: Any, size: int,
+                 checksum: Optional[str] = None, _links: Optional[List[LegacyMediaContainer]] = None,
+                 _newly_downloaded: bool = False, _newly_discovered: bool = False) -> None:
+        self._name = _name
+        self.url = url
+        self.download_url = download_url
+        self.path = path
+        self.time = time
+        self.course = course
+        self.media_type = media_type
+        self.size = size
+        self.checksum = checksum
+        self.current_size = None
+        self._stop = False
+        self._links = _links or []
+        self._done = False
+        self._newly_downloaded = _newly_downloaded
+        self._newly_discovered = _newly_discovered
+
+
+def synthetic_rows(num_files: int, num_courses: int) -> List[Tuple[Any, ...]]:
+    from isisdl.backend.request_helper import Course
+    from isisdl.utils import MediaType
+
+    courses = [Course(f"Course {i}", f"Course {i}", f"Course {i}", i) for i in range(num_courses)]
+    media_types = [MediaType.document, MediaType.document, MediaType.extern, MediaType.video]
+
+    rows = []
+    for i in range(num_files):
+        course, media_type = courses[i % num_courses], media_types[i % len(media_types)]
+        name = f"Lecture {i // num_courses:04d} - Slides.pdf"
+        url = f"https://isis.tu-berlin.de/webservice/pluginfile.php/{i}/mod_resource/content/1/{name.replace(' ', '%20')}"
+        rows.append((name, url, url, course.path(media_type.dir_name, name), 1_650_000_000 + i, course, media_type, 1024 * (i % 4096 + 1), f"{i:064x}"))
+
+    return rows
+
+
+def measure(func: Callable[[], List[Any]]) -> Tuple[List[Any], float, int]:
+    """
+    Tracing the allocations slows down the creation a lot → the time is taken in a separate run.
+    """
+    gc.collect()
+    s = time.perf_counter()
+    func()
+    taken = time.perf_counter() - s
+
+    gc.collect()
+    tracemalloc.start()
+    res = func()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return res, taken, memory
+
+
+def work(containers: List[Any]) -> float:
+    """
+    The accesses of a run where nothing has to be downloaded: summing up sizes, looking at states, building a path mapping.
+    """
+    s = time.perf_counter()
+    sum(item.size for item in containers if item.size != -1)
+    sum(1 for item in containers if item._done or item.current_size is not None)
+    {str(item.path): item for item in containers}
+    sorted(containers, key=lambda x: x.time, reverse=True)
+
+    return time.perf_counter() - s
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-files", type=int, default=100_000)
+    parser.add_argument("--num-courses", type=int, default=50)
+
+    # isisdl parses `sys.argv` on import → hand it only the arguments it knows about.
+    benchmark_args, sys.argv[1:] = parser.parse_known_args()
+
+    from isisdl.backend.request_helper import MediaContainer, ContainerTable
+
+    rows = synthetic_rows(benchmark_args.num_files, benchmark_args.num_courses)
+    print(f"{len(rows)} containers in {benchmark_args.num_courses} courses\n")
+
+    for name, cls in [("objects", LegacyMediaContainer), ("table  ", MediaContainer)]:
+        def create() -> List[Any]:
+            # Every run starts with an empty table. The paths are rebuilt for every container, as they are when coming from the database or a probe.
+            MediaContainer.table = ContainerTable()
+            return [cls(n, u, d, Path(str(p)), t, c, m, s, ch) for n, u, d, p, t, c, m, s, ch in rows]  # type: ignore[operator]
+
+        containers, taken, memory = measure(create)
+        print(f"{name}: {memory / 1024 ** 2:7.2f} MiB  create {taken:6.3f}s  access {work(containers):6.3f}s")
+
+        del containers
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Compares the threaded discovery with the asyncio discovery on the configured account.
+
+Usage: python3 benchmarks/discovery.py [--rounds N] [--cold]
+
+With `--cold` the in-memory url cache is emptied before every round so every file is probed again.
+The database itself is not touched besides re-dumping the very same containers.
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from typing import Dict, List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from isisdl.backend.request_helper import RequestHelper
+
+
+def time_discovery(helper: RequestHelper, use_asyncio: bool, cold: bool) -> float:
+    import isisdl.backend.request_helper as request_helper
+    from isisdl.utils import database_helper
+
+    request_helper.discover_use_asyncio = use_asyncio  # type: ignore[attr-defined]
+
+    backup = dict(database_helper._url_container_mapping)
+    if cold:
+        database_helper._url_container_mapping.clear()
+
+    try:
+        s = time.perf_counter()
+        content = helper.download_content()
+        taken = time.perf_counter() - s
+
+    finally:
+        database_helper._url_container_mapping.clear()
+        database_helper._url_container_mapping.update(backup)
+
+    print(f"{'asyncio ' if use_asyncio else 'threaded'}: {taken:6.2f}s for {sum(len(row) for row in content.values())} files")
+    return taken
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--cold", action="store_true")
+
+    # isisdl parses `sys.argv` on import → hand it only the arguments it knows about.
+    benchmark_args, sys.argv[1:] = parser.parse_known_args()
+
+    from isisdl.backend.crypt import get_credentials
+    from isisdl.backend.request_helper import RequestHelper
+
+    helper = RequestHelper(get_credentials())
+    print(f"Discovering {len(helper.courses)} courses, {benchmark_args.rounds} rounds, {'cold' if benchmark_args.cold else 'warm'} cache\n")
+
+    timings: Dict[bool, List[float]] = {False: [], True: []}
+    for _ in range(benchmark_args.rounds):
+        # Alternate the modes so drifts in the server load hit both equally.
+        for use_asyncio in (False, True):
+            timings[use_asyncio].append(time_discovery(helper, use_asyncio, benchmark_args.cold))
+
+    print()
+    for use_asyncio, times in timings.items():
+        print(f"{'asyncio ' if use_asyncio else 'threaded'}: {[round(it, 2) for it in times]} → {statistics.mean(times):.3f}")
+
+
+if __name__ == "__main__":
+    main()
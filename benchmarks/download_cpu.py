@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Compares the CPU time per GiB of the previous download loop with `MediaContainer.write_stream`.
+
+Usage: python3 benchmarks/download_cpu.py [--size MiB] [--rounds N]
+
+A file of `--size` MiB is served by `python3 -m http.server` on localhost in a separate process, such that its CPU time is not counted.
+Both loops download it without a download limit into a temporary file.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+MiB = 1024 ** 2
+
+
+class LegacyThrottler:
+    """
+    The unlimited path of `DownloadThrottler.get` before it was measured in bytes: A shared token and a timestamp for every chunk.
+    """
+
+    class Token:
+        num_bytes = 2 ** 16
+
+    token = Token()
+    timestamps: List[float] = []
+
+    def get(self, location: Path) -> Token:
+        try:
+            return self.token
+        finally:
+            self.timestamps.append(time.perf_counter())
+
+
+def legacy_loop(response: Any, target: Path, num_tries: int) -> int:
+    """
+    The loop of `MediaContainer.download` before `write_stream`.
+    """
+    throttler, current_size = LegacyThrottler(), 0
+    with target.open("wb") as f:
+        while True:
+            token = throttler.get(target)
+
+            i = 0
+            while i < num_tries:
+                try:
+                    new = response.raw.read(token.num_bytes, decode_content=True)
+                    break
+
+                except Exception:
+                    i += 1
+            else:
+                break
+
+            if not new:
+                break
+
+            f.write(new)
+            current_size += len(new)
+
+    return current_size
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+def measure(func: Callable[[], int]) -> Tuple[float, float, int]:
+    cpu, wall = time.process_time(), time.perf_counter()
+    num_bytes = func()
+    return time.process_time() - cpu, time.perf_counter() - wall, num_bytes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=512, help="MiB")
+    parser.add_argument("--rounds", type=int, default=5)
+
+    # isisdl parses `sys.argv` on import → hand it only the arguments it knows about.
+    benchmark_args, sys.argv[1:] = parser.parse_known_args()
+
+    import requests
+
+    from isisdl.backend.request_helper import MediaContainer, Course
+    from isisdl.settings import num_tries_download
+    from isisdl.utils import DownloadThrottler, MediaType
+
+    with tempfile.TemporaryDirectory() as directory:
+        source, target = Path(directory, "source.bin"), Path(directory, "target.bin")
+        with source.open("wb") as f:
+            for _ in range(benchmark_args.size):
+                f.write(os.urandom(MiB))
+
+        port = free_port()
+        server = subprocess.Popen([sys.executable, "-m", "http.server", "--bind", "127.0.0.1", "--directory", directory, str(port)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        url = f"http://127.0.0.1:{port}/source.bin"
+
+        try:
+            for _ in range(50):
+                try:
+                    requests.head(url, timeout=1)
+                    break
+                except requests.ConnectionError:
+                    time.sleep(0.1)
+
+            throttler = DownloadThrottler()
+            throttler.download_rate = -1
+            container = MediaContainer("target.bin", url, url, target, 0, Course("Benchmark", "Benchmark", "Benchmark", -1), MediaType.document, source.stat().st_size)
+
+            def legacy() -> int:
+                with requests.get(url, stream=True) as response:
+                    return legacy_loop(response, target, num_tries_download)
+
+            def write_stream() -> int:
+                container.current_size = 0
+                with requests.get(url, stream=True) as response, target.open("wb", buffering=0) as f:
+                    container.write_stream(response, f, throttler)
+
+                return container.current_size
+
+            results: Dict[str, List[Tuple[float, float, int]]] = {"previous loop": [], "write_stream": []}
+            for _ in range(benchmark_args.rounds):
+                for name, func in [("previous loop", legacy), ("write_stream", write_stream)]:
+                    results[name].append(measure(func))
+
+        finally:
+            server.terminate()
+            server.wait()
+
+        print(f"{benchmark_args.size} MiB over localhost, median of {benchmark_args.rounds} rounds\n")
+        for name, runs in results.items():
+            assert all(num_bytes == benchmark_args.size * MiB for *_, num_bytes in runs)
+            cpu, wall = statistics.median(it[0] for it in runs), statistics.median(it[1] for it in runs)
+            gib = benchmark_args.size * MiB / 1024 ** 3
+            print(f"{name:>14}: {cpu / gib:6.3f} CPU s / GiB  {benchmark_args.size / wall:8.1f} MiB/s")
+
+
+if __name__ == "__main__":
+    main()
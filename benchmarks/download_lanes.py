@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Compares the order in which the files are downloaded: As they are discovered (the previous ordering) and with the small / large `DownloadLanes`.
+
+Usage: python3 benchmarks/download_lanes.py [--num-small N] [--num-large N] [--num-threads N] [--bandwidth MiB/s] [--connection-bandwidth MiB/s] [--latency s] [--seed N]
+
+Nothing is downloaded: The downloads are simulated. Every download waits `--latency` s for the response and then shares the bandwidth equally with the other
+running downloads, each of them limited to `--connection-bandwidth`.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+from types import SimpleNamespace
+from typing import Any, Callable, List, Optional, Tuple
+
+MiB = 1024 ** 2
+
+
+def synthetic_files(num_small: int, num_large: int) -> List[Any]:
+    # Documents are mostly below a few MiB, lecture recordings some hundred MiB up to a few GiB.
+    small = [SimpleNamespace(size=int(min(random.lognormvariate(13.5, 1.2), 40 * MiB)), should_download=True) for _ in range(num_small)]
+    large = [SimpleNamespace(size=random.randint(200 * MiB, 2048 * MiB), should_download=True) for _ in range(num_large)]
+    for file in small + large:
+        file.host, file.current_size = "isis.tu-berlin.de", file.size
+
+    files = small + large
+    random.shuffle(files)
+    return files
+
+
+def simulate(get: Callable[[], Optional[Any]], done: Callable[[Any], None], num_threads: int, bandwidth: float, connection_bandwidth: float, latency: float) -> List[float]:
+    """
+    Returns the time at which every file was done.
+    """
+    now, finished = 0.0, []
+    running: List[Tuple[Any, float, float]] = []  # (file, latency left, bytes left)
+
+    def fill() -> None:
+        while len(running) < num_threads and (file := get()) is not None:
+            running.append((file, latency, float(file.size)))
+
+    fill()
+    while running:
+        num_transferring = sum(1 for _, wait, _ in running if wait <= 0)
+        rate = min(connection_bandwidth, bandwidth / max(num_transferring, 1))
+
+        step = min(wait if wait > 0 else left / rate for _, wait, left in running)
+        now += step
+
+        still_running = []
+        for file, wait, left in running:
+            if wait > 0:
+                wait -= step
+            else:
+                left -= step * rate
+
+            if wait <= 1e-9 and left <= 1e-3:
+                finished.append(now)
+                done(file)
+            else:
+                still_running.append((file, wait, left))
+
+        running[:] = still_running
+        fill()
+
+    return finished
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-small", type=int, default=600)
+    parser.add_argument("--num-large", type=int, default=20)
+    parser.add_argument("--num-threads", type=int, default=6)
+    parser.add_argument("--bandwidth", type=float, default=50, help="MiB/s")
+    parser.add_argument("--connection-bandwidth", type=float, default=20, help="MiB/s")
+    parser.add_argument("--latency", type=float, default=0.15)
+    parser.add_argument("--seed", type=int, default=42)
+
+    # isisdl parses `sys.argv` on import → hand it only the arguments it knows about.
+    benchmark_args, sys.argv[1:] = parser.parse_known_args()
+
+    import isisdl.backend.request_helper as request_helper
+    from isisdl.backend.request_helper import DownloadLanes
+
+    # The connections per host are learned from the time the downloads take, which is simulated here → a single queue for all of them.
+    request_helper.enable_host_fair_share = False
+
+    random.seed(benchmark_args.seed)
+    files = synthetic_files(benchmark_args.num_small, benchmark_args.num_large)
+    total_size = sum(file.size for file in files)
+    print(f"{len(files)} files, {total_size / 1024 ** 3:.2f} GiB, {benchmark_args.num_threads} threads, "
+          f"{benchmark_args.bandwidth:.0f} MiB/s ({benchmark_args.connection_bandwidth:.0f} MiB/s per connection)\n")
+
+    lanes = DownloadLanes()
+    for file in files:
+        lanes.put(file)
+    lanes.put(None)
+
+    in_order = iter(files)
+    strategies = {
+        "discovery order": (lambda: next(in_order, None), lambda file: None),
+        "lanes": (lambda: lanes.get(benchmark_args.num_threads), lanes.done),
+    }
+
+    for name, (get, done) in strategies.items():
+        finished = simulate(get, done, benchmark_args.num_threads, benchmark_args.bandwidth * MiB, benchmark_args.connection_bandwidth * MiB, benchmark_args.latency)
+        first_100 = finished[min(100, len(finished)) - 1]
+        print(f"{name:>16}: first 100 files after {first_100:8.1f}s  half of the files after {finished[len(finished) // 2]:8.1f}s  makespan {finished[-1]:8.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Measures the write throughput of downloads with preallocated .part files and the `download_fsync_policy`s.
+
+Usage: python3 benchmarks/file_writes.py [--directory DIR] [--num-small N] [--num-large N] [--large-size MiB]
+
+The files are written to DIR (a temporary directory by default, pass one on the disk to measure) with `MediaContainer.write_stream`
+from memory, without a network in between. Compared to writing the file in place, as it was done before the .part files.
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, List, Optional
+
+MiB = 1024 ** 2
+
+
+class UnlimitedThrottler:
+    def get(self, location: Path, num_bytes: int = 0) -> int:
+        return num_bytes
+
+    def record(self, num_bytes: int) -> None:
+        pass
+
+
+def write_files(directory: Path, sizes: List[int], data: bytes, atomic: bool, preallocated: bool, policy: Optional[str]) -> float:
+    """
+    Writes a file of every size the way `MediaContainer.download` does and returns the time taken.
+    """
+    from requests import Response
+
+    from isisdl.backend.request_helper import MediaContainer, Course, DownloadSync
+    from isisdl.utils import MediaType, preallocate
+
+    course, throttler = Course("Benchmark", "Benchmark", "Benchmark", -1), UnlimitedThrottler()
+    sync = DownloadSync(policy or "none")
+    taken = 0.0
+
+    for i, size in enumerate(sizes):
+        file = directory.joinpath(f"{i}.bin")
+        container = MediaContainer(file.name, f"https://example.com/{i}", f"https://example.com/{i}", file, 0, course, MediaType.document, size)  # type: ignore[arg-type]
+        target = container.part_path if atomic else file
+
+        response = Response()
+        response.raw = io.BytesIO(data[:size])
+
+        start = time.perf_counter()
+        container.current_size = 0
+        with target.open("wb", buffering=0) as f:
+            if preallocated:
+                preallocate(f.fileno(), 0, size)
+
+            container.write_stream(response, f, throttler)
+            f.truncate(container.current_size)
+            if atomic:
+                sync.before_replace(f.fileno())
+
+        if atomic:
+            os.replace(target, file)
+            sync.after_replace(file)
+
+        taken += time.perf_counter() - start
+
+    start = time.perf_counter()
+    sync.flush()
+
+    return taken + time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--directory", type=Path, default=None)
+    parser.add_argument("--num-small", type=int, default=300)
+    parser.add_argument("--num-large", type=int, default=4)
+    parser.add_argument("--large-size", type=int, default=256, help="MiB")
+    parser.add_argument("--seed", type=int, default=42)
+
+    # isisdl parses `sys.argv` on import → hand it only the arguments it knows about.
+    benchmark_args, sys.argv[1:] = parser.parse_known_args()
+
+    random.seed(benchmark_args.seed)
+    sizes = [random.randint(64 * 1024, 4 * MiB) for _ in range(benchmark_args.num_small)] + [benchmark_args.large_size * MiB] * benchmark_args.num_large
+    random.shuffle(sizes)
+    data = os.urandom(max(sizes))
+    total = sum(sizes) / MiB
+
+    base = Path(tempfile.mkdtemp(dir=benchmark_args.directory))
+    print(f"{len(sizes)} files, {total:.0f} MiB in {base}\n")
+
+    configs: List[Any] = [
+        ("in place", False, False, None),
+        (".part", True, False, "none"),
+        (".part, preallocated", True, True, "none"),
+        (".part, preallocated, batch", True, True, "batch"),
+        (".part, preallocated, file", True, True, "file"),
+    ]
+
+    try:
+        for name, atomic, preallocated, policy in configs:
+            directory = base.joinpath(name.replace(" ", "").replace(",", "_"))
+            directory.mkdir()
+            taken = write_files(directory, sizes, data, atomic, preallocated, policy)
+            print(f"{name:>28}: {taken:7.2f}s  {total / taken:8.1f} MiB/s")
+
+            shutil.rmtree(directory)
+
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
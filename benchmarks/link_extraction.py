@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Compares `url_finder` over `str(content)` with the structured `find_links` on course contents.
+
+Usage: python3 benchmarks/link_extraction.py [--payloads DIR | --capture DIR] [--rounds N]
+
+`--capture DIR` stores the `core_course_get_contents` response of every course of the configured account in DIR.
+`--payloads DIR` benchmarks the stored responses. Without either, synthetic courses with long descriptions are used.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import statistics
+import string
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Set
+
+
+def random_text(num_words: int) -> str:
+    return " ".join("".join(random.choice(string.ascii_lowercase) for _ in range(random.randint(2, 10))) for _ in range(num_words))
+
+
+def synthetic_course(num_sections: int, num_modules: int) -> List[Dict[str, Any]]:
+    def html() -> str:
+        parts = []
+        for _ in range(random.randint(3, 12)):
+            parts.append(f"<p>{random_text(random.randint(20, 120))}</p>")
+            if random.random() < 0.4:
+                parts.append(f'<a href="https://example.com/{random_text(1)}/{random_text(1)}.pdf">{random_text(3)}</a>')
+            if random.random() < 0.2:
+                parts.append(f"<p>See https://www.{random_text(1)}.de/{random_text(1)}.</p>")
+
+        return "".join(parts)
+
+    return [{
+        "id": section,
+        "name": random_text(3),
+        "summary": html(),
+        "modules": [{
+            "id": section * 1000 + module,
+            "url": f"https://isis.tu-berlin.de/mod/resource/view.php?id={section * 1000 + module}",
+            "name": random_text(4),
+            "modicon": "https://isis.tu-berlin.de/theme/image.php/nephthys/resource/1/icon",
+            "description": html() if random.random() < 0.5 else "",
+            "contents": [{
+                "type": "file",
+                "filename": f"{random_text(1)}.pdf",
+                "filepath": "/",
+                "filesize": random.randint(1, 2 ** 24),
+                "fileurl": f"https://isis.tu-berlin.de/webservice/pluginfile.php/{module}/mod_resource/content/1/{random_text(1)}.pdf?forcedownload=1",
+                "timemodified": int(time.time()),
+            }],
+        } for module in range(num_modules)],
+    } for section in range(num_sections)]
+
+
+def capture(directory: Path) -> None:
+    from isisdl.backend.crypt import get_credentials
+    from isisdl.backend.request_helper import RequestHelper
+
+    directory.mkdir(parents=True, exist_ok=True)
+    helper = RequestHelper(get_credentials())
+    for course in helper.courses:
+        content = course.get_contents(helper)
+        if content is not None:
+            with directory.joinpath(f"{course.course_id}.json").open("w") as f:
+                json.dump(content, f)
+
+    print(f"Captured {len(helper.courses)} courses to {directory}")
+
+
+def time_it(func: Callable[[Any], Set[str]], content: Any, rounds: int) -> float:
+    timings = []
+    for _ in range(rounds):
+        s = time.perf_counter()
+        func(content)
+        timings.append(time.perf_counter() - s)
+
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--payloads", type=Path, default=None)
+    parser.add_argument("--capture", type=Path, default=None)
+    parser.add_argument("--rounds", type=int, default=20)
+
+    # isisdl parses `sys.argv` on import → hand it only the arguments it knows about.
+    benchmark_args, sys.argv[1:] = parser.parse_known_args()
+
+    if benchmark_args.capture is not None:
+        capture(benchmark_args.capture)
+        return
+
+    from isisdl.settings import url_finder
+    from isisdl.utils import find_links
+
+    if benchmark_args.payloads is not None:
+        payloads = {file.name: json.loads(file.read_text()) for file in sorted(benchmark_args.payloads.glob("*.json"))}
+    else:
+        random.seed(42)
+        payloads = {f"synthetic {sections}x{modules}": synthetic_course(sections, modules) for sections, modules in [(5, 5), (15, 10), (30, 20)]}
+
+    def regex(content: Any) -> Set[str]:
+        return set(url_finder.findall(str(content)))
+
+    total_regex, total_structured = 0.0, 0.0
+    for name, content in payloads.items():
+        regex_time, structured_time = time_it(regex, content, benchmark_args.rounds), time_it(find_links, content, benchmark_args.rounds)
+        total_regex += regex_time
+        total_structured += structured_time
+
+        # Only links with a scheme are used by the discovery
+        old, new = {link.replace("&amp;", "&") for link in regex(content) if "://" in link}, find_links(content)
+        print(f"{name:>24}: {len(json.dumps(content)) / 1024:8.1f} KiB  regex {regex_time * 1000:8.2f}ms  structured {structured_time * 1000:8.2f}ms  "
+              f"({regex_time / max(structured_time, 1e-9):5.1f}x)  links: {len(old)} vs {len(new)}, {len(old - new)} missing")
+
+    print(f"\nTotal: regex {total_regex * 1000:.2f}ms, structured {total_structured * 1000:.2f}ms ({total_regex / max(total_structured, 1e-9):.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
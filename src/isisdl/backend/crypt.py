@@ -2,6 +2,7 @@ import base64
 import getpass
 import os
 import sys
+from functools import lru_cache
 from typing import Optional, List
 
 from cryptography.fernet import Fernet, InvalidToken
@@ -55,6 +56,25 @@ def decryptor(password: str, content: str) -> Optional[str]:
         return None
 
 
+@lru_cache(maxsize=4)
+def session_key(password: str) -> bytes:
+    # The session cache is saved and loaded several times per run. Deriving the key is deliberately slow, so only do it once per process.
+    return generate_key(password)
+
+
+def session_encryptor(user: User, content: str) -> str:
+    # The session cache is bound to the user's password: Whoever can read it could log in anyway.
+    # This does not go through `encryptor` as it would overwrite the cached `last_password`.
+    return Fernet(session_key(user.password)).encrypt(content.encode()).decode()
+
+
+def session_decryptor(user: User, content: str) -> Optional[str]:
+    try:
+        return Fernet(session_key(user.password)).decrypt(content.encode()).decode()
+    except InvalidToken:
+        return None
+
+
 def store_user(user: User, password: Optional[str] = None) -> None:
     encrypted = encryptor(password or master_password, user.password)
 
@@ -2,10 +2,11 @@ from __future__ import annotations
 
 import json
 import sqlite3
+import time
 from collections import defaultdict
 from sqlite3 import Connection, Cursor
 from threading import Lock
-from typing import TYPE_CHECKING, cast, Set, Dict, List, Any, Union, DefaultDict, Iterable
+from typing import TYPE_CHECKING, cast, Set, Dict, List, Any, Union, DefaultDict, Iterable, Optional, Tuple
 
 from isisdl.settings import database_file_location
 
@@ -22,6 +23,9 @@ class DatabaseHelper:
     lock = Lock()
     _bad_urls: Set[str] = set()
     _url_container_mapping: Dict[str, Iterable[Any]] = {}
+    _validators: Dict[str, Tuple[Optional[str], Optional[str], int]] = {}
+    _validated: Set[str] = set()
+    _probe_modes: Dict[str, str] = {}
 
     def __init__(self) -> None:
         from isisdl.utils import path
@@ -34,6 +38,8 @@ class DatabaseHelper:
 
         self._bad_urls.update(self.get_bad_urls())
         self._url_container_mapping.update(self.get_containers())
+        self._validators.update(self.get_all_validators())
+        self._probe_modes.update(self.get_probe_modes())
 
     def create_default_tables(self) -> None:
         with self.lock:
@@ -47,6 +53,26 @@ class DatabaseHelper:
                 (id text primary key unique, json text)
             """)
 
+            self.cur.execute("""
+                CREATE TABLE IF NOT EXISTS course_sync
+                (course_id int primary key unique, time int, fingerprint text, content_hash text, parse_time real, containers text)
+            """)
+
+            self.cur.execute("""
+                CREATE TABLE IF NOT EXISTS course_stats
+                (course_id int primary key unique, latency real, num_containers int)
+            """)
+
+            self.cur.execute("""
+                CREATE TABLE IF NOT EXISTS partial_downloads
+                (path text primary key unique, url text, validator text)
+            """)
+
+            self.cur.execute("""
+                CREATE TABLE IF NOT EXISTS validators
+                (url text primary key unique, etag text, last_modified text, last_checked int)
+            """)
+
     def get_state(self) -> Dict[str, List[Any]]:
         res: Dict[str, List[Any]] = {}
         with self.lock:
@@ -145,6 +171,10 @@ class DatabaseHelper:
             return defaultdict(lambda: None, json.loads(data[0]))
 
     def add_bad_url(self, url: str) -> None:
+        if url in self._bad_urls:
+            # The same url may be linked in multiple courses.
+            return
+
         with self.lock:
             _data = self.cur.execute("SELECT json FROM json_strings where id=\"bad_url_cache\"").fetchone()
             if _data is None or len(_data) == 0:
@@ -175,6 +205,140 @@ class DatabaseHelper:
 
             return cast(List[str], json.loads(data[0]))
 
+    def set_session_cache(self, encrypted_session: str) -> None:
+        with self.lock:
+            self.cur.execute("INSERT OR REPLACE INTO json_strings VALUES (?, ?)", ("session_cache", json.dumps(encrypted_session)))
+            self.con.commit()
+
+    def get_session_cache(self) -> Optional[str]:
+        with self.lock:
+            data = self.cur.execute("SELECT json FROM json_strings where id=\"session_cache\"").fetchone()
+            if data is None or len(data) == 0 or data[0] is None:
+                return None
+
+            return cast(str, json.loads(data[0]))
+
+    def delete_session_cache(self) -> None:
+        with self.lock:
+            self.cur.execute("DELETE FROM json_strings WHERE id = \"session_cache\"")
+            self.con.commit()
+
+    def set_probe_mode(self, host: str, mode: str) -> None:
+        with self.lock:
+            self._probe_modes[host] = mode
+            self.cur.execute("INSERT OR REPLACE INTO json_strings VALUES (?, ?)", ("probe_modes", json.dumps(self._probe_modes)))
+            self.con.commit()
+
+    def get_probe_mode(self, host: str) -> Optional[str]:
+        return self._probe_modes.get(host, None)
+
+    def get_probe_modes(self) -> Dict[str, str]:
+        with self.lock:
+            data = self.cur.execute("SELECT json FROM json_strings where id=\"probe_modes\"").fetchone()
+            if data is None or len(data) == 0 or data[0] is None:
+                return {}
+
+            return cast(Dict[str, str], json.loads(data[0]))
+
+    def set_course_sync(self, course_id: int, sync_time: int, fingerprint: str, content_hash: str, parse_time: float, containers: List[List[Any]]) -> None:
+        with self.lock:
+            self.cur.execute("INSERT OR REPLACE INTO course_sync VALUES (?, ?, ?, ?, ?, ?)", (course_id, sync_time, fingerprint, content_hash, parse_time, json.dumps(containers)))
+            self.con.commit()
+
+    def touch_course_sync(self, course_id: int, sync_time: int) -> None:
+        with self.lock:
+            self.cur.execute("UPDATE course_sync SET time = ? WHERE course_id = ?", (sync_time, course_id))
+            self.con.commit()
+
+    def get_course_sync(self, course_id: int) -> Optional[Tuple[int, str, str, float, List[List[Any]]]]:
+        """
+        Returns (time of the last sync, fingerprint, hash of the contents, time it took to parse them, containers) of the course.
+        """
+        with self.lock:
+            res = self.cur.execute("SELECT time, fingerprint, content_hash, parse_time, containers FROM course_sync WHERE course_id = ?", (course_id,)).fetchone()
+
+        if res is None:
+            return None
+
+        return res[0], res[1], res[2], res[3], json.loads(res[4])
+
+    def set_course_stats(self, stats: Dict[int, Tuple[float, int]]) -> None:
+        with self.lock:
+            self.cur.executemany("INSERT OR REPLACE INTO course_stats VALUES (?, ?, ?)", [(course_id, latency, num_containers) for course_id, (latency, num_containers) in stats.items()])
+            self.con.commit()
+
+    def get_course_stats(self) -> Dict[int, Tuple[float, int]]:
+        """
+        Returns (expected time to discover the course, number of containers) for every course that was discovered before.
+        """
+        with self.lock:
+            res = self.cur.execute("SELECT * FROM course_stats").fetchall()
+
+        return {course_id: (latency, num_containers) for course_id, latency, num_containers in res}
+
+    def set_partial_download(self, part_path: str, url: str, validator: str) -> None:
+        with self.lock:
+            self.cur.execute("INSERT OR REPLACE INTO partial_downloads VALUES (?, ?, ?)", (part_path, url, validator))
+            self.con.commit()
+
+    def get_partial_download(self, part_path: str) -> Optional[Tuple[str, str]]:
+        """
+        Returns (url, validator for `If-Range`) of a partially downloaded file.
+        """
+        with self.lock:
+            res = self.cur.execute("SELECT url, validator FROM partial_downloads WHERE path = ?", (part_path,)).fetchone()
+
+        if res is None:
+            return None
+
+        return res[0], res[1]
+
+    def delete_partial_download(self, part_path: str) -> None:
+        with self.lock:
+            self.cur.execute("DELETE FROM partial_downloads WHERE path = ?", (part_path,))
+            self.con.commit()
+
+    def set_validators(self, url: str, etag: Optional[str], last_modified: Optional[str]) -> None:
+        now = int(time.time())
+        with self.lock:
+            self.cur.execute("INSERT OR REPLACE INTO validators VALUES (?, ?, ?, ?)", (url, etag, last_modified, now))
+            self.con.commit()
+
+        self._validators[url] = (etag, last_modified, now)
+        self._validated.discard(url)
+
+    def get_validators(self, url: str) -> Optional[Tuple[Optional[str], Optional[str], int]]:
+        """
+        Returns (ETag, Last-Modified, last checked) of the url, if the server sent any of them.
+        """
+        return self._validators.get(url, None)
+
+    def get_all_validators(self) -> Dict[str, Tuple[Optional[str], Optional[str], int]]:
+        with self.lock:
+            res = self.cur.execute("SELECT * FROM validators").fetchall()
+
+        return {url: (etag, last_modified, last_checked) for url, etag, last_modified, last_checked in res}
+
+    def mark_validated(self, url: str) -> None:
+        """
+        Remembers that the url was confirmed to be unchanged. The database is only written by `flush_validated`.
+        """
+        validators = self._validators.get(url, None)
+        if validators is None:
+            return
+
+        self._validators[url] = (validators[0], validators[1], int(time.time()))
+        self._validated.add(url)
+
+    def flush_validated(self) -> None:
+        with self.lock:
+            validated = [(self._validators[url][2], url) for url in self._validated if url in self._validators]
+            self._validated.clear()
+
+            if validated:
+                self.cur.executemany("UPDATE validators SET last_checked = ? WHERE url = ?", validated)
+                self.con.commit()
+
     def get_containers(self) -> Dict[str, Iterable[Any]]:
         with self.lock:
             res = self.cur.execute("SELECT * FROM fileinfo").fetchall()
@@ -252,6 +416,25 @@ class DatabaseHelper:
                 DROP table fileinfo
             """)
 
+            # The validators and the synced courses are only meaningful for files in the file table. The course stats are measured again.
+            self.cur.execute("""
+                DROP table validators
+            """)
+
+            self.cur.execute("""
+                DROP table course_sync
+            """)
+
+            self.cur.execute("""
+                DROP table course_stats
+            """)
+
+            self.cur.execute("""
+                DROP table partial_downloads
+            """)
+
+        self._validators.clear()
+        self._validated.clear()
         self.create_default_tables()
 
     def delete_config(self) -> None:
@@ -1,41 +1,413 @@
 from __future__ import annotations
 
+import asyncio
+import heapq
+import json
 import math
 import os
 import random
 import re
 import time
+from array import array
 from base64 import standard_b64decode
-from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, Future
 from datetime import datetime
+from difflib import SequenceMatcher
 from email.utils import parsedate_to_datetime
+from hashlib import sha256
 from html import unescape
 from itertools import repeat, chain
 from pathlib import Path
-from queue import Queue
-from threading import Thread, Lock, current_thread
-from typing import Optional, Dict, List, Any, cast, Union, Iterable, DefaultDict, Tuple
-from urllib.parse import urlparse
+from queue import Queue, Empty
+from threading import Thread, Lock, RLock, BoundedSemaphore, Event, Condition, current_thread, local
+from typing import Optional, Dict, List, Any, cast, Union, DefaultDict, Tuple, Callable, Set, TypeVar, Generic, BinaryIO, Deque, Sequence
+from urllib.parse import urlparse, urldefrag
 
-from requests import Session, Response
+from requests import Session, Response, PreparedRequest
+from requests.structures import CaseInsensitiveDict
 from requests.adapters import HTTPAdapter
 from requests.exceptions import InvalidSchema
 
-from isisdl.backend.crypt import get_credentials
+from isisdl.backend.crypt import get_credentials, session_encryptor, session_decryptor
 from isisdl.backend.status import StatusOptions, DownloadStatus, RequestHelperStatus
-from isisdl.settings import download_timeout, download_timeout_multiplier, download_static_sleep_time, num_tries_download, status_time, perc_diff_for_checksum, error_text, extern_ignore, \
-    log_file_location, datetime_str, regex_is_isis_document, token_queue_download_refresh_rate, download_chunk_size, download_progress_bar_resolution, bandwidth_download_files_mavg_perc
-from isisdl.settings import enable_multithread, discover_num_threads, is_windows, is_macos, is_testing, testing_bad_urls, url_finder, isis_ignore
+from isisdl.settings import download_timeout, download_timeout_multiplier, num_tries_download, status_time, perc_diff_for_checksum, error_text, \
+    log_file_location, datetime_str, download_progress_bar_resolution, download_chunk_size, download_max_chunk_size, download_chunk_target_time, checksum_algorithm, \
+    enable_inline_checksums
+from isisdl.settings import enable_multithread, discover_num_threads, discover_use_asyncio, discover_async_max_in_flight, is_windows, is_macos, is_testing, testing_bad_urls, url_finder, \
+    enable_session_cache, session_cache_max_age, session_default_pool_size, session_host_pool_sizes, session_host_max_concurrency, session_max_num_pools
+from isisdl.settings import download_backoff_base, download_backoff_max, download_retry_status_codes, download_retry_after_max, circuit_breaker_threshold, circuit_breaker_cooldown
+from isisdl.settings import enable_revalidation, revalidation_interval, enable_cheap_probes, discover_use_ajax_batches, discover_ajax_max_batch_size, discover_ajax_min_num_batches
+from isisdl.settings import enable_incremental_discovery, course_sync_max_age, enable_content_hash_cache, enable_pipelined_download, \
+    enable_structured_link_extraction, enable_latency_scheduling, course_latency_mavg_perc, enable_resumable_downloads, download_part_suffix
+from isisdl.settings import enable_segmented_downloads, segmented_download_min_size, segmented_download_piece_size, segmented_download_max_connections, segmented_download_min_gain, \
+    segmented_download_adapt_interval
+from isisdl.settings import download_controller_initial_num_threads, download_controller_interval, download_controller_min_gain, download_controller_decrease_factor, \
+    download_controller_hold_intervals, enable_download_lanes, download_large_file_size, download_large_lane_share
+from isisdl.settings import enable_preallocation, preallocation_min_size, download_fsync_policy, download_fsync_batch_size
+from isisdl.settings import enable_host_fair_share, host_initial_max_connections, host_max_connections, host_min_sample_size, host_min_gain, host_throughput_mavg_perc
+from isisdl.settings import enable_deduplication, deduplication_min_size, deduplication_min_name_similarity, deduplication_max_candidates, deduplication_sample_size
 from isisdl.utils import User, path, sanitize_name, args, on_kill, database_helper, config, generate_error_message, logger, parse_google_drive_url, get_url_from_gdrive_confirmation, \
-    DownloadThrottler, MediaType, HumanBytes, normalize_url
+    DownloadThrottler, MediaType, HumanBytes, normalize_url, find_links, url_ignore, isis_documents, \
+    make_parent_directories, preallocate, fsync_path, clone_file
 from isisdl.utils import calculate_local_checksum
 from isisdl.version import __version__
 
+T = TypeVar("T")
+
+
+class HostAdapter(HTTPAdapter):
+    """
+    An adapter with its own connection pools and an optional limit on the number of requests that are started at once.
+
+    It also counts the requests and newly opened connections per host. Every new connection costs a TLS handshake.
+    The limit only covers the time until the headers are received: Streamed bodies are read after the request has returned and are *not* limited.
+    The number of connections kept alive for a host is bounded by `pool_maxsize` instead.
+    """
+
+    def __init__(self, pool_maxsize: int, max_request_starts: Optional[int] = None):
+        self.pool_maxsize = pool_maxsize
+        self.start_limiter = BoundedSemaphore(max_request_starts) if max_request_starts else None
+        self.num_evicted: DefaultDict[str, List[int]] = defaultdict(lambda: [0, 0])
+        super().__init__(pool_connections=session_max_num_pools, pool_maxsize=pool_maxsize, pool_block=False)
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        super().init_poolmanager(*args, **kwargs)  # type: ignore[no-untyped-call]
+
+        # Don't lose the counters of pools that are thrown out of the pool manager.
+        dispose = self.poolmanager.pools.dispose_func
+
+        def record_and_dispose(pool: Any) -> None:
+            self.num_evicted[pool.host][0] += pool.num_requests
+            self.num_evicted[pool.host][1] += pool.num_connections
+            dispose(pool)
+
+        self.poolmanager.pools.dispose_func = record_and_dispose
+
+    def send(self, request: PreparedRequest, *args: Any, **kwargs: Any) -> Response:
+        if self.start_limiter is None:
+            return super().send(request, *args, **kwargs)
+
+        with self.start_limiter:
+            return super().send(request, *args, **kwargs)
+
+    def connection_stats(self) -> Dict[str, Tuple[int, int]]:
+        """
+        Returns a mapping of host → (number of requests, number of new connections)
+        """
+        stats = {host: (num_requests, num_connections) for host, (num_requests, num_connections) in self.num_evicted.items()}
+        for key in self.poolmanager.pools.keys():
+            pool = self.poolmanager.pools[key]
+            num_requests, num_connections = stats.get(pool.host, (0, 0))
+            stats[pool.host] = (num_requests + pool.num_requests, num_connections + pool.num_connections)
+
+        return stats
+
+
+class CircuitBreaker:
+    """
+    Tracks the consecutive failures of a single host.
+
+    After `circuit_breaker_threshold` failures in a row the breaker opens and requests are refused.
+    Once `circuit_breaker_cooldown` passed, a single request is let through (half-open): If it succeeds the breaker closes, otherwise it opens again.
+
+    Connection errors always count as a failure. An error response only counts once per url: A single dead url that keeps answering with an error
+    says nothing about the host, and should end up as a bad url instead of taking the whole host down.
+    """
+    failures: int
+    failed_urls: Set[str]
+    opened_at: Optional[float]
+    probing: bool
+
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self) -> None:
+        self.failures = 0
+        self.failed_urls = set()
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+
+        if self.probing or time.monotonic() - self.opened_at < circuit_breaker_cooldown:
+            return False
+
+        self.probing = True
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.failed_urls.clear()
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self, url: str, is_connection_error: bool) -> None:
+        if not is_connection_error:
+            if url in self.failed_urls and not self.probing:
+                return
+
+            self.failed_urls.add(url)
+
+        self.failures += 1
+        if self.probing or self.failures >= circuit_breaker_threshold:
+            self.opened_at = time.monotonic()
+            self.probing = False
+
+
+class RetryPolicy:
+    """
+    Retries failed requests with an exponential backoff and jitter. Responses with a status code in `download_retry_status_codes` are retried as well.
+    Every host has its own `CircuitBreaker`, so hosts that are down fail fast instead of blocking a thread for every single url.
+    """
+    breakers: Dict[str, CircuitBreaker]
+    num_retries: int
+    num_fast_fails: int
+    time_in_retries: float
+    lock: Lock
+
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self) -> None:
+        self.breakers = defaultdict(CircuitBreaker)
+        self.num_retries = 0
+        self.num_fast_fails = 0
+        self.time_in_retries = 0
+        self.lock = Lock()
+
+    def _breaker(self, url: str) -> CircuitBreaker:
+        with self.lock:
+            return self.breakers[urlparse(url).hostname or ""]
+
+    def is_open(self, url: str) -> bool:
+        return self._breaker(url).is_open
+
+    @staticmethod
+    def backoff(i: int) -> float:
+        return random.uniform(0, min(download_backoff_max, download_backoff_base * 2 ** i))
+
+    @staticmethod
+    def retry_after(response: Response) -> Optional[float]:
+        value = response.headers.get("Retry-After")
+        if value is None:
+            return None
+
+        # The header is either a number of seconds or a http-date.
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+
+        return min(max(delay, 0), download_retry_after_max)
+
+    def request(self, func: Callable[..., Response], url: str, timeout: float, *args: Any, **kwargs: Any) -> Optional[Response]:
+        breaker = self._breaker(url)
+
+        for i in range(num_tries_download):
+            with self.lock:
+                if not breaker.allow():
+                    self.num_fast_fails += 1
+                    return None
+
+            try:
+                response: Optional[Response] = func(url, *args, timeout=timeout + download_timeout_multiplier ** (0.5 * i), **kwargs)
+            except Exception:
+                response = None
+
+            with self.lock:
+                if response is not None and response.status_code not in download_retry_status_codes:
+                    breaker.record_success()
+                    return response
+
+                breaker.record_failure(url, response is None)
+
+            if i == num_tries_download - 1:
+                return response
+
+            delay = None
+            if response is not None:
+                delay = self.retry_after(response)
+                response.close()
+
+            if delay is None:
+                delay = self.backoff(i)
+
+            with self.lock:
+                self.num_retries += 1
+                self.time_in_retries += delay
+
+            time.sleep(delay)
+
+        return None
+
+    def report(self) -> List[str]:
+        with self.lock:
+            open_hosts = sorted(host for host, breaker in self.breakers.items() if breaker.is_open)
+            report = [f"Retries: {self.num_retries} retries, {self.time_in_retries:.1f}s spent waiting, {self.num_fast_fails} requests failed fast"]
+
+        if open_hosts:
+            report.append(f"    Hosts considered down: {', '.join(open_hosts)}")
+
+        return report
+
+
+class SingleFlight(Generic[T]):
+    """
+    Concurrent calls with the same key share a single call of the function.
+    The results are kept until `clear` is called, so later calls with the same key are answered as well.
+    """
+    calls: Dict[str, Tuple[Event, List[T]]]
+    num_calls: int
+    num_saved: int
+    lock: Lock
+
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self) -> None:
+        self.calls = {}
+        self.num_calls = 0
+        self.num_saved = 0
+        self.lock = Lock()
+
+    def do(self, key: str, func: Callable[..., T], *args: Any) -> T:
+        with self.lock:
+            call = self.calls.get(key)
+            is_leader = call is None
+            if call is None:
+                call = self.calls[key] = (Event(), [])
+                self.num_calls += 1
+            else:
+                self.num_saved += 1
+
+        event, result = call
+        if is_leader:
+            try:
+                result.append(func(*args))
+            finally:
+                event.set()
+
+            return result[0]
+
+        event.wait()
+        if not result:
+            # The leader has failed. Don't share the exception, try it on our own.
+            with self.lock:
+                self.num_saved -= 1
+
+            return func(*args)
+
+        return result[0]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.calls.clear()
+
+    @staticmethod
+    def url_key(url: str) -> str:
+        """
+        Urls that only differ in their fragment or a `?forcedownload=1` fetch the same file and share a key.
+        """
+        return normalize_url(urldefrag(url).url)
+
+
+class Probe:
+    """
+    The part of a response that is needed to build a `MediaContainer`. In contrast to the response it does not depend on the course and can be shared.
+    """
+    ok: bool
+    status_code: int
+    headers: CaseInsensitiveDict[str]
+
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self, ok: bool, status_code: int, headers: CaseInsensitiveDict[str]) -> None:
+        self.ok = ok
+        self.status_code = status_code
+        self.headers = headers
+
+    # From cheap to expensive
+    modes = ("head", "range", "get")
+
+    @classmethod
+    def request(cls, session: SessionWithKey, url: str, headers: Optional[Dict[str, str]] = None) -> Optional[Probe]:
+        """
+        Tries the cheapest request first. If the host does not answer it properly the next one is tried and the host is remembered.
+        """
+        host = urlparse(url).hostname or ""
+        if enable_cheap_probes:
+            modes = cls.modes[cls.modes.index(database_helper.get_probe_mode(host) or cls.modes[0]):]
+        else:
+            modes = cls.modes[-1:]
+
+        for i, mode in enumerate(modes):
+            probe = cls._request(session, url, mode, headers)
+            if probe is None:
+                # The host is not reachable. Trying a different request won't help.
+                return None
+
+            if probe.answers(mode):
+                if i != 0 and (probe.ok or probe.status_code == 304):
+                    database_helper.set_probe_mode(host, mode)
+
+                return probe
+
+        return None
+
+    @classmethod
+    def _request(cls, session: SessionWithKey, url: str, mode: str, headers: Optional[Dict[str, str]]) -> Optional[Probe]:
+        params = {"token": session.token}
+        if mode == "head":
+            con = session.head_(url, params=params, headers=headers, allow_redirects=True)
+        elif mode == "range":
+            con = session.get_(url, params=params, headers={**(headers or {}), "Range": "bytes=0-0"}, stream=True)
+        else:
+            con = session.get_(url, params=params, headers=headers, stream=True)
+
+        if con is None:
+            return None
+
+        con.close()
+        if con.status_code != 206:
+            return cls(con.ok, con.status_code, con.headers)
+
+        # The total size is in the `Content-Range: bytes 0-0/1234` header. Pretend it was the whole file.
+        total = con.headers.get("Content-Range", "").rpartition("/")[2]
+        if not total.isdigit():
+            return cls(False, con.status_code, con.headers)
+
+        full_headers = CaseInsensitiveDict(con.headers)
+        full_headers["Content-Length"] = total
+        del full_headers["Content-Range"]
+
+        return cls(True, 200, full_headers)
+
+    def answers(self, mode: str) -> bool:
+        """
+        Checks if the probe is a sufficient answer. Responses that are definite for every request are accepted right away.
+        """
+        if mode == "get" or self.status_code in {304, 404, 410}:
+            return True
+
+        if mode == "range":
+            return self.ok
+
+        return self.ok and "Content-Length" in self.headers
+
 
 class SessionWithKey(Session):
     key: str
     token: str
+    retry_policy: RetryPolicy
+    probes: SingleFlight[Optional[Probe]]
+    drive_urls: SingleFlight[Optional[str]]
 
     __slots__ = tuple(__annotations__)
 
@@ -45,15 +417,21 @@ class SessionWithKey(Session):
         super().__init__()
         self.key = key
         self.token = token
+        self.retry_policy = RetryPolicy()
+        self.probes = SingleFlight()
+        self.drive_urls = SingleFlight()
+        self.headers.update({"User-Agent": "isisdl (Python Requests)"})
 
         # Increase the number of recycled connections (Copied from https://stackoverflow.com/a/18845952/18680554)
-        self.mount("https://", HTTPAdapter(pool_maxsize=discover_num_threads // 2, pool_block=False))
+        # Hosts with their own settings get their own adapter, so they don't compete with the hundreds of external hosts.
+        self.mount("https://", HostAdapter(session_default_pool_size))
+        for host in set(session_host_pool_sizes) | set(session_host_max_concurrency):
+            self.mount(f"https://{host}/", HostAdapter(session_host_pool_sizes.get(host, session_default_pool_size), session_host_max_concurrency.get(host, None)))
 
     @classmethod
     def from_scratch(cls, user: User) -> Optional[SessionWithKey]:
         try:
             s = cls("", "")
-            s.headers.update({"User-Agent": "isisdl (Python Requests)"})
 
             s.get_("https://isis.tu-berlin.de/auth/shibboleth/index.php?")
             s.post_("https://shibboleth.tubit.tu-berlin.de/idp/profile/SAML2/Redirect/SSO?execution=e1s1",
@@ -126,31 +504,81 @@ class SessionWithKey(Session):
         except Exception as ex:
             generate_error_message(ex)
 
-    @staticmethod
-    def _timeouter(func: Any, url: str, *args: Iterable[Any], **kwargs: Dict[Any, Any]) -> Any:
+    @classmethod
+    def from_cache(cls, user: User) -> Optional[SessionWithKey]:
+        """
+        Restores the session of the last login. The session is *not* validated, this is up to the caller.
+        """
+        if not enable_session_cache:
+            return None
+
+        encrypted = database_helper.get_session_cache()
+        if encrypted is None:
+            return None
+
+        decrypted = session_decryptor(user, encrypted)
+        if decrypted is None:
+            return None
+
+        try:
+            info = json.loads(decrypted)
+            if info["username"] != user.username or time.time() - info["time"] > session_cache_max_age:
+                return None
+
+            s = cls(info["key"], info["token"])
+            for cookie in info["cookies"]:
+                s.cookies.set(**cookie)  # type: ignore[no-untyped-call]
+
+            return s
+
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def save_to_cache(self, user: User) -> None:
+        if not enable_session_cache:
+            return
+
+        cookies = [{"name": c.name, "value": c.value, "domain": c.domain, "path": c.path, "secure": c.secure, "expires": c.expires} for c in self.cookies]
+        info = {"username": user.username, "time": int(time.time()), "key": self.key, "token": self.token, "cookies": cookies}
+
+        database_helper.set_session_cache(session_encryptor(user, json.dumps(info)))
+
+    def _timeouter(self, func: Any, url: str, *args: Any, **kwargs: Any) -> Optional[Response]:
         if "tubcloud.tu-berlin.de" in url:
             # The tubcloud is *really* slow
             _download_timeout = 20
         else:
             _download_timeout = download_timeout
 
-        i = 0
-        while i < num_tries_download:
-            try:
-                return func(url, *args, timeout=_download_timeout + download_timeout_multiplier ** (0.5 * i), **kwargs)
-
-            except Exception:
-                time.sleep(download_static_sleep_time)
-                i += 1
+        return self.retry_policy.request(func, url, _download_timeout, *args, **kwargs)
 
     def get_(self, url: str, *args: Any, **kwargs: Any) -> Optional[Response]:
-        return cast(Optional[Response], self._timeouter(super().get, url, *args, **kwargs))
+        return self._timeouter(super().get, url, *args, **kwargs)
 
     def post_(self, url: str, *args: Any, **kwargs: Any) -> Optional[Response]:
-        return cast(Optional[Response], self._timeouter(super().post, url, *args, **kwargs))
+        return self._timeouter(super().post, url, *args, **kwargs)
 
     def head_(self, url: str, *args: Any, **kwargs: Any) -> Optional[Response]:
-        return cast(Optional[Response], self._timeouter(super().head, url, *args, **kwargs))
+        return self._timeouter(super().head, url, *args, **kwargs)
+
+    def pool_size(self, url: str) -> int:
+        """
+        The number of connections kept alive for the host of `url`. More concurrent requests to it open connections that are thrown away afterwards.
+        """
+        adapter = self.get_adapter(url)
+        return adapter.pool_maxsize if isinstance(adapter, HostAdapter) else session_default_pool_size
+
+    def connection_stats(self) -> Dict[str, Tuple[int, int]]:
+        stats: Dict[str, Tuple[int, int]] = {}
+        for adapter in self.adapters.values():
+            if not isinstance(adapter, HostAdapter):
+                continue
+
+            for host, (num_requests, num_connections) in adapter.connection_stats().items():
+                prev_requests, prev_connections = stats.get(host, (0, 0))
+                stats[host] = (prev_requests + num_requests, prev_connections + num_connections)
+
+        return stats
 
     def __str__(self) -> str:
         return "~Session~"
@@ -166,12 +594,14 @@ class PreMediaContainer:
     size: Optional[int]
     course: Course
     media_type: MediaType
-    is_cached: bool
+    _is_cached: Optional[bool]
+    relative_location: Optional[str]
     parent_path: Path
 
     __slots__ = tuple(__annotations__)
 
     def __init__(self, url: str, course: Course, media_type: MediaType, name: Optional[str] = None, relative_location: Optional[str] = None, size: Optional[int] = None, time: Optional[int] = None):
+        self.relative_location = relative_location
         relative_location = (relative_location or media_type.dir_name).strip("/")
         if config.make_subdirs is False:
             relative_location = ""
@@ -182,9 +612,18 @@ class PreMediaContainer:
         self.size = size
         self.course = course
         self.media_type = media_type
-        self.is_cached = not (database_helper.know_url(url, course.course_id) is True)
+        self._is_cached = None
+
+        # The directory is only created once a file is written to it (see `CourseDownloader.prepare_files`).
         self.parent_path = course.path(sanitize_name(relative_location, True))
-        self.parent_path.mkdir(exist_ok=True)
+
+    def to_json(self) -> List[Any]:
+        return [self.url, self.media_type.value, self._name, self.relative_location, self.size, self.time]
+
+    @classmethod
+    def from_json(cls, info: List[Any], course: Course) -> PreMediaContainer:
+        url, media_type, name, relative_location, size, time = info
+        return cls(url, course, MediaType(media_type), name, relative_location, size, time)
 
     def __str__(self) -> str:
         return f"{self._name}: {self.course}"
@@ -196,63 +635,334 @@ class PreMediaContainer:
     def is_ready(self) -> bool:
         return self._name is not None and self.time is not None and self.size is not None
 
+    @property
+    def is_cached(self) -> bool:
+        if self._is_cached is None:
+            self._is_cached = database_helper.know_url(self.url, self.course.course_id) is not True
+
+        return self._is_cached
+
+    @is_cached.setter
+    def is_cached(self, value: bool) -> None:
+        self._is_cached = value
+
+
+class ContainerTable:
+    """
+    Stores the fields of every `MediaContainer` column-wise. A `MediaContainer` is only a view of a row.
+
+    Numbers are kept in arrays, directories and hosts are interned. Strings that are mostly equal to another field
+    (the download url to the url, the file name to the name) are only stored if they differ.
+
+    Once the last view of a row is gone, the row is freed and reused by the next container.
+    """
+    names: List[str]
+    urls: List[str]
+    download_urls: List[Optional[str]]
+    directories: array[int]
+    file_names: List[Optional[str]]
+    checksums: List[Optional[str]]
+    courses: List[Course]
+    hosts: array[int]
+    times: array[int]
+    sizes: array[int]
+    current_sizes: array[int]
+    media_types: array[int]
+    states: array[int]
+    links: Dict[int, List[MediaContainer]]
+    free_rows: Deque[int]
+
+    directory_values: List[Path]
+    directory_index: Dict[str, int]
+    host_values: List[str]
+    host_index: Dict[str, int]
+    lock: RLock
+
+    __slots__ = tuple(__annotations__)
+
+    # Bits of `states`
+    stop = 1
+    done = 2
+    newly_downloaded = 4
+    newly_discovered = 8
+
+    # `current_sizes` can't hold None
+    no_size = -1
+
+    def __init__(self) -> None:
+        self.names, self.urls, self.download_urls, self.file_names, self.checksums, self.courses = [], [], [], [], [], []
+        self.directories, self.hosts = array("I"), array("I")
+        self.times, self.sizes, self.current_sizes = array("q"), array("q"), array("q")
+        self.media_types, self.states = array("b"), array("B")
+        self.links = {}
+        self.free_rows = deque()
+
+        self.directory_values, self.directory_index = [], {}
+        self.host_values, self.host_index = [], {}
+        self.lock = RLock()
+
+    def __len__(self) -> int:
+        return len(self.urls) - len(self.free_rows)
+
+    def intern_directory(self, directory: str) -> int:
+        if (index := self.directory_index.get(directory)) is None:
+            index = self.directory_index[directory] = len(self.directory_values)
+            self.directory_values.append(Path(directory))
+
+        return index
+
+    def intern_host(self, url: str) -> int:
+        # The url is only parsed for every new netloc.
+        netloc = url.partition("://")[2].partition("/")[0]
+        if (index := self.host_index.get(netloc)) is None:
+            index = self.host_index[netloc] = len(self.host_values)
+            self.host_values.append(urlparse(url).hostname or "")
+
+        return index
+
+    def add(self, _name: str, url: str, download_url: str, path: Path, time: int, course: Course, media_type: MediaType, size: int, checksum: Optional[str], state: int) -> int:
+        directory, file_name = os.path.split(path)
+        with self.lock:
+            if not self.free_rows:
+                row = len(self.urls)
+
+                self.names.append(_name)
+                self.urls.append(url)
+                self.download_urls.append(None if download_url == url else download_url)
+                self.directories.append(self.intern_directory(directory))
+                self.file_names.append(None if file_name == _name else file_name)
+                self.checksums.append(checksum)
+                self.courses.append(course)
+                self.hosts.append(self.intern_host(url))
+                self.times.append(time)
+                self.sizes.append(size)
+                self.current_sizes.append(self.no_size)
+                self.media_types.append(media_type.value)
+                self.states.append(state)
+
+                return row
+
+            row = self.free_rows.popleft()
+            self.names[row] = _name
+            self.urls[row] = url
+            self.download_urls[row] = None if download_url == url else download_url
+            self.directories[row] = self.intern_directory(directory)
+            self.file_names[row] = None if file_name == _name else file_name
+            self.checksums[row] = checksum
+            self.courses[row] = course
+            self.hosts[row] = self.intern_host(url)
+            self.times[row] = time
+            self.sizes[row] = size
+            self.current_sizes[row] = self.no_size
+            self.media_types[row] = media_type.value
+            self.states[row] = state
+
+        return row
+
+    def free(self, row: int) -> None:
+        # Called from `__del__`, which may run in the middle of `add` on the same thread → the lock is reentrant.
+        # The strings are dropped, such that they can be collected.
+        with self.lock:
+            self.links.pop(row, None)
+            self.names[row], self.urls[row], self.download_urls[row], self.file_names[row], self.checksums[row] = "", "", None, None, None
+            self.free_rows.append(row)
+
+    def set_path(self, row: int, path: Path) -> None:
+        directory, file_name = os.path.split(path)
+        with self.lock:
+            self.directories[row] = self.intern_directory(directory)
+
+        self.file_names[row] = None if file_name == self.names[row] else file_name
+
+    def set_state(self, row: int, bit: int, value: bool) -> None:
+        with self.lock:
+            if value:
+                self.states[row] |= bit
+            else:
+                self.states[row] &= ~bit
+
 
 class MediaContainer:
-    _name: str
-    url: str
-    download_url: str
-    path: Path
-    time: int
-    course: Course
-    media_type: MediaType
-    size: int
-    _links: List[MediaContainer]
-    checksum: Optional[str]
-    current_size: Optional[int]
-    _stop: bool
-    _done: bool
-    _newly_downloaded: bool
-    _newly_discovered: bool
+    """
+    A view of a row of `MediaContainer.table`. All fields are read from and written to the table.
+    """
+    _row: int
 
     __slots__ = tuple(__annotations__)
 
+    table = ContainerTable()
+
+    # The fields that make up the identity of a container (see `__eq__`)
+    _compared_fields = ("_name", "url", "download_url", "path", "time", "course", "media_type", "size", "checksum", "_stop")
+
+    # Every thread reads into its own buffer, which is reused for all of its downloads.
+    _buffers = local()
+
     def __init__(self, _name: str, url: str, download_url: str, path: Path, time: int, course: Course, media_type: MediaType, size: int,
                  checksum: Optional[str] = None, _links: Optional[List[MediaContainer]] = None,
                  _newly_downloaded: bool = False, _newly_discovered: bool = False) -> None:
-        self._name = _name
-        self.url = url
-        self.download_url = download_url
-        self.path = path
-        self.time = time
-        self.course = course
-        self.media_type = media_type
-        self.size = size
-        self.checksum = checksum
-        self.current_size = None
-        self._stop = False
-        self._links = _links or []
-        self._done = False
-        self._newly_downloaded = _newly_downloaded
-        self._newly_discovered = _newly_discovered
+        state = (ContainerTable.newly_downloaded if _newly_downloaded else 0) | (ContainerTable.newly_discovered if _newly_discovered else 0)
+        self._row = self.table.add(_name, url, download_url, path, time, course, media_type, size, checksum, state)
 
-    @classmethod
-    def from_dump(cls, url: str, course: Course) -> Union[bool, MediaContainer]:
+        if _links:
+            self.table.links[self._row] = _links
+
+    def __del__(self) -> None:
+        self.table.free(self._row)
+
+    @property
+    def _name(self) -> str:
+        return self.table.names[self._row]
+
+    @_name.setter
+    def _name(self, value: str) -> None:
+        self.table.names[self._row] = value
+
+    @property
+    def url(self) -> str:
+        return self.table.urls[self._row]
+
+    @url.setter
+    def url(self, value: str) -> None:
+        self.table.urls[self._row] = value
+
+    @property
+    def download_url(self) -> str:
+        return self.table.download_urls[self._row] or self.table.urls[self._row]
+
+    @download_url.setter
+    def download_url(self, value: str) -> None:
+        self.table.download_urls[self._row] = None if value == self.table.urls[self._row] else value
+
+    @property
+    def path(self) -> Path:
+        # Rebuilt on every access: a `Path` per container would cost more memory than the rest of the row.
+        return self.table.directory_values[self.table.directories[self._row]].joinpath(self.table.file_names[self._row] or self.table.names[self._row])
+
+    @path.setter
+    def path(self, value: Path) -> None:
+        self.table.set_path(self._row, value)
+
+    @property
+    def host(self) -> str:
+        return self.table.host_values[self.table.hosts[self._row]]
+
+    @property
+    def time(self) -> int:
+        return self.table.times[self._row]
+
+    @time.setter
+    def time(self, value: int) -> None:
+        self.table.times[self._row] = value
+
+    @property
+    def course(self) -> Course:
+        return self.table.courses[self._row]
+
+    @course.setter
+    def course(self, value: Course) -> None:
+        self.table.courses[self._row] = value
+
+    @property
+    def media_type(self) -> MediaType:
+        return MediaType(self.table.media_types[self._row])
+
+    @media_type.setter
+    def media_type(self, value: MediaType) -> None:
+        self.table.media_types[self._row] = value.value
+
+    @property
+    def size(self) -> int:
+        return self.table.sizes[self._row]
+
+    @size.setter
+    def size(self, value: int) -> None:
+        self.table.sizes[self._row] = value
+
+    @property
+    def checksum(self) -> Optional[str]:
+        return self.table.checksums[self._row]
+
+    @checksum.setter
+    def checksum(self, value: Optional[str]) -> None:
+        self.table.checksums[self._row] = value
+
+    @property
+    def current_size(self) -> Optional[int]:
+        current_size = self.table.current_sizes[self._row]
+        return None if current_size == ContainerTable.no_size else current_size
+
+    @current_size.setter
+    def current_size(self, value: Optional[int]) -> None:
+        self.table.current_sizes[self._row] = ContainerTable.no_size if value is None else value
+
+    @property
+    def _links(self) -> Sequence[MediaContainer]:
         """
-        The `bool` return value indicates if the container should be downloaded.
+        Read only, most containers have no links. Use `add_link` to add one.
+        """
+        return self.table.links.get(self._row, ())
+
+    def add_link(self, other: MediaContainer) -> None:
+        self.table.links.setdefault(self._row, []).append(other)
+
+    @property
+    def _stop(self) -> bool:
+        return bool(self.table.states[self._row] & ContainerTable.stop)
+
+    @_stop.setter
+    def _stop(self, value: bool) -> None:
+        self.table.set_state(self._row, ContainerTable.stop, value)
+
+    @property
+    def _done(self) -> bool:
+        return bool(self.table.states[self._row] & ContainerTable.done)
+
+    @_done.setter
+    def _done(self, value: bool) -> None:
+        self.table.set_state(self._row, ContainerTable.done, value)
+
+    @property
+    def _newly_downloaded(self) -> bool:
+        return bool(self.table.states[self._row] & ContainerTable.newly_downloaded)
+
+    @_newly_downloaded.setter
+    def _newly_downloaded(self, value: bool) -> None:
+        self.table.set_state(self._row, ContainerTable.newly_downloaded, value)
+
+    @property
+    def _newly_discovered(self) -> bool:
+        return bool(self.table.states[self._row] & ContainerTable.newly_discovered)
+
+    @_newly_discovered.setter
+    def _newly_discovered(self, value: bool) -> None:
+        self.table.set_state(self._row, ContainerTable.newly_discovered, value)
+
+    @staticmethod
+    def dumped_info(url: str, course: Course) -> Union[bool, Tuple[Any, ...]]:
+        """
+        The row of the database without building a container from it. The `bool` return value indicates if the container should be downloaded.
         """
         info = database_helper.know_url(url, course.course_id)
         if isinstance(info, bool):
             return info
 
-        container = cls(*info)
-        container.media_type = MediaType(container.media_type)
-        container.path = Path(container.path)
-
-        course_id: int = container.course  # type: ignore
-        if course_id not in RequestHelper.course_id_mapping:
+        info = tuple(info)
+        if info[5] not in RequestHelper.course_id_mapping:
             return True
 
-        container.course = RequestHelper.course_id_mapping[course_id]
+        return info
+
+    @classmethod
+    def from_dump(cls, url: str, course: Course) -> Union[bool, MediaContainer]:
+        """
+        The `bool` return value indicates if the container should be downloaded.
+        """
+        info = cls.dumped_info(url, course)
+        if isinstance(info, bool):
+            return info
+
+        _name, _url, download_url, location, time, course_id, media_type, size, checksum = info
 
         # if is_testing:
         #     if container.media_type == MediaType.corrupted:
@@ -260,25 +970,31 @@ class MediaContainer:
         #     else:
         #         assert container.size != 0 and container.size != -1
 
-        return container
+        return cls(_name, _url, download_url, Path(location), time, RequestHelper.course_id_mapping[course_id], MediaType(media_type), size, checksum)
 
     @classmethod
     def from_pre_container(cls, container: PreMediaContainer, session: SessionWithKey, status: Optional[RequestHelperStatus] = None) -> Optional[MediaContainer]:
-        con: Optional[Response] = None
         try:
             if is_testing and container.url in testing_bad_urls:
                 return None
 
             maybe_container = MediaContainer.from_dump(container.url, container.course)
+            revalidated: Optional[Probe] = None
+            download_url = None
+
             if isinstance(maybe_container, MediaContainer):
-                return maybe_container
+                revalidated = maybe_container.revalidate(session)
+                if revalidated is None:
+                    return maybe_container
+
+                # The file has changed → Use the response to update the container.
+                download_url = maybe_container.download_url
 
             elif maybe_container is False:
                 return None
 
             # If there was not enough information to determine name, size and time for the container, get it.
-            download_url = None
-            if "tu-berlin.hosted.exlibrisgroup.com" in container.url:
+            elif "tu-berlin.hosted.exlibrisgroup.com" in container.url:
                 pass
 
             elif "https://drive.google.com/" in container.url:
@@ -287,28 +1003,11 @@ class MediaContainer:
                     database_helper.add_bad_url(container.url)
                     return None
 
-                temp_url = "https://drive.google.com/uc?id={id}".format(id=drive_id)
-
-                try:
-                    con = session.get_(temp_url, stream=True)
-                    if con is None:
-                        raise ValueError
-                except Exception:
+                download_url = session.drive_urls.do(drive_id, cls.resolve_google_drive_url, session, drive_id)
+                if download_url is None:
                     database_helper.add_bad_url(container.url)
                     return None
 
-                if "Content-Disposition" in con.headers:
-                    # This is the file
-                    download_url = temp_url
-                else:
-                    _url = get_url_from_gdrive_confirmation(con.text)
-                    if _url is None:
-                        database_helper.add_bad_url(container.url)
-                        return None
-                    download_url = _url
-
-                con.close()
-
             elif "tubcloud.tu-berlin.de" in container.url:
                 if container.url.endswith("/download"):
                     download_url = container.url
@@ -340,14 +1039,22 @@ class MediaContainer:
             elif 'onlinelibrary.wiley.com' in container.url:
                 pass
 
-            if container.is_ready:
+            if revalidated is None and container.is_ready:
                 assert container._name is not None and container.time is not None and container.size is not None
                 return cls(container._name, container.url, container.url, container.parent_path.joinpath(sanitize_name(container._name, False)),
                            container.time, container.course, container.media_type, container.size, _newly_discovered=True).dump()
 
-            con = session.get_(download_url or container.url, params={"token": session.token}, stream=True)
-            if con is None:
-                database_helper.add_bad_url(container.url)
+            con: Optional[Probe]
+            if revalidated is not None:
+                con = revalidated
+            else:
+                # The same file is often linked in multiple courses. Only probe it once.
+                con = session.probes.do(SingleFlight.url_key(download_url or container.url), Probe.request, session, download_url or container.url)
+
+            if con is None:
+                # If the host is considered down the url was never tried. Don't blacklist it.
+                if not session.retry_policy.is_open(download_url or container.url):
+                    database_helper.add_bad_url(container.url)
                 return None
 
             media_type = container.media_type
@@ -392,16 +1099,74 @@ class MediaContainer:
                 else:
                     assert size != 0 and size != -1
 
+            if media_type != MediaType.corrupted and ("ETag" in con.headers or "Last-Modified" in con.headers):
+                database_helper.set_validators(container.url, con.headers.get("ETag"), con.headers.get("Last-Modified"))
+
             return cls(name, container.url, download_url or container.url, container.parent_path.joinpath(sanitize_name(name, False)), time, container.course, media_type, size, _newly_discovered=True).dump()
 
         finally:
             container.is_cached = True
-            if con is not None:
-                con.close()
 
             if not container.is_ready and status is not None and status.status == StatusOptions.building_cache:
                 status.done()
 
+    @staticmethod
+    def resolve_google_drive_url(session: SessionWithKey, drive_id: str) -> Optional[str]:
+        temp_url = "https://drive.google.com/uc?id={id}".format(id=drive_id)
+
+        try:
+            con = session.get_(temp_url, stream=True)
+            if con is None:
+                return None
+        except Exception:
+            return None
+
+        try:
+            if "Content-Disposition" in con.headers:
+                # This is the file
+                return temp_url
+
+            return get_url_from_gdrive_confirmation(con.text)
+
+        finally:
+            con.close()
+
+    def revalidate(self, session: SessionWithKey) -> Optional[Probe]:
+        """
+        Checks with a conditional request if the file has changed since it was last probed.
+        Returns the probe if it has, `None` if it is unchanged, was checked recently or can't be checked.
+        """
+        if not enable_revalidation or self.media_type == MediaType.corrupted:
+            return None
+
+        validators = database_helper.get_validators(self.url)
+        if validators is None:
+            return None
+
+        etag, last_modified, last_checked = validators
+        if time.time() - last_checked < revalidation_interval:
+            return None
+
+        headers = {}
+        if etag is not None:
+            headers["If-None-Match"] = etag
+        if last_modified is not None:
+            headers["If-Modified-Since"] = last_modified
+
+        con = session.probes.do(f"revalidate {SingleFlight.url_key(self.download_url)}", Probe.request, session, self.download_url, headers)
+        if con is None:
+            return None
+
+        if con.status_code == 304:
+            database_helper.mark_validated(self.url)
+            return None
+
+        if not con.ok:
+            # Don't throw away the information about the file just because the server is having a bad day.
+            return None
+
+        return con
+
     @property
     def should_download(self) -> bool:
         # raise ValueError
@@ -413,10 +1178,11 @@ class MediaContainer:
         else:
             actual_size = self.path.stat().st_size
 
-        maybe_container = MediaContainer.from_dump(self.url, self.course)
+        # Only the stored checksum is needed. Don't build a container for it, this is checked for every file over and over again.
+        info = MediaContainer.dumped_info(self.url, self.course)
 
-        if isinstance(maybe_container, bool):
-            return maybe_container
+        if isinstance(info, bool):
+            return info
 
         if actual_size == 0:
             return True
@@ -424,13 +1190,14 @@ class MediaContainer:
         if self.size == actual_size:
             return False
 
-        if maybe_container.checksum is None:
+        checksum: Optional[str] = info[8]
+        if checksum is None:
             return True
 
         if self.size * (1 - perc_diff_for_checksum) <= actual_size <= self.size * (1 + perc_diff_for_checksum):
             return False
 
-        return calculate_local_checksum(self.path) == maybe_container.checksum
+        return calculate_local_checksum(self.path) == checksum
 
     def hardlink(self, other: MediaContainer) -> None:
         # TODO: Remove
@@ -460,163 +1227,815 @@ class MediaContainer:
         if config.absolute_path_filename:
             return str(self.path)
 
-        return sanitize_name(self._name, False)
+        return sanitize_name(self._name, False)
+
+    def render_progress_bar(self) -> str:
+        if self.size in {0, -1}:
+            percent: float = 0.
+        elif self.current_size is None:
+            percent = 0.
+        else:
+            percent = self.current_size / self.size
+
+        # Sometimes this bug happens… I don't know why and I don't feel like debugging it.
+        if percent > 1:
+            percent = 1.
+
+        progress_chars = int(percent * download_progress_bar_resolution)
+        return "╶" + "█" * progress_chars + " " * (download_progress_bar_resolution - progress_chars) + "╴"
+
+    def render_status(self, course_pad: int = 0, hostname_pad: int = 0, stream: bool = False) -> str:
+        return \
+            f"{'Stream:  ' if stream else ''}{self.render_progress_bar()} " \
+            f"[ {HumanBytes.format_pad(self.current_size)} | {HumanBytes.format_pad(self.size)} ]" \
+            f" - {str(self.course):<{course_pad}}" \
+            f" - {self.host:<{hostname_pad}}" \
+            f" - {self}"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def __hash__(self) -> int:
+        return self.url.__hash__()
+
+    def __eq__(self, other: Any) -> bool:
+        if self.__class__ != other.__class__:
+            return False
+
+        acc = True
+        for attr in self._compared_fields:
+            self_val = getattr(self, attr)
+            other_val = getattr(other, attr)
+
+            acc &= self_val == other_val and type(self_val) == type(other_val)
+
+        return acc
+
+    def __gt__(self, other: MediaContainer) -> bool:
+        return int.__gt__(self.size, other.size)
+
+    def stop(self) -> None:
+        self._stop = True
+
+    @property
+    def part_path(self) -> Path:
+        return self.path.with_name(self.path.name + download_part_suffix)
+
+    @staticmethod
+    def resume_validator(response: Response) -> Optional[str]:
+        """
+        The validator to send with `If-Range`: A strong ETag or the Last-Modified date.
+        Encoded responses can't be resumed, since the ranges refer to the encoded bytes.
+        """
+        if response.headers.get("Content-Encoding", "identity") != "identity":
+            return None
+
+        etag = response.headers.get("ETag")
+        if etag is not None and not etag.startswith("W/"):
+            return etag
+
+        return response.headers.get("Last-Modified")
+
+    @staticmethod
+    def resumes_at(response: Response, offset: int) -> bool:
+        if response.status_code != 206:
+            return False
+
+        content_range = re.match(r"bytes (\d+)-", response.headers.get("Content-Range", ""))
+        return content_range is not None and int(content_range[1]) == offset
+
+    def request_download(self, session: SessionWithKey, offset: int = 0, validator: Optional[str] = None) -> Tuple[Optional[Response], int]:
+        """
+        Requests the file from `offset` on. The server only sends the rest of the file if it did not change since `validator` was received.
+        Returns the response and the offset it starts at: Either `offset` or 0, if the whole file is sent.
+        """
+        params = {"token": session.token}
+        if offset == 0 or validator is None:
+            return session.get_(self.download_url, params=params, stream=True), 0
+
+        response = session.get_(self.download_url, params=params, stream=True, headers={"Range": f"bytes={offset}-", "If-Range": validator})
+        if response is None or self.resumes_at(response, offset):
+            return response, offset
+
+        if response.status_code in {206, 416}:
+            # A range that does not fit → start over
+            response.close()
+            return session.get_(self.download_url, params=params, stream=True), 0
+
+        return response, 0
+
+    def download(self, throttler: DownloadThrottler, session: SessionWithKey, is_stream: bool = False) -> bool:
+        """
+        The bool return value indicates if any downloading took place. Used for the bandwidth calculations.
+        """
+
+        if self._stop or self.media_type == MediaType.corrupted:
+            self._done = True
+            return False
+
+        if self.current_size is not None:
+            if is_testing:
+                assert self._done
+
+            return False
+
+        self.current_size = 0
+
+        if not self.should_download and self.url != 'https://www.eecs.tu-berlin.de/fileadmin/f4/fkIVdokumente/studium/Plagiate/Merkblatt_Plagiate_Fak.IV_05-2020.pdf':
+            self.current_size = self.size
+            self._done = True
+            return False
+
+        # A streamed file is already opened → it can't be replaced by a copy.
+        if enable_deduplication and not is_stream and Deduplicator.copy(self, session):
+            return False
+
+        if is_stream:
+            throttler.start_stream(self.path)
+
+        # When streaming, the file is read while it is written → it has to be written in place.
+        # Otherwise, it is written to the .part file which is moved into place once it is complete.
+        resumable = enable_resumable_downloads and not is_stream
+        target = self.path if is_stream else self.part_path
+
+        offset, validator = 0, None
+        if resumable and (partial := database_helper.get_partial_download(str(target))) is not None and partial[0] == self.download_url and target.exists():
+            offset, validator = target.stat().st_size, partial[1]
+
+        if resumable and enable_segmented_downloads and not is_windows and self.size >= segmented_download_min_size:
+            segmented = SegmentedDownload(self, session, throttler, target).run(offset, validator)
+            if segmented is not None:
+                return self.finish_download(target, keep_part=not segmented)
+
+        download, offset = self.request_download(session, offset, validator)
+
+        if download is None and session.retry_policy.is_open(self.download_url):
+            # The host is considered down → retry on the next run instead of marking the file as corrupted.
+            self.current_size = None
+            self._done = True
+            return False
+
+        if download is None or not download.ok:
+            if download is not None:
+                download.close()
+
+            self.size = 0
+            self.current_size = None
+            self.media_type = MediaType.corrupted
+            self._done = True
+
+            if self.media_type != MediaType.video:
+                # The video server is sometimes unreliable but it _should_ always work. So don't add these url's
+                database_helper.add_bad_url(self.url)
+
+            if target != self.path:
+                target.unlink(missing_ok=True)
+                database_helper.delete_partial_download(str(target))
+
+            with self.path.open("wb") as f:
+                pass
+
+            for link in self._links:
+                if link.should_download:
+                    link.hardlink(self)
+
+            self.dump()
+            return False
+
+        if resumable and offset == 0:
+            # A new download → remember what has to match in order to resume it.
+            validator = self.resume_validator(download)
+            if validator is None:
+                database_helper.delete_partial_download(str(target))
+            else:
+                database_helper.set_partial_download(str(target), self.download_url, validator)
+
+        self.current_size = offset
+        num_reconnects = 0
+
+        # The checksum starts with the size of the file → it can only be computed while downloading if the size is known in advance.
+        # Resumed downloads would have to read the .part file first. They, and every other case, are checksummed after downloading.
+        hasher, expected_size = None, None
+        if enable_inline_checksums and offset == 0 and not download.headers.get("Content-Encoding") and download.headers.get("Content-Length", "").isdigit():
+            expected_size = int(download.headers["Content-Length"])
+            hasher = checksum_algorithm()
+            hasher.update(str(expected_size).encode())
+
+        # Reserve the space for the rest of the file. It would be fragmented when growing with every chunk.
+        # Reading the .part file while downloading, the preallocated zeros would look like content → not while streaming.
+        content_length = download.headers.get("Content-Length", "")
+        preallocate_size = int(content_length) if enable_preallocation and not is_stream and content_length.isdigit() and not download.headers.get("Content-Encoding") else 0
+
+        # The chunks are written unbuffered: They are large enough already.
+        with target.open("r+b" if offset else "wb", buffering=0) as f:
+            f.seek(offset)
+            is_preallocated = preallocate_size >= preallocation_min_size and preallocate(f.fileno(), offset, preallocate_size)
+
+            while True:
+                is_complete = self.write_stream(download, f, throttler, hasher)
+                if is_complete or not resumable or validator is None or num_reconnects == num_tries_download:
+                    break
+
+                # The connection broke off → continue where it stopped, if the server allows it.
+                num_reconnects += 1
+                download.close()
+
+                reconnect, reconnect_offset = self.request_download(session, self.current_size, validator)
+                if reconnect is None or reconnect_offset != self.current_size:
+                    if reconnect is not None:
+                        reconnect.close()
+                    break
+
+                download = reconnect
+
+            if is_preallocated:
+                # Cut off what was not received, such that the size of the .part file is where it is resumed.
+                f.truncate(self.current_size)
+
+            if is_complete and target != self.path:
+                download_sync.before_replace(f.fileno())
+
+        checksum = None
+        if hasher is not None and is_complete and self.current_size == expected_size:
+            checksum = hasher.hexdigest()
+
+        if self.media_type == MediaType.corrupted:
+            with self.path.open("wb"):
+                # Reopen the file such that previous content is ignored.
+                pass
+
+            checksum = None
+
+        if is_stream:
+            throttler.end_stream()
+
+        download.close()
+
+        keep_part = not is_complete and validator is not None
+        if not is_complete and not keep_part:
+            # The download broke off and can't be resumed → never move it into place. It is downloaded again on the next run.
+            if target != self.path:
+                target.unlink(missing_ok=True)
+                database_helper.delete_partial_download(str(target))
+
+            self.current_size = None
+            self._done = True
+            return True
+
+        return self.finish_download(target, keep_part=keep_part, checksum=checksum)
+
+    @classmethod
+    def download_buffer(cls) -> memoryview:
+        view = getattr(cls._buffers, "view", None)
+        if view is None:
+            view = cls._buffers.view = memoryview(bytearray(download_max_chunk_size))
+
+        return cast(memoryview, view)
+
+    @staticmethod
+    def body_file(download: Response) -> Optional[Any]:
+        """
+        The `http.client.HTTPResponse` below `download`, if the body can be read from it directly. It reads straight into the buffer, urllib3 reads every chunk into new `bytes`.
+        urllib3 does not see the end of the body read like this → the connection has to be put back into the pool with `download.raw.release_conn()`.
+        """
+        fp = getattr(download.raw, "_fp", None)
+        if download.headers.get("Content-Encoding", "identity") != "identity" or not hasattr(fp, "readinto"):
+            return None
+
+        return fp
+
+    def write_stream(self, download: Response, f: BinaryIO, throttler: DownloadThrottler, hasher: Optional[Any] = None) -> bool:
+        """
+        Writes the body of `download` to `f` and returns if it was read completely. False is returned when the connection broke off.
+        Every chunk is also fed to `hasher`, if given.
+
+        The body is read into the buffer of the thread, which is reused for every chunk. Encoded bodies are decoded by urllib3, every other one is read without copying (see `body_file`).
+
+        We copy in chunks so the download rate can be limited. Their size adapts to the throughput:
+        A chunk which is read completely within `download_chunk_target_time` doubles the size, one taking twice as long halves it.
+        """
+        view = self.download_buffer()
+        chunk_size = download_chunk_size
+        raw = download.raw
+        raw.decode_content = True
+        fp = self.body_file(download)
+        readinto = raw.readinto if fp is None else fp.readinto
+
+        assert self.current_size is not None
+        current_size = self.current_size
+
+        while True:
+            num_bytes = throttler.get(self.path, chunk_size)
+
+            # A failed read leaves the stream at an unknown position → the connection broke off, the caller resumes the download if it can.
+            try:
+                start = time.perf_counter()
+                num_read = readinto(view[:num_bytes])
+            except Exception:
+                return False
+
+            if not num_read:
+                # No file left. Neither urllib3 nor http.client check if the body was as long as announced.
+                if fp is None:
+                    return not getattr(raw, "length_remaining", None)
+
+                if fp.length:
+                    return False
+
+                raw.release_conn()
+                return True
+
+            f.write(view[:num_read])
+            throttler.record(num_read)
+            if hasher is not None:
+                hasher.update(view[:num_read])
+
+            current_size += num_read
+            self.current_size = current_size
+
+            taken = time.perf_counter() - start
+            if num_read == num_bytes and taken < download_chunk_target_time:
+                chunk_size = min(chunk_size * 2, download_max_chunk_size)
+            elif taken > 2 * download_chunk_target_time:
+                chunk_size = max(chunk_size // 2, download_chunk_size)
+
+    def finish_download(self, target: Path, keep_part: bool, checksum: Optional[str] = None) -> bool:
+        """
+        Moves the downloaded file into place and registers it. Without a `checksum` computed while downloading, the file is read again for it.
+        """
+        if target != self.path:
+            if keep_part:
+                # Keep the .part file. It is resumed on the next run.
+                self._done = True
+                return True
+
+            # Atomic → there never is a partially written file at the path.
+            os.replace(target, self.path)
+            database_helper.delete_partial_download(str(target))
+            download_sync.after_replace(self.path)
+
+        # Only register the file after successfully downloading it.
+        if is_testing and self.media_type != MediaType.corrupted:
+            assert self.size * (1 - perc_diff_for_checksum) <= self.path.stat().st_size <= self.size * (1 + perc_diff_for_checksum), self.path
+
+        self.size = self.path.stat().st_size
+        self.checksum = checksum or calculate_local_checksum(self.path)
+        self.dump()
+
+        if enable_deduplication:
+            Deduplicator.add(self)
+
+        # Resolve hard links
+        for link in self._links:
+            if is_testing:
+                assert link.size == self.size
+                assert not link._links
+
+            if link.should_download:
+                link.hardlink(self)
+
+        self._newly_downloaded = True
+        self._done = True
+
+        return True
+
+
+class DownloadSync:
+    """
+    Makes the downloaded files durable according to `download_fsync_policy`:
+      - "none": Left to the operating system.
+      - "file": Every file is synced before it is moved into place, its directory afterwards.
+      - "batch": The files are synced together every `download_fsync_batch_size` files and at the end of the run.
+    """
+    policy: str
+    batch_size: int
+    pending: List[Path]
+    num_synced: int
+    lock: Lock
+
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self, policy: str = download_fsync_policy, batch_size: int = download_fsync_batch_size) -> None:
+        self.policy = policy
+        self.batch_size = batch_size
+        self.pending = []
+        self.num_synced = 0
+        self.lock = Lock()
+
+    def before_replace(self, fd: int) -> None:
+        if self.policy == "file":
+            os.fsync(fd)
+
+    def after_replace(self, file: Path) -> None:
+        if self.policy == "file":
+            fsync_path(file.parent)
+            with self.lock:
+                self.num_synced += 1
+
+        elif self.policy == "batch":
+            with self.lock:
+                self.pending.append(file)
+                if len(self.pending) < self.batch_size:
+                    return
+
+            self.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            pending, self.pending = self.pending, []
+
+        for file in chain(pending, {file.parent for file in pending}):
+            fsync_path(file)
+
+        with self.lock:
+            self.num_synced += len(pending)
+
+
+download_sync = DownloadSync()
+
+
+class SegmentedDownload:
+    """
+    Downloads a file over multiple connections. The file is split into pieces, which are requested with `Range` and written at their offset.
+    Every piece is requested with `If-Range`, so all of them are of the same version of the file.
+
+    It starts with a single connection. Every `segmented_download_adapt_interval` s a connection is added, as long as the last one raised
+    the throughput by at least `segmented_download_min_gain`. If the throughput drops by as much, a connection is removed.
+    """
+    container: MediaContainer
+    session: SessionWithKey
+    throttler: DownloadThrottler
+    target: Path
+    validator: str
+    fd: int
+    pieces: Queue[Tuple[int, int]]
+    done_pieces: List[Tuple[int, int]]
+    num_bytes: int
+    num_failures: int
+    num_connections: int
+    target_connections: int
+    lock: Lock
+
+    __slots__ = tuple(__annotations__)
+
+    # Hosts that ignored a range request
+    no_range_hosts: Set[str] = set()
+
+    num_downloads = 0
+    max_connections_used = 0
+
+    def __init__(self, container: MediaContainer, session: SessionWithKey, throttler: DownloadThrottler, target: Path) -> None:
+        self.container = container
+        self.session = session
+        self.throttler = throttler
+        self.target = target
+        self.pieces = Queue()
+        self.done_pieces = []
+        self.num_bytes = 0
+        self.num_failures = 0
+        self.num_connections = 0
+        self.target_connections = 1
+        self.lock = Lock()
+
+    def request_piece(self, start: int, end: int, validator: Optional[str]) -> Optional[Response]:
+        headers = {"Range": f"bytes={start}-{end}"}
+        if validator is not None:
+            headers["If-Range"] = validator
+
+        return self.session.get_(self.container.download_url, params={"token": self.session.token}, stream=True, headers=headers)
+
+    def run(self, offset: int, validator: Optional[str]) -> Optional[bool]:
+        """
+        Returns if the file was downloaded completely. If it was not, the .part file is cut to the received bytes so the next run resumes it.
+        None is returned if the server does not support ranges: The file has to be downloaded with a single stream.
+        """
+        host = urlparse(self.container.download_url).hostname or ""
+        if host in self.no_range_hosts:
+            return None
+
+        first = self.request_piece(offset, offset + segmented_download_piece_size - 1, validator)
+        if first is None:
+            return None
+
+        content_range = re.match(r"bytes (\d+)-(\d+)/(\d+)", first.headers.get("Content-Range", ""))
+        if first.status_code != 206 or content_range is None or int(content_range[1]) != offset:
+            if first.ok and validator is None:
+                # With `If-Range` the whole file is also sent if it changed. Without it, the server just ignored the range.
+                self.no_range_hosts.add(host)
+
+            first.close()
+            return None
+
+        validator = validator or MediaContainer.resume_validator(first)
+        if validator is None:
+            # The pieces could be of different versions of the file.
+            first.close()
+            return None
+
+        self.validator = validator
+        database_helper.set_partial_download(str(self.target), self.container.download_url, validator)
+
+        size = int(content_range[3])
+        first_end = int(content_range[2])
+        for start in range(first_end + 1, size, segmented_download_piece_size):
+            self.pieces.put((start, min(start + segmented_download_piece_size, size) - 1))
+
+        self.fd = os.open(self.target, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0))
+        try:
+            if offset == 0:
+                os.ftruncate(self.fd, 0)
+
+            # Without preallocation the pieces are written into a sparse file.
+            if not (enable_preallocation and preallocate(self.fd, offset, size - offset)):
+                os.ftruncate(self.fd, size)
+
+            self.container.current_size = offset
+            self.drive(offset, first_end, first)
+
+            received = self.received_until(offset)
+            if received >= size:
+                download_sync.before_replace(self.fd)
+            else:
+                os.ftruncate(self.fd, received)
+
+        finally:
+            os.close(self.fd)
+
+        with self.lock:
+            SegmentedDownload.num_downloads += 1
+
+        return received >= size
+
+    def drive(self, offset: int, first_end: int, first: Response) -> None:
+        workers = [Thread(target=self.work, args=(offset, first_end, first), daemon=True)]
+        workers[0].start()
+        self.num_connections = 1
+
+        prev_rate: Optional[float] = None
+        prev_bytes, prev_time = 0, time.perf_counter()
+        while any(worker.is_alive() for worker in workers):
+            time.sleep(segmented_download_adapt_interval)
+
+            now = time.perf_counter()
+            with self.lock:
+                rate = (self.num_bytes - prev_bytes) / (now - prev_time)
+                prev_bytes, prev_time = self.num_bytes, now
+
+                if self.pieces.empty() or self.is_failed:
+                    continue
+
+                if prev_rate is None or rate > prev_rate * (1 + segmented_download_min_gain):
+                    if self.target_connections < segmented_download_max_connections:
+                        self.target_connections += 1
+
+                elif rate < prev_rate * (1 - segmented_download_min_gain) and self.target_connections > 1:
+                    self.target_connections -= 1
+
+                prev_rate = rate
+                num_missing = self.target_connections - self.num_connections
+                self.num_connections += max(num_missing, 0)
+                SegmentedDownload.max_connections_used = max(SegmentedDownload.max_connections_used, self.num_connections)
+
+            for _ in range(num_missing):
+                workers.append(Thread(target=self.work, daemon=True))
+                workers[-1].start()
+
+        for worker in workers:
+            worker.join()
+
+    @property
+    def is_failed(self) -> bool:
+        return self.num_failures >= num_tries_download * segmented_download_max_connections
+
+    def work(self, start: Optional[int] = None, end: Optional[int] = None, response: Optional[Response] = None) -> None:
+        try:
+            while True:
+                if start is None or end is None:
+                    with self.lock:
+                        if self.is_failed or self.num_connections > self.target_connections:
+                            return
+                    try:
+                        start, end = self.pieces.get_nowait()
+                    except Empty:
+                        return
+
+                self.fetch(start, end, response)
+                start, end, response = None, None, None
+
+        finally:
+            with self.lock:
+                self.num_connections -= 1
+
+    def fetch(self, start: int, end: int, response: Optional[Response]) -> None:
+        pos = start
+        try:
+            if response is None:
+                response = self.request_piece(start, end, self.validator)
+                if response is None or not MediaContainer.resumes_at(response, start):
+                    raise ValueError(f"Bad response for the range {start}-{end}")
+
+            view = MediaContainer.download_buffer()
+            response.raw.decode_content = True
+            fp = MediaContainer.body_file(response)
+            readinto = response.raw.readinto if fp is None else fp.readinto
+
+            while pos <= end:
+                num_bytes = self.throttler.get(self.container.path, min(download_max_chunk_size, end - pos + 1))
+                num_read = readinto(view[:num_bytes])
+                if not num_read:
+                    break
+
+                os.pwrite(self.fd, view[:num_read], pos)
+                self.throttler.record(num_read)
+                pos += num_read
+
+                with self.lock:
+                    self.num_bytes += num_read
+                    self.container.current_size = (self.container.current_size or 0) + num_read
+
+            if pos <= end:
+                raise ValueError(f"The range {start}-{end} ended early")
 
-    def render_progress_bar(self) -> str:
-        if self.size in {0, -1}:
-            percent: float = 0.
-        elif self.current_size is None:
-            percent = 0.
-        else:
-            percent = self.current_size / self.size
+            # http.client closes a body once it is read completely → the connection can be reused.
+            if fp is not None and fp.isclosed():
+                response.raw.release_conn()
 
-        # Sometimes this bug happens… I don't know why and I don't feel like debugging it.
-        if percent > 1:
-            percent = 1.
+        except Exception:
+            with self.lock:
+                self.num_failures += 1
 
-        progress_chars = int(percent * download_progress_bar_resolution)
-        return "╶" + "█" * progress_chars + " " * (download_progress_bar_resolution - progress_chars) + "╴"
+            # Retry the rest of the piece
+            self.pieces.put((pos, end))
 
-    def render_status(self, course_pad: int = 0, hostname_pad: int = 0, stream: bool = False) -> str:
-        return \
-            f"{'Stream:  ' if stream else ''}{self.render_progress_bar()} " \
-            f"[ {HumanBytes.format_pad(self.current_size)} | {HumanBytes.format_pad(self.size)} ]" \
-            f" - {str(self.course):<{course_pad}}" \
-            f" - {urlparse(self.url).hostname:<{hostname_pad}}" \
-            f" - {self}"
+        finally:
+            if response is not None:
+                response.close()
 
-    def __repr__(self) -> str:
-        return self.__str__()
+            if pos > start:
+                with self.lock:
+                    self.done_pieces.append((start, pos - 1))
 
-    def __hash__(self) -> int:
-        return self.url.__hash__()
+    def received_until(self, offset: int) -> int:
+        """
+        The number of bytes from the start of the file, that were received without a gap.
+        """
+        received = offset
+        for start, end in sorted(self.done_pieces):
+            if start > received:
+                break
 
-    def __eq__(self, other: Any) -> bool:
-        if self.__class__ != other.__class__:
-            return False
+            received = max(received, end + 1)
 
-        acc = True
-        for attr in self.__slots__:
-            if attr in {"current_size", "_links", "_done", "_newly_downloaded", "_newly_discovered"}:
-                continue
+        return received
 
-            self_val = getattr(self, attr)
-            other_val = getattr(other, attr)
 
-            acc &= self_val == other_val and type(self_val) == type(other_val)
+class Deduplicator:
+    """
+    Finds files which are already downloaded under another url, e.g. the same slides uploaded to two courses, and copies them instead of downloading them again.
+    The copy shares the data copy-on-write, where the file system supports it. A hard link would change both files once the user edits one of them.
 
-        return acc
+    The candidates for a file are the downloaded files of the exact same size whose name is at least `deduplication_min_name_similarity` similar.
+    A candidate is confirmed by requesting the first, the middle and the last `deduplication_sample_size` bytes of the file and comparing them to the ones of the candidate.
+    The candidate also has to match the checksum it was downloaded with: It could have been changed since, where the samples don't look.
+    """
 
-    def __gt__(self, other: MediaContainer) -> bool:
-        return int.__gt__(self.size, other.size)
+    # size → {location: (name, checksum)} of every downloaded file. Built from the database once it is first needed.
+    index: Optional[DefaultDict[int, Dict[str, Tuple[str, str]]]] = None
+    lock = Lock()
 
-    def stop(self) -> None:
-        self._stop = True
+    num_copied = 0
+    num_rejected = 0
+    num_bytes_saved = 0
 
-    def download(self, throttler: DownloadThrottler, session: SessionWithKey, is_stream: bool = False) -> bool:
-        """
-        The bool return value indicates if any downloading took place. Used for the bandwidth calculations.
-        """
+    @classmethod
+    def get_index(cls) -> DefaultDict[int, Dict[str, Tuple[str, str]]]:
+        with cls.lock:
+            if cls.index is None:
+                cls.index = defaultdict(dict)
+                for name, _, _, location, _, _, media_type, size, checksum in list(database_helper._url_container_mapping.values()):
+                    if checksum is not None and media_type != MediaType.corrupted.value and size:
+                        cls.index[size][location] = (name, checksum)
 
-        if self._stop or self.media_type == MediaType.corrupted:
-            self._done = True
-            return False
+            return cls.index
 
-        if self.current_size is not None:
-            if is_testing:
-                assert self._done
+    @classmethod
+    def add(cls, container: MediaContainer) -> None:
+        if container.checksum is None or container.media_type == MediaType.corrupted:
+            return
 
-            return False
+        index = cls.get_index()
+        with cls.lock:
+            index[container.size][str(container.path)] = (container._name, container.checksum)
 
-        self.current_size = 0
+    @classmethod
+    def candidates(cls, container: MediaContainer) -> List[Tuple[Path, str]]:
+        """
+        The candidates as (path, checksum), the most similar name first.
+        """
+        index = cls.get_index()
+        with cls.lock:
+            same_size = list(index.get(container.size, {}).items())
 
-        if not self.should_download and self.url != 'https://www.eecs.tu-berlin.de/fileadmin/f4/fkIVdokumente/studium/Plagiate/Merkblatt_Plagiate_Fak.IV_05-2020.pdf':
-            self.current_size = self.size
-            self._done = True
-            return False
+        name, ranked = container._name.lower(), []
+        for location, (other_name, checksum) in same_size:
+            similarity = SequenceMatcher(None, name, other_name.lower()).ratio()
+            if similarity >= deduplication_min_name_similarity and location != str(container.path):
+                ranked.append((similarity, Path(location), checksum))
 
-        if is_stream:
-            throttler.start_stream(self.path)
+        ranked.sort(key=lambda it: it[0], reverse=True)
 
-        download = session.get_(self.download_url, params={"token": session.token}, stream=True)
+        # The file could have been changed or deleted since it was downloaded.
+        return [(path, checksum) for _, path, checksum in ranked if path.is_file() and path.stat().st_size == container.size]
 
-        if download is None or not download.ok:
-            if download is not None:
-                download.close()
+    @classmethod
+    def matches(cls, container: MediaContainer, session: SessionWithKey, candidate: Path) -> Optional[bool]:
+        """
+        Compares the start, the middle and the end of the file on the server with the ones of the candidate. None is returned if the server does not answer with a range.
+        """
+        num_bytes = min(deduplication_sample_size, container.size)
+        with candidate.open("rb") as f:
+            for start in sorted({0, (container.size - num_bytes) // 2, container.size - num_bytes}):
+                remote = cls.sample(container, session, start, num_bytes)
+                if remote is None:
+                    return None
 
-            self.size = 0
-            self.current_size = None
-            self.media_type = MediaType.corrupted
-            self._done = True
+                f.seek(start)
+                if remote != f.read(num_bytes):
+                    return False
 
-            if self.media_type != MediaType.video:
-                # The video server is sometimes unreliable but it _should_ always work. So don't add these url's
-                database_helper.add_bad_url(self.url)
+        return True
 
-            with self.path.open("wb") as f:
-                pass
+    @staticmethod
+    def sample(container: MediaContainer, session: SessionWithKey, start: int, num_bytes: int) -> Optional[bytes]:
+        """
+        Requests `num_bytes` bytes from `start` on. If the file on the server is not of the expected size, no bytes are returned.
+        """
+        response = session.get_(container.download_url, params={"token": session.token}, stream=True, headers={"Range": f"bytes={start}-{start + num_bytes - 1}"})
+        if response is None:
+            return None
 
-            for link in self._links:
-                if link.should_download:
-                    link.hardlink(self)
+        try:
+            content_range = re.match(r"bytes (\d+)-(\d+)/(\d+)", response.headers.get("Content-Range", ""))
+            if response.status_code != 206 or content_range is None or response.headers.get("Content-Encoding", "identity") != "identity":
+                if response.ok and content_range is None:
+                    SegmentedDownload.no_range_hosts.add(urlparse(container.download_url).hostname or "")
 
-            self.dump()
-            return False
+                return None
 
-        # We copy in chunks so the download rate can be limited. This could also be done with `shutil.copyfileobj(…)`
-        with self.path.open("wb") as f:
-            while True:
-                token = throttler.get(self.path)
+            if int(content_range[1]) != start or int(content_range[3]) != container.size:
+                return b""
 
-                i = 0
-                while i < num_tries_download:
-                    try:
-                        new = download.raw.read(token.num_bytes, decode_content=True)
-                        break
+            return cast(bytes, response.raw.read(num_bytes + 1, decode_content=True))
 
-                    except Exception:
-                        i += 1
-                else:
-                    break
+        except Exception:
+            return None
 
-                if not new:
-                    # No file left
-                    break
+        finally:
+            response.close()
 
-                f.write(new)
-                self.current_size += len(new)
+    @classmethod
+    def copy(cls, container: MediaContainer, session: SessionWithKey) -> bool:
+        """
+        Returns if the container was copied from a file which is already downloaded.
+        """
+        if container.size < deduplication_min_size or urlparse(container.download_url).hostname in SegmentedDownload.no_range_hosts:
+            return False
 
-        if self.media_type == MediaType.corrupted:
-            with self.path.open("wb"):
-                # Reopen the file such that previous content is ignored.
-                pass
+        for candidate, checksum in cls.candidates(container)[:deduplication_max_candidates]:
+            match = cls.matches(container, session, candidate)
+            if match is None:
+                return False
 
-        if is_stream:
-            throttler.end_stream()
+            if not match or calculate_local_checksum(candidate) != checksum:
+                with cls.lock:
+                    cls.num_rejected += 1
 
-        download.close()
+                continue
 
-        # Only register the file after successfully downloading it.
-        if is_testing and self.media_type != MediaType.corrupted:
-            assert self.size * (1 - perc_diff_for_checksum) <= self.path.stat().st_size <= self.size * (1 + perc_diff_for_checksum), self.path
+            # Like a download, the copy is moved into place once it is complete.
+            target = container.part_path
+            try:
+                with candidate.open("rb") as source, target.open("wb", buffering=0) as f:
+                    clone_file(source, f)
+                    download_sync.before_replace(f.fileno())
 
-        self.size = self.path.stat().st_size
-        self.checksum = calculate_local_checksum(self.path)
-        self.dump()
+            except OSError:
+                target.unlink(missing_ok=True)
+                return False
 
-        # Resolve hard links
-        for link in self._links:
-            if is_testing:
-                assert link.size == self.size
-                assert link._links == []
+            with cls.lock:
+                cls.num_copied += 1
+                cls.num_bytes_saved += container.size
 
-            if link.should_download:
-                link.hardlink(self)
+            container.current_size = container.size
+            return container.finish_download(target, keep_part=False, checksum=checksum)
 
-        self._newly_downloaded = True
-        self._done = True
+        return False
 
-        return True
+    @classmethod
+    def report(cls) -> List[str]:
+        return [f"Deduplication: {cls.num_copied} files copied from the same file in another place, saving {HumanBytes.format_str(cls.num_bytes_saved)} "
+                f"({cls.num_rejected} candidates did not match)"]
 
 
 class Course:
@@ -644,27 +2063,23 @@ class Course:
         else:
             name = config.renamed_courses.get(id, "") or _name
 
-        obj = cls(sanitize_name(displayname, True), _name, sanitize_name(name, True), id)
-        obj.make_directories()
-
-        return obj
+        return cls(sanitize_name(displayname, True), _name, sanitize_name(name, True), id)
 
-    def make_directories(self) -> None:
-        from isisdl.backend.config import was_in_configuration
-
-        if was_in_configuration is False and self.ok:
-            os.makedirs(self.path(), exist_ok=True)
+    def download_documents(self, helper: RequestHelper) -> List[PreMediaContainer]:
+        content = self.get_contents(helper)
+        if content is None:
+            return []
 
-            if config.make_subdirs:
-                for item in MediaType.list_dirs():
-                    os.makedirs(self.path(item), exist_ok=True)
+        return self.parse_documents(content)
 
-    def download_documents(self, helper: RequestHelper) -> List[PreMediaContainer]:
+    def get_contents(self, helper: RequestHelper) -> Optional[List[Dict[str, Any]]]:
         content = helper.post_REST("core_course_get_contents", {"courseid": self.course_id})
         if content is None or isinstance(content, dict) and "exception" in content:
-            return []
+            return None
 
-        content = cast(List[Dict[str, Any]], content)
+        return cast(List[Dict[str, Any]], content)
+
+    def parse_documents(self, content: List[Dict[str, Any]]) -> List[PreMediaContainer]:
         all_content: List[PreMediaContainer] = []
         parsed_url_ids = set()
 
@@ -680,9 +2095,7 @@ class Course:
                     continue
 
                 url: str = module["url"]
-                ignore = isis_ignore.match(url)
-
-                if ignore is not None:
+                if url_ignore.match(url) is not None:
                     # Blacklist hit
                     continue
 
@@ -701,7 +2114,7 @@ class Course:
                         if file.get("fileurl") is None:
                             continue
 
-                        if config.follow_links and "type" in file and file["type"] == "url" and extern_ignore.match(file["fileurl"]) is None and isis_ignore.match(file["fileurl"]) is None:
+                        if config.follow_links and "type" in file and file["type"] == "url" and url_ignore.match(file["fileurl"]) is None:
                             all_content.append(PreMediaContainer(file["fileurl"], self, MediaType.extern))
                         else:
                             all_content.append(PreMediaContainer(file["fileurl"], self, MediaType.document, file["filename"], file["filepath"], file["filesize"], file["timemodified"]))
@@ -710,7 +2123,12 @@ class Course:
             return all_content
 
         # Now check all links to find those that were not parsed yet
-        links = {normalize_url(url) for url in url_finder.findall(str(content))} - {item.url for item in all_content} - parsed_url_ids
+        if enable_structured_link_extraction:
+            found_links = find_links(content)
+        else:
+            found_links = set(url_finder.findall(str(content)))
+
+        links = {normalize_url(url) for url in found_links} - {item.url for item in all_content} - parsed_url_ids
         _links = []
         for link in links:
             possible_id = re.findall(r"https://isis\.tu-berlin\.de/.*/view\.php\?id=(\d*).*", link)
@@ -718,8 +2136,8 @@ class Course:
                 continue
 
             parse = urlparse(link)
-            if parse.scheme and parse.netloc and extern_ignore.match(link) is None and isis_ignore.match(link) is None:
-                all_content.append(PreMediaContainer(link, self, MediaType.document if regex_is_isis_document.match(link) is not None else MediaType.extern, None))
+            if parse.scheme and parse.netloc and url_ignore.match(link) is None:
+                all_content.append(PreMediaContainer(link, self, MediaType.document if isis_documents.match(link) is not None else MediaType.extern, None))
                 _links.append(link)
 
         return all_content
@@ -780,6 +2198,10 @@ class RequestHelper:
     _instance_init: bool = False
     _lock = Lock()
 
+    num_unchanged_contents: int = 0
+    parse_time_saved: float = 0
+    course_latencies: Dict[int, Tuple[float, int]] = {}  # The time it took to discover a course and the number of its containers
+
     def __init__(self, user: User, status: Optional[RequestHelperStatus] = None):
         if self._instance_init:
             return
@@ -788,17 +2210,22 @@ class RequestHelper:
             status.set_status(StatusOptions.authenticating)
 
         self.user = user
-        session = SessionWithKey.from_scratch(self.user)
+        if not self.login_from_cache():
+            session = SessionWithKey.from_scratch(self.user)
 
-        if session is None:
-            print(f"I had a problem getting the user {self.user}. You have probably entered the wrong credentials.\nBailing out…")
-            os._exit(1)
+            if session is None:
+                print(f"I had a problem getting the user {self.user}. You have probably entered the wrong credentials.\nBailing out…")
+                os._exit(1)
+
+            self.session = session
+            self._meta_info = cast(Dict[str, str], self.post_REST("core_webservice_get_site_info"))
+
+            if self.has_valid_meta_info():
+                self.session.save_to_cache(self.user)
 
         if status is not None:
             status.set_status(StatusOptions.getting_content)
 
-        self.session = session
-        self._meta_info = cast(Dict[str, str], self.post_REST("core_webservice_get_site_info"))
         self.get_courses()
 
         RequestHelper._instance_init = True
@@ -809,6 +2236,24 @@ class RequestHelper:
 
         return RequestHelper._instance
 
+    def login_from_cache(self) -> bool:
+        session = SessionWithKey.from_cache(self.user)
+        if session is None:
+            return False
+
+        # Getting the site info is needed anyway. If it fails the cached session was rejected.
+        self.session = session
+        self._meta_info = cast(Dict[str, str], self.post_REST("core_webservice_get_site_info"))
+
+        if not self.has_valid_meta_info():
+            database_helper.delete_session_cache()
+            return False
+
+        return True
+
+    def has_valid_meta_info(self) -> bool:
+        return isinstance(self._meta_info, dict) and "userid" in self._meta_info
+
     def get_courses(self) -> None:
         _courses = self.post_REST("core_enrol_get_users_courses", {"userid": self._meta_info["userid"]}, use_timeout=False)
         if _courses is None:
@@ -830,10 +2275,6 @@ class RequestHelper:
         random.shuffle(self.courses)
         random.shuffle(self._courses)
 
-    def make_course_paths(self) -> None:
-        for course in self.courses:
-            course.make_directories()
-
     def post_REST(self, function: str, data: Optional[Dict[str, Any]] = None, params: Optional[Dict[str, Any]] = None, use_timeout: bool = True) -> Optional[Any]:
         data = data or {}
 
@@ -860,6 +2301,212 @@ class RequestHelper:
 
         return response.json()
 
+    def post_AJAX(self, methodname: str, calls: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Sends multiple calls of `methodname` with a single request. Every call is given by its arguments.
+
+        The AJAX server stops at the first call that fails → the returned list may be shorter than `calls`.
+        Every item is of the form {"error": bool, "data": …}.
+        """
+        url = "https://isis.tu-berlin.de/lib/ajax/service.php"
+        data = [{"methodname": methodname, "args": args, "index": i} for i, args in enumerate(calls)]
+
+        response = self.session.get_(url, params={"sesskey": self.session.key, "info": methodname}, json=data)
+        if response is None or not response.ok:
+            return None
+
+        try:
+            res = response.json()
+        except ValueError:
+            return None
+
+        # If the request as a whole is rejected (e.g. an invalid sesskey) a single error is returned.
+        if not isinstance(res, list):
+            return None
+
+        return res
+
+    def plan_content_batches(self) -> List[List[Course]]:
+        """
+        Splits the courses into batches for `core_course_get_contents`. The batches are small enough to be requested in parallel.
+
+        With `enable_latency_scheduling` the courses are spread over the batches by their expected discovery time, and the batches
+        are returned longest-expected-first. This way the thread pool drains evenly instead of waiting on a single large course at the end.
+        """
+        if not enable_latency_scheduling:
+            courses, expected = self.courses, {course.course_id: 0.0 for course in self.courses}
+        else:
+            expected = self.expected_latencies()
+            courses = sorted(self.courses, key=lambda course: expected[course.course_id], reverse=True)
+
+        if not discover_use_ajax_batches:
+            return [[course] for course in courses]
+
+        batch_size = max(1, min(discover_ajax_max_batch_size, math.ceil(len(courses) / discover_ajax_min_num_batches)))
+        if not enable_latency_scheduling:
+            return [courses[i:i + batch_size] for i in range(0, len(courses), batch_size)]
+
+        # Greedily put the next course into the batch with the least expected time which still has room.
+        batches: List[List[Course]] = [[] for _ in range(math.ceil(len(courses) / batch_size))]
+        heap = [(0.0, i) for i in range(len(batches))]
+        for course in courses:
+            load, i = heapq.heappop(heap)
+            batches[i].append(course)
+            if len(batches[i]) < batch_size:
+                heapq.heappush(heap, (load + expected[course.course_id], i))
+
+        return sorted(batches, key=lambda batch: sum(expected[course.course_id] for course in batch), reverse=True)
+
+    def expected_latencies(self) -> Dict[int, float]:
+        """
+        Courses that were never discovered are expected to take as long as the slowest known one.
+        """
+        stats = database_helper.get_course_stats()
+        slowest = max((stats[course.course_id][0] for course in self.courses if course.course_id in stats), default=0.0)
+
+        return {course.course_id: stats[course.course_id][0] if course.course_id in stats else slowest for course in self.courses}
+
+    def record_latency(self, course: Course, latency: float, num_containers: int) -> None:
+        with self._lock:
+            RequestHelper.course_latencies[course.course_id] = (latency, num_containers)
+
+    def get_batch(self, methodname: str, courses: List[Course], args: Callable[[Course], Dict[str, Any]], previous_error: Optional[str] = None) -> Dict[int, Any]:
+        """
+        Calls `methodname` for every course with as few AJAX requests as possible. A batch that fails as a whole is split in half and retried.
+        Returns the data of every call that succeeded.
+
+        `previous_error` is the error code of the call that stopped the previous batch. If the first call fails with it again, the error is
+        assumed to hit every call (e.g. the method is not available via AJAX) → the remaining courses are left to the REST fallback.
+        """
+        if not courses:
+            return {}
+
+        res = self.post_AJAX(methodname, [args(course) for course in courses])
+        if res is None:
+            if len(courses) == 1:
+                return {}
+
+            half = len(courses) // 2
+            return {**self.get_batch(methodname, courses[:half], args), **self.get_batch(methodname, courses[half:], args)}
+
+        data = {}
+        for course, item in zip(courses, res):
+            if isinstance(item, dict) and item.get("error") is False:
+                data[course.course_id] = item.get("data")
+
+        error = self.ajax_error_code(res[-1]) if res else None
+        if len(res) == 1 and error is not None and error == previous_error:
+            return data
+
+        # The calls after the first failing one were not executed → batch them again.
+        if 0 < len(res) < len(courses):
+            data.update(self.get_batch(methodname, courses[len(res):], args, error))
+
+        return data
+
+    @staticmethod
+    def ajax_error_code(item: Any) -> Optional[str]:
+        """
+        The error code of a failed AJAX call, or None if it succeeded.
+        """
+        if isinstance(item, dict) and item.get("error") is False:
+            return None
+
+        exception = item.get("exception") if isinstance(item, dict) else None
+        return str(exception.get("errorcode")) if isinstance(exception, dict) else ""
+
+    def get_contents_batch(self, courses: List[Course]) -> Dict[int, List[Dict[str, Any]]]:
+        """
+        Courses that are missing in the result have to fall back to a REST call.
+        """
+        if not discover_use_ajax_batches:
+            return {}
+
+        contents = self.get_batch("core_course_get_contents", courses, lambda course: {"courseid": course.course_id})
+        return {course_id: self.webservice_file_urls(content) for course_id, content in contents.items() if isinstance(content, list)}
+
+    def get_unchanged_courses(self, courses: List[Course]) -> Dict[int, List[PreMediaContainer]]:
+        """
+        Asks Moodle which courses had updates since their last sync. For the others the stored containers are returned.
+
+        Moodle only tracks updates of modules and not e.g. of section summaries. So every course is refetched after `course_sync_max_age`.
+        """
+        if not enable_incremental_discovery:
+            return {}
+
+        fingerprint = self.course_sync_fingerprint()
+        syncs: Dict[int, Tuple[int, List[List[Any]]]] = {}
+        for course in courses:
+            sync = database_helper.get_course_sync(course.course_id)
+            if sync is None:
+                continue
+
+            last_sync, _fingerprint, _, _, containers = sync
+            if _fingerprint == fingerprint and time.time() - last_sync < course_sync_max_age:
+                syncs[course.course_id] = (last_sync, containers)
+
+        known_courses = [course for course in courses if course.course_id in syncs]
+
+        def args(course: Course) -> Dict[str, Any]:
+            # Leave some room for clocks that are not in sync.
+            return {"courseid": course.course_id, "since": syncs[course.course_id][0] - 5 * 60}
+
+        updates = self.get_batch("core_course_get_updates_since", known_courses, args) if discover_use_ajax_batches else {}
+
+        # Courses that are missing in the result fall back to a REST call.
+        for course in known_courses:
+            if course.course_id not in updates:
+                updates[course.course_id] = self.post_REST("core_course_get_updates_since", args(course))
+
+        unchanged = {}
+        for course in known_courses:
+            update = updates.get(course.course_id)
+            if isinstance(update, dict) and "instances" in update and not update["instances"]:
+                unchanged[course.course_id] = [PreMediaContainer.from_json(info, course) for info in syncs[course.course_id][1]]
+
+        return unchanged
+
+    @staticmethod
+    def course_sync_fingerprint() -> str:
+        """
+        The stored containers depend on how the contents were parsed. If any of this changes, the containers are thrown away.
+        """
+        return f"{__version__} {config.follow_links} {config.make_subdirs} {enable_structured_link_extraction} {url_ignore.fingerprint} {isis_documents.fingerprint}"
+
+    @staticmethod
+    def webservice_file_urls(content: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        The AJAX server links files with `/pluginfile.php/`, the REST server with `/webservice/pluginfile.php/`.
+        The latter is what is stored in the database and what can be downloaded with the token.
+        """
+        return cast(List[Dict[str, Any]], json.loads(json.dumps(content).replace("https://isis.tu-berlin.de/pluginfile.php/", "https://isis.tu-berlin.de/webservice/pluginfile.php/")))
+
+    def verbose_report(self) -> List[str]:
+        stats = sorted(self.session.connection_stats().items(), key=lambda it: it[1], reverse=True)
+        num_requests, num_connections = sum(it[1][0] for it in stats), sum(it[1][1] for it in stats)
+        host_pad = max((len(host) for host, _ in stats), default=0)
+
+        report = [f"Connections: {num_requests} requests over {num_connections} new connections ({num_requests - num_connections} reused)"]
+        report.extend(f"    {host:<{host_pad}}  {requests:>6} requests  {connections:>4} new connections" for host, (requests, connections) in stats)
+        report.extend(self.session.retry_policy.report())
+
+        probes, drive_urls = self.session.probes, self.session.drive_urls
+        report.append(f"Probes: {probes.num_calls + drive_urls.num_calls} requests, {probes.num_saved + drive_urls.num_saved} saved by sharing them between courses")
+        report.extend(DownloadController.report())
+        report.append(f"Segmented downloads: {SegmentedDownload.num_downloads} files, up to {SegmentedDownload.max_connections_used} connections per file")
+        report.extend(Deduplicator.report())
+        report.append(f"Parsing: {self.num_unchanged_contents} courses with unchanged contents were not parsed again, saving {self.parse_time_saved:.2f}s")
+        report.extend(url_ignore.report("Ignored urls"))
+
+        latencies = sorted(((self.course_id_mapping[course_id], stats) for course_id, stats in self.course_latencies.items() if course_id in self.course_id_mapping),
+                           key=lambda it: it[1][0], reverse=True)
+        name_pad = max((len(course.name) for course, _ in latencies), default=0)
+
+        report.append(f"Courses: {len(latencies)} discovered, slowest first")
+        report.extend(f"    {course.name:<{name_pad}}  {latency:6.2f}s  {num_containers:>5} containers" for course, (latency, num_containers) in latencies)
+
+        return report
+
     @staticmethod
     def analyze_most_common_urls(pre_containers: List[PreMediaContainer]) -> None:
         urls: DefaultDict[Optional[str], int] = defaultdict(int)
@@ -868,22 +2515,159 @@ class RequestHelper:
 
         pass
 
-    def download_content(self, status: Optional[RequestHelperStatus] = None) -> Dict[MediaType, List[MediaContainer]]:
-        if status is not None:
-            status.set_total(len(self.courses))
+    def download_content(self, status: Optional[RequestHelperStatus] = None) -> Dict[MediaType, List[MediaContainer]]:
+        if status is not None:
+            status.set_total(len(self.courses))
+
+        if discover_use_asyncio and enable_multithread:
+            _containers = asyncio.run(self._discover_async(status))
+        else:
+            _containers = self._discover_threaded(status)
+
+        self.finish_discovery()
+        return self.to_mapping(check_for_conflicts_in_files([item for item in _containers if item is not None]))
+
+    def download_content_pipelined(self, on_course: Callable[[List[MediaContainer]], None]) -> Tuple[Dict[MediaType, List[MediaContainer]], List[Tuple[MediaContainer, MediaContainer]]]:
+        """
+        In contrast to `download_content` the containers are handed to `on_course` as soon as every container of a course is resolved.
+        Conflicts are resolved per course. Files that were already handed out for a different course can't be linked to anymore.
+        Instead, they are returned as (resolution, container) and have to be linked once the downloads are done.
+        """
+        sources: Dict[Future[List[PreMediaContainer]], List[Course]] = {}
+        done: Queue[Future[Any]] = Queue()
+
+        # Every course is complete once all sources that may contain it and all its probes are done.
+        num_sources: Dict[int, int] = defaultdict(int)
+        num_probes: Dict[int, int] = defaultdict(int)
+        containers: DefaultDict[int, List[MediaContainer]] = defaultdict(list)
+        probes: Dict[Future[Optional[MediaContainer]], int] = {}
+
+        seen_containers: Set[str] = set()
+        seen_download_urls: Dict[str, MediaContainer] = {}
+        all_containers: List[MediaContainer] = []
+        deferred: List[Tuple[MediaContainer, MediaContainer]] = []
+
+        def resolve(course_id: int) -> None:
+            resolved = []
+            for container in check_for_conflicts_in_files(containers.pop(course_id, [])):
+                all_containers.append(container)
+                if container.media_type == MediaType.corrupted:
+                    resolved.append(container)
+
+                elif (resolution := seen_download_urls.get(container.download_url)) is not None and resolution.path != container.path:
+                    deferred.append((resolution, container))
+
+                else:
+                    seen_download_urls[container.download_url] = container
+                    resolved.append(container)
+
+            on_course(resolved)
+
+        with ThreadPoolExecutor(discover_num_threads) as ex:
+            def submit(future: Future[Any]) -> None:
+                future.add_done_callback(done.put)
+
+            work: List[Tuple[Callable[[Any], List[PreMediaContainer]], Any, List[Course]]] = [(self._download_mod_assign, 0, self.courses), (self._download_videos, 0, self.courses)]
+            work.extend((self._download_documents_batch, batch, batch) for batch in self.plan_content_batches())
+
+            for func, arg, courses in work:
+                source = ex.submit(func, arg)
+                sources[source] = courses
+                for course in courses:
+                    num_sources[course.course_id] += 1
+
+                submit(source)
+
+            num_courses_left = len(num_sources)
+            try:
+                while num_courses_left or probes:
+                    future = done.get()
+
+                    if future in sources:
+                        for pre_container in future.result():
+                            if (key := f"{pre_container.course} {pre_container.url}") in seen_containers:
+                                continue
+
+                            seen_containers.add(key)
+                            num_probes[pre_container.course.course_id] += 1
+                            probe = ex.submit(MediaContainer.from_pre_container, pre_container, self.session)
+                            probes[probe] = pre_container.course.course_id
+                            submit(probe)
+
+                        touched = [course.course_id for course in sources.pop(future)]
+                        for course_id in touched:
+                            num_sources[course_id] -= 1
+
+                    else:
+                        course_id = probes.pop(future)
+                        if (container := future.result()) is not None:
+                            containers[course_id].append(container)
+
+                        num_probes[course_id] -= 1
+                        touched = [course_id]
+
+                    for course_id in touched:
+                        if num_sources.get(course_id) == 0 and num_probes[course_id] == 0:
+                            # Mark it as resolved
+                            num_sources[course_id] = -1
+                            num_courses_left -= 1
+                            resolve(course_id)
+
+            except BaseException:
+                # Don't wait for the work that was not started yet, its results are lost anyway.
+                for source in sources:
+                    source.cancel()
+
+                for probe in probes:
+                    probe.cancel()
+
+                raise
+
+        # Containers of courses that are not part of the discovery (shouldn't happen)
+        for course_id in list(containers):
+            resolve(course_id)
+
+        self.finish_discovery()
+        return self.to_mapping(all_containers), deferred
+
+    def finish_discovery(self) -> None:
+        database_helper.flush_validated()
+        self.store_course_latencies()
+        self.session.probes.clear()
+        self.session.drive_urls.clear()
+
+    def store_course_latencies(self) -> None:
+        if not self.course_latencies:
+            return
+
+        stats = database_helper.get_course_stats()
+        database_helper.set_course_stats({
+            course_id: (stats[course_id][0] * (1 - course_latency_mavg_perc) + latency * course_latency_mavg_perc if course_id in stats else latency, num_containers)
+            for course_id, (latency, num_containers) in self.course_latencies.items()
+        })
+
+    @staticmethod
+    def to_mapping(containers: List[MediaContainer]) -> Dict[MediaType, List[MediaContainer]]:
+        mapping: Dict[MediaType, List[MediaContainer]] = {typ: [] for typ in MediaType}
+
+        for container in containers:
+            mapping[container.media_type].append(container)
+
+        return {typ: sorted(item, key=lambda x: x.time, reverse=True) for typ, item in mapping.items()}
 
+    def _discover_threaded(self, status: Optional[RequestHelperStatus] = None) -> List[Optional[MediaContainer]]:
         if enable_multithread:
             with ThreadPoolExecutor(discover_num_threads) as ex:
                 # Note the use of .map() instead of .submit(). This is done so in both cases the variable can be of type `Iterable`.
                 # If done with .submit() one would have to wrap the function call into a `Future` which is too cumbersome.
                 _mod_assign = ex.map(self._download_mod_assign, [0])
                 _video_containers = ex.map(self._download_videos, [0])
-                _document_containers = ex.map(self._download_documents, self.courses, repeat(status))
+                _document_containers = ex.map(self._download_documents_batch, self.plan_content_batches(), repeat(status))
 
         else:
             _mod_assign = iter([self._download_mod_assign(0)])
             _video_containers = iter([self._download_videos(0)])
-            _document_containers = iter([self._download_documents(course, status) for course in self.courses])
+            _document_containers = iter([self._download_documents_batch(batch, status) for batch in self.plan_content_batches()])
 
         pre_containers = [item for row in filter(lambda x: x is not None, chain(_document_containers, _video_containers, _mod_assign)) for item in row]
         pre_containers = list({f"{item.course} {item.url}": item for item in pre_containers}.values())
@@ -902,20 +2686,65 @@ class RequestHelper:
             # Only multithread if there are actual requests going to be made.
             if enable_multithread:
                 with ThreadPoolExecutor(discover_num_threads) as ex:
-                    _containers = list(ex.map(MediaContainer.from_pre_container, pre_containers, repeat(self.session), repeat(status)))
-            else:
-                _containers = [MediaContainer.from_pre_container(pre_container, self.session, status) for pre_container in pre_containers]
+                    return list(ex.map(MediaContainer.from_pre_container, pre_containers, repeat(self.session), repeat(status)))
 
-        else:
-            _containers = [MediaContainer.from_pre_container(pre_container, self.session, None) for pre_container in pre_containers]
+            return [MediaContainer.from_pre_container(pre_container, self.session, status) for pre_container in pre_containers]
 
-        containers = check_for_conflicts_in_files([item for item in _containers if item is not None])
-        mapping: Dict[MediaType, List[MediaContainer]] = {typ: [] for typ in MediaType}
+        return [MediaContainer.from_pre_container(pre_container, self.session, None) for pre_container in pre_containers]
 
-        for container in containers:
-            mapping[container.media_type].append(container)
+    async def _discover_async(self, status: Optional[RequestHelperStatus] = None) -> List[Optional[MediaContainer]]:
+        """
+        Schedules the discovery from a single event loop. In contrast to `_discover_threaded` there is no barrier between
+        getting the content of the courses and probing the files: Once a course is parsed, its files are probed right away.
 
-        return {typ: sorted(item, key=lambda x: x.time, reverse=True) for typ, item in mapping.items()}
+        This is *not* asynchronous I/O: `requests` is blocking, so every request runs on a thread of an executor.
+        The number of requests in flight is bounded by `discover_async_max_in_flight` and, per host, by the size of its connection pool.
+        Otherwise, the connections above the pool size would be opened for a single request and thrown away.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(discover_async_max_in_flight)
+        host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+        with ThreadPoolExecutor(discover_async_max_in_flight, thread_name_prefix="D") as ex:
+            async def run(url: str, func: Callable[..., T], *args: Any) -> T:
+                host = urlparse(url).hostname or ""
+                if (host_semaphore := host_semaphores.get(host)) is None:
+                    host_semaphore = host_semaphores[host] = asyncio.Semaphore(self.session.pool_size(url))
+
+                async with host_semaphore, semaphore:
+                    return await loop.run_in_executor(ex, func, *args)
+
+            seen_containers: Set[str] = set()
+            all_pre_containers: List[PreMediaContainer] = []
+            probes: List[asyncio.Task[Optional[MediaContainer]]] = []
+
+            # Getting the content goes to ISIS
+            isis_url = "https://isis.tu-berlin.de/"
+            discovery = [
+                loop.create_task(run(isis_url, self._download_mod_assign, 0)),
+                loop.create_task(run(isis_url, self._download_videos, 0)),
+                *(loop.create_task(run(isis_url, self._download_documents_batch, batch, status)) for batch in self.plan_content_batches())
+            ]
+
+            for finished in asyncio.as_completed(discovery):
+                for pre_container in await finished:
+                    if (key := f"{pre_container.course} {pre_container.url}") in seen_containers:
+                        continue
+
+                    seen_containers.add(key)
+                    all_pre_containers.append(pre_container)
+                    probes.append(loop.create_task(run(pre_container.url, MediaContainer.from_pre_container, pre_container, self.session, status)))
+
+            self.analyze_most_common_urls(all_pre_containers)
+
+            if status is not None:
+                # Only the probes which are still running are left to be shown.
+                status.set_build_cache_files(all_pre_containers)
+                status.set_status(StatusOptions.building_cache)
+                status.set_total(sum(1 for probe in probes if not probe.done()))
+                status._eta_start_time = datetime.now()
+
+            return list(await asyncio.gather(*probes))
 
     def _download_mod_assign(self, _: Any = None) -> List[PreMediaContainer]:
         try:
@@ -953,21 +2782,13 @@ class RequestHelper:
             if config.download_videos is False:
                 return []
 
-            url = "https://isis.tu-berlin.de/lib/ajax/service.php"
             # Thank you isia-tub for discovering this service.
-            video_data = [{
-                "methodname": "mod_videoservice_get_videos",
-                "args": {"courseid": course.course_id},
-                "index": i
-            } for i, course in enumerate(self.courses)]
-
-            videos_res = self.session.get_(url, params={"sesskey": self.session.key}, json=video_data)
-
-            if videos_res is None or not videos_res.ok:
+            videos_res = self.post_AJAX("mod_videoservice_get_videos", [{"courseid": course.course_id} for course in self.courses])
+            if videos_res is None:
                 return []
 
             res = []
-            for course, video in zip(self.courses, videos_res.json()):
+            for course, video in zip(self.courses, videos_res):
                 if video["error"]:
                     continue
                 assert course.course_id == video["data"]["courseid"]
@@ -984,9 +2805,76 @@ class RequestHelper:
             with self._lock:
                 generate_error_message(ex)
 
-    def _download_documents(self, course: Course, status: Optional[RequestHelperStatus] = None) -> List[PreMediaContainer]:
+    def _download_documents_batch(self, courses: List[Course], status: Optional[RequestHelperStatus] = None) -> List[PreMediaContainer]:
+        try:
+            sync_time = int(time.time())
+            unchanged = self.get_unchanged_courses(courses)
+
+            s = time.perf_counter()
+            contents = self.get_contents_batch([course for course in courses if course.course_id not in unchanged])
+            fetch_time = time.perf_counter() - s
+
+            # The time of the batch request is attributed to the courses by their number of modules.
+            sizes = {course_id: 1 + sum(len(section.get("modules", [])) for section in content if isinstance(section, dict)) for course_id, content in contents.items()}
+            total_size = sum(sizes.values())
+
+        except Exception as ex:
+            with self._lock:
+                generate_error_message(ex)
+
+        res = []
+        for course in courses:
+            if course.course_id in unchanged:
+                res.extend(unchanged[course.course_id])
+                if status is not None:
+                    status.done()
+
+            else:
+                share = fetch_time * sizes[course.course_id] / total_size if course.course_id in sizes else 0.0
+                res.extend(self._download_documents(course, status, contents.get(course.course_id), sync_time, share))
+
+        return res
+
+    def _download_documents(self, course: Course, status: Optional[RequestHelperStatus] = None, content: Optional[List[Dict[str, Any]]] = None,
+                            sync_time: Optional[int] = None, fetch_time: float = 0.0) -> List[PreMediaContainer]:
+        """
+        `fetch_time` is the time it took to get `content`, if it was passed in.
+        """
         try:
-            return course.download_documents(self)
+            s = time.perf_counter()
+            sync_time = sync_time or int(time.time())
+            if content is None:
+                content = course.get_contents(self)
+                if content is None:
+                    return []
+
+            if not (enable_incremental_discovery or enable_content_hash_cache):
+                pre_containers = course.parse_documents(content)
+                self.record_latency(course, fetch_time + time.perf_counter() - s, len(pre_containers))
+                return pre_containers
+
+            fingerprint = self.course_sync_fingerprint()
+            content_hash = sha256(json.dumps(content).encode()).hexdigest()
+
+            if enable_content_hash_cache and (sync := database_helper.get_course_sync(course.course_id)) is not None:
+                _, _fingerprint, _content_hash, parse_time, containers = sync
+                if _fingerprint == fingerprint and _content_hash == content_hash:
+                    database_helper.touch_course_sync(course.course_id, sync_time)
+                    with self._lock:
+                        RequestHelper.num_unchanged_contents += 1
+                        RequestHelper.parse_time_saved += parse_time
+
+                    self.record_latency(course, fetch_time + time.perf_counter() - s, len(containers))
+                    return [PreMediaContainer.from_json(info, course) for info in containers]
+
+            parse_start = time.perf_counter()
+            pre_containers = course.parse_documents(content)
+            parse_time = time.perf_counter() - parse_start
+
+            database_helper.set_course_sync(course.course_id, sync_time, fingerprint, content_hash, parse_time, [item.to_json() for item in pre_containers])
+            self.record_latency(course, fetch_time + time.perf_counter() - s, len(pre_containers))
+
+            return pre_containers
 
         except Exception as ex:
             with self._lock:
@@ -1028,7 +2916,7 @@ def check_for_conflicts_in_files(files: List[MediaContainer]) -> List[MediaConta
         else:
             for con in conflict:
                 if resolution.path != con.path:
-                    resolution._links.append(con)
+                    resolution.add_link(con)
 
         final_list.append(resolution)
 
@@ -1059,7 +2947,7 @@ def check_for_conflicts_in_files(files: List[MediaContainer]) -> List[MediaConta
                 final_list.append(file)
 
         else:
-            logger.assert_fail(f"conflict: {[{x: getattr(item, x) for x in item.__slots__} for item in conflict]}")
+            logger.assert_fail(f"conflict: {[{x: getattr(item, x) for x in item._compared_fields} for item in conflict]}")
             continue
 
     # Finally filter the remaining files based on the url
@@ -1073,92 +2961,377 @@ def check_for_conflicts_in_files(files: List[MediaContainer]) -> List[MediaConta
         resolution = conflict.pop(0)
         for con in conflict:
             if resolution.path != con.path:
-                resolution._links.append(con)
+                resolution.add_link(con)
 
         final_list.append(resolution)
 
     return final_list
 
 
-class Downloader(Thread):
-    q: Queue[MediaContainer]
-    ret_q: Queue[Tuple[int, bool]]
-    thread_id: int
-    status: DownloadStatus
+class HostShare:
+    """
+    The files of a single host in the small and the large lane, and how many of them may be downloaded at once.
+
+    The number of connections is learned from the throughput of the finished downloads: For every number of concurrent downloads the moving average
+    of the throughput per connection is kept. At the limit, another connection is allowed if the throughput of the host rose by at least
+    `host_min_gain` with the last one. If it fell, one connection less is allowed.
+
+    A single small download is dominated by the latency → downloads are summed up until they make up `host_min_sample_size` bytes.
+    """
+    host: str
+    lanes: Tuple[List[Tuple[Tuple[bool, int], int, MediaContainer]], List[Tuple[Tuple[bool, int], int, MediaContainer]]]
+    num_busy: int
+    max_connections: int
+    throughput: Dict[int, float]
+    samples: Dict[int, Tuple[int, float]]
+    num_bytes: int
+
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self, host: str) -> None:
+        self.host = host
+        self.lanes = ([], [])
+        self.num_busy = 0
+        self.max_connections = host_initial_max_connections if enable_host_fair_share else host_max_connections
+        self.throughput = {}
+        self.samples = {}
+        self.num_bytes = 0
+
+    def learn(self, num_connections: int, num_bytes: int, taken: float) -> None:
+        self.num_bytes += num_bytes
+        if not enable_host_fair_share or taken <= 0:
+            return
+
+        sample_bytes, sample_time = self.samples.pop(num_connections, (0, 0.0))
+        sample_bytes, sample_time = sample_bytes + num_bytes, sample_time + taken
+        if sample_bytes < host_min_sample_size:
+            self.samples[num_connections] = sample_bytes, sample_time
+            return
+
+        rate = sample_bytes / sample_time
+        prev = self.throughput.get(num_connections)
+        self.throughput[num_connections] = rate if prev is None else prev * (1 - host_throughput_mavg_perc) + rate * host_throughput_mavg_perc
+
+        if num_connections != self.max_connections:
+            return
+
+        total = num_connections * self.throughput[num_connections]
+        below = (num_connections - 1) * self.throughput.get(num_connections - 1, 0)
+        if num_connections == 1 or total > below * (1 + host_min_gain):
+            self.max_connections = min(self.max_connections + 1, host_max_connections)
+        elif total < below:
+            self.max_connections = max(self.max_connections - 1, 1)
+
+    @property
+    def num_pending(self) -> int:
+        return len(self.lanes[0]) + len(self.lanes[1])
+
+
+class DownloadLanes:
+    """
+    The files to download in two lanes: Files of at least `download_large_file_size` bytes are in the large lane, every other one in the small lane.
+    The small lane hands out the smallest file first, such that many files are done early. The large lane the largest, such that the last download ends early.
+
+    Up to `download_large_lane_share` of the threads download from the large lane, the others from the small lane.
+    Once a lane is empty its threads take the files of the other lane.
+
+    Every host has its own share of both lanes. The hosts take turns and only have as many downloads at once as their `HostShare` allows.
+    While only a single host has files left, it is not limited. Files which don't have to be downloaded don't count.
+    """
+    hosts: Dict[str, HostShare]
+    order: Deque[HostShare]
+    started: Dict[int, Tuple[float, int, bool]]
+    num_pending: int
+    num_large_busy: int
+    num_added: int
+    num_waiting: int
+    is_closed: bool
+    condition: Condition
+
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self) -> None:
+        self.hosts = {}
+        self.order = deque()
+        self.started = {}
+        self.num_pending = 0
+        self.num_large_busy = 0
+        self.num_added = 0
+        self.num_waiting = 0
+        self.is_closed = False
+        self.condition = Condition()
+
+    def put(self, file: Optional[MediaContainer]) -> None:
+        """
+        Adds a file. `None` closes the lanes: Once they are empty, `get` returns `None`.
+        """
+        with self.condition:
+            if file is None:
+                self.is_closed = True
+                self.condition.notify_all()
+                return
+
+            host = file.host if enable_host_fair_share else ""
+            share = self.hosts.get(host)
+            if share is None:
+                share = self.hosts[host] = HostShare(host)
+                self.order.append(share)
+
+            # Checking a file looks at the file system and the database → it is only done once, the result is part of the key.
+            should_download = file.should_download
+            if enable_download_lanes and should_download and file.size >= download_large_file_size:
+                heapq.heappush(share.lanes[1], ((True, -file.size), self.num_added, file))
+
+            else:
+                # The files which don't have to be downloaded are done right away. Without lanes the others are handed out in the order they were added.
+                heapq.heappush(share.lanes[0], ((should_download, file.size if enable_download_lanes else 0), self.num_added, file))
+
+            self.num_added += 1
+            self.num_pending += 1
+            self.condition.notify_all()
+
+    def get(self, num_threads: int) -> Optional[MediaContainer]:
+        """
+        Waits for a file which may be downloaded. Returns `None` once the lanes are closed and empty.
+        """
+        with self.condition:
+            while True:
+                file = self.take(num_threads)
+                if file is not None or (self.is_closed and not self.num_pending):
+                    return file
+
+                self.num_waiting += 1
+                self.condition.wait()
+                self.num_waiting -= 1
+
+    @property
+    def num_capped(self) -> int:
+        """
+        The number of threads waiting for a host to allow another download.
+        """
+        with self.condition:
+            return self.num_waiting if self.num_pending else 0
+
+    def take(self, num_threads: int) -> Optional[MediaContainer]:
+        wants_large = self.num_large_busy < max(int(num_threads * download_large_lane_share), 1)
+        is_shared = sum(1 for share in self.order if share.num_pending) > 1
+
+        for lane in (1, 0) if wants_large else (0, 1):
+            for _ in range(len(self.order)):
+                share = self.order[0]
+                self.order.rotate(-1)
+
+                heap = share.lanes[lane]
+                if not heap or (heap[0][0][0] and is_shared and share.num_busy >= share.max_connections):
+                    continue
+
+                (should_download, _), _, file = heapq.heappop(heap)
+                self.num_pending -= 1
+
+                if should_download:
+                    share.num_busy += 1
+                    self.num_large_busy += lane
+                    self.started[id(file)] = (time.perf_counter(), share.num_busy, lane == 1)
+
+                return file
+
+        return None
+
+    def done(self, file: MediaContainer) -> None:
+        with self.condition:
+            started = self.started.pop(id(file), None)
+            if started is None:
+                return
+
+            start, num_connections, is_large = started
+            share = self.hosts[file.host if enable_host_fair_share else ""]
+            share.num_busy -= 1
+            self.num_large_busy -= is_large
+            share.learn(num_connections, file.current_size or 0, time.perf_counter() - start)
+
+            self.condition.notify_all()
+
+    def utilization(self) -> List[Tuple[str, int, int, int]]:
+        """
+        (host, number of downloads, allowed number of downloads, number of pending files) of every host with something to do.
+        """
+        with self.condition:
+            return [(share.host, share.num_busy, share.max_connections, share.num_pending) for share in self.hosts.values() if share.num_busy or share.num_pending]
+
+    def report(self) -> List[str]:
+        shares = sorted(self.hosts.values(), key=lambda it: it.num_bytes, reverse=True)
+        report = [f"Hosts: {len(shares)} hosts downloaded from"]
+        report.extend(f"    {share.host or 'all':<32}  {HumanBytes.format_str(share.num_bytes)}  up to {share.max_connections} connections" for share in shares if share.num_bytes)
+
+        return report
+
+    def __len__(self) -> int:
+        return self.num_pending
+
+
+class DownloadController:
+    """
+    Adapts the number of download threads to the goodput measured by the throttler (additive increase, multiplicative decrease).
+
+    Every `download_controller_interval` s, while all active threads are busy, the goodput is compared to the one before the last change:
+      - The last change added a thread and the goodput rose by at least `download_controller_min_gain` → add another one.
+      - The goodput fell by at least as much → multiply the number of threads by `download_controller_decrease_factor`.
+      - The added thread did not help → remove it again and hold for `download_controller_hold_intervals` intervals before probing again.
+
+    Threads waiting for a host to allow another download count as busy. While there are any, no thread is added: It would wait as well.
+    The hosts raise their limits on their own (see `HostShare.learn`).
+    """
     throttler: DownloadThrottler
-    session: SessionWithKey
+    max_num_threads: int
+    num_threads: int
+    num_busy: int
+    baseline: Optional[float]
+    last_action: str
+    hold: int
+    start_time: float
+    finished: bool
+    condition: Condition
 
-    is_downloading: bool = False
-    _lock = Lock()
+    __slots__ = tuple(__annotations__)
 
-    def __init__(self, q: Queue[MediaContainer], ret_q: Queue[Tuple[int, bool]], thread_id: int, status: DownloadStatus, throttler: DownloadThrottler, session: SessionWithKey):
-        self.q = q
-        self.ret_q = ret_q
-        self.thread_id = thread_id
-        self.status = status
+    # Every decision as (time since the start, goodput in bytes / s, action, number of threads afterwards)
+    decisions: List[Tuple[float, float, str, int]] = []
+
+    def __init__(self, throttler: DownloadThrottler, max_num_threads: int) -> None:
         self.throttler = throttler
-        self.session = session
+        self.max_num_threads = max(max_num_threads, 1)
+        self.num_threads = min(download_controller_initial_num_threads, self.max_num_threads)
+        self.num_busy = 0
+        self.baseline = None
+        self.last_action = "start"
+        self.hold = 0
+        self.start_time = time.perf_counter()
+        self.finished = False
+        self.condition = Condition()
+
+    def decide(self, goodput: float, may_add: bool = True) -> str:
+        """
+        Adapts `num_threads` to the goodput of the last interval and returns the action taken.
+        """
+        probed = self.last_action in {"probe", "increase"}
 
-        super().__init__(daemon=True)
-        self.start()
+        if self.baseline is not None and goodput < self.baseline * (1 - download_controller_min_gain):
+            action = "decrease"
+            self.num_threads = max(int(self.num_threads * download_controller_decrease_factor), 1)
 
-    def run(self) -> None:
-        try:
-            while True:
-                file = self.q.get()
-                self.is_downloading = True
-                self.status.add_container(self.thread_id, file)
+        elif probed and self.baseline is not None and goodput <= self.baseline * (1 + download_controller_min_gain):
+            action = "revert"
+            self.num_threads = max(self.num_threads - 1, 1)
+            self.hold = download_controller_hold_intervals
 
-                ret = file.download(self.throttler, self.session)
-                self.status.done(self.thread_id, file)
-                self.is_downloading = False
-                self.ret_q.put((self.thread_id, ret))
+        elif self.num_threads >= self.max_num_threads or self.hold > 0 or not may_add:
+            action = "hold"
+            self.hold = max(self.hold - 1, 0)
 
-        except Exception as ex:
-            with self._lock:
-                generate_error_message(ex)
+        else:
+            action = "increase" if probed else "probe"
+            self.num_threads += 1
+
+        # A revert restores the previous number of threads → the goodput before the probe stays the reference.
+        if action != "revert":
+            self.baseline = goodput
+
+        self.last_action = action
+        self.decisions.append((time.perf_counter() - self.start_time, goodput, action, self.num_threads))
+
+        return action
+
+    def run(self, lanes: DownloadLanes, download: Callable[[MediaContainer], Any]) -> None:
+        """
+        Downloads the files of the lanes until they are closed and empty.
+        The threads are named `T_{i}`, every one of them has its own row in the `DownloadStatus`.
+        """
+        workers = [Thread(target=self.work, args=(i, lanes, download), name=f"T_{i}", daemon=True) for i in range(self.max_num_threads)]
+        for worker in workers:
+            worker.start()
+
+        since = time.perf_counter()
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.finished, download_controller_interval)
+                if self.finished:
+                    break
+
+                num_capped = lanes.num_capped
+                if self.num_busy + num_capped >= self.num_threads:
+                    self.decide(self.throttler.bandwidth_since(since), may_add=not num_capped)
+                    self.condition.notify_all()
+
+            since = time.perf_counter()
+
+        for worker in workers:
+            worker.join()
+
+    def work(self, thread_id: int, lanes: DownloadLanes, download: Callable[[MediaContainer], Any]) -> None:
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: thread_id < self.num_threads or self.finished)
+                if self.finished:
+                    return
+
+                num_threads = self.num_threads
+
+            file = lanes.get(num_threads)
+            if file is None:
+                with self.condition:
+                    self.finished = True
+                    self.condition.notify_all()
+
+                return
+
+            with self.condition:
+                self.num_busy += 1
+
+            try:
+                download(file)
+            finally:
+                lanes.done(file)
+                with self.condition:
+                    self.num_busy -= 1
+
+    @classmethod
+    def report(cls) -> List[str]:
+        if not cls.decisions:
+            return ["Download threads: No decisions taken"]
+
+        actions: DefaultDict[str, int] = defaultdict(int)
+        for _, _, action, _ in cls.decisions:
+            actions[action] += 1
+
+        report = [f"Download threads: {len(cls.decisions)} decisions ({', '.join(f'{num} {action}' for action, num in sorted(actions.items()))}), "
+                  f"up to {max(it[3] for it in cls.decisions)} threads, {cls.decisions[-1][3]} at the end"]
+        report.extend(f"    {at:8.1f}s  {HumanBytes.format_str(goodput)}/s  {action:<8}  → {num_threads} threads"
+                      for at, goodput, action, num_threads in cls.decisions if action != "hold")
+
+        return report
 
 
 class CourseDownloader:
     containers: Dict[MediaType, List[MediaContainer]] = {}
+    lanes: Optional[DownloadLanes] = None
     _did_message: bool = False
 
     def start(self) -> None:
         user = get_credentials()
+
+        # Streaming needs to know every file in advance.
+        if enable_pipelined_download and enable_multithread and not args.stream:
+            return self.start_pipelined(user)
+
         with RequestHelperStatus() as status:
             helper = RequestHelper(user, status)
             containers = helper.download_content(status)
             collapsed_containers = [item for row in containers.values() for item in row]
             collapsed_containers.sort(reverse=True, key=lambda x: x.time)
-
-            for container in collapsed_containers:
-                if container.should_download:
-                    container.path.open("w").close()
-                else:
-                    for con in container._links:
-                        if con.should_download:
-                            if not container.path.exists():
-                                container.path.open("w").close()
-
-                            con.hardlink(container)
+            self.prepare_files(collapsed_containers)
 
         CourseDownloader.containers = containers
-
-        # Log the metadata
-        conf = config.to_dict()
-        del conf["password"]
-
-        logger.post({
-            "num_g_files": len(collapsed_containers),
-            "num_c_files": len(collapsed_containers),
-
-            "total_g_bytes": sum((item.size for item in collapsed_containers)),
-            "total_c_bytes": sum((item.size for item in collapsed_containers)),
-
-            "course_ids": sorted([course.course_id for course in helper._courses]),
-
-            "config": conf,
-        })
+        self.post_metadata(helper, collapsed_containers)
 
         if not any(item.should_download for row in containers.values() for item in row):
             for row in containers.values():
@@ -1169,6 +3342,7 @@ class CourseDownloader:
                 logger.done.get()
 
             self.message_what_did_i_do(collapsed_containers)
+            self.message_verbose_report(helper)
             return
 
         # Make the runner a thread in case of a user needing to exit the program → downloading is done in the main thread
@@ -1184,8 +3358,115 @@ class CourseDownloader:
                     time.sleep(65536)
 
             downloader.join()
+            download_sync.flush()
+
+        self.message_what_did_i_do(collapsed_containers)
+        self.message_verbose_report(helper)
+
+    def start_pipelined(self, user: User) -> None:
+        """
+        Downloads the files of every course as soon as the course is discovered, instead of waiting for all courses.
+        """
+        with RequestHelperStatus() as request_status:
+            helper = RequestHelper(user, request_status)
+
+        throttler = DownloadThrottler()
+        lanes = DownloadLanes()
+        num_courses = 0
+
+        with DownloadStatus({}, args.max_num_threads, throttler) as status:
+            def on_course(containers: List[MediaContainer]) -> None:
+                nonlocal num_courses
+                num_courses += 1
+                status.message = f"Downloading content (discovered {num_courses} / {len(helper.courses)} courses)"
+
+                # Nothing streams the files → they only appear once they are downloaded.
+                self.prepare_files(containers, create_files=False)
+                status.add_files(containers)
+
+                for container in containers:
+                    lanes.put(container)
+
+            status.message = f"Downloading content (discovered 0 / {len(helper.courses)} courses)"
+            downloader = Thread(target=self.download_queue, args=(lanes, throttler, helper.session, status))
+            downloader.start()
+
+            try:
+                containers, deferred = helper.download_content_pipelined(on_course)
+                status.message = "Downloading content"
+
+            finally:
+                # Even if the discovery failed, the files which were handed out are still downloaded.
+                lanes.put(None)
+                downloader.join()
+                download_sync.flush()
+
+        make_parent_directories(con.path for _, container in deferred for con in [container, *container._links])
+        for resolution, container in deferred:
+            for con in [container, *container._links]:
+                if con.should_download:
+                    if not resolution.path.exists():
+                        resolution.path.open("w").close()
+
+                    con.hardlink(resolution)
+
+        collapsed_containers = [item for row in containers.values() for item in row]
+        CourseDownloader.containers = containers
+        self.post_metadata(helper, collapsed_containers)
+
+        if not (config.telemetry_policy is False or is_testing):
+            logger.done.get()
 
         self.message_what_did_i_do(collapsed_containers)
+        self.message_verbose_report(helper)
+
+    @staticmethod
+    def prepare_files(containers: List[MediaContainer], create_files: bool = True) -> None:
+        """
+        Creates the directories of the files to download and links the files which are already downloaded.
+        With `create_files` the files to download are created empty, such that opening them can start streaming them.
+        """
+        to_create: List[MediaContainer] = []
+        to_link: List[Tuple[MediaContainer, MediaContainer]] = []
+        for container in containers:
+            if container.should_download:
+                to_create.append(container)
+            else:
+                to_link.extend((container, con) for con in container._links if con.should_download)
+
+        # Only the directories that are written to are created. Every one of them once.
+        make_parent_directories(chain((container.path for container in to_create), *((container.path, con.path) for container, con in to_link)))
+
+        if create_files:
+            for container in to_create:
+                container.path.open("w").close()
+
+        for container, con in to_link:
+            if con._done:
+                continue
+
+            if not container.path.exists():
+                container.path.open("w").close()
+
+            con.hardlink(container)
+
+    @staticmethod
+    def post_metadata(helper: RequestHelper, collapsed_containers: List[MediaContainer]) -> None:
+        # Log the metadata
+        conf = config.to_dict()
+        del conf["password"]
+
+        logger.post({
+            "num_g_files": len(collapsed_containers),
+            "num_c_files": len(collapsed_containers),
+
+            "total_g_bytes": sum((item.size for item in collapsed_containers)),
+            "total_c_bytes": sum((item.size for item in collapsed_containers)),
+
+            "course_ids": sorted([course.course_id for course in helper._courses]),
+
+            "config": conf,
+        })
 
     @staticmethod
     def message_what_did_i_do(collapsed_containers: List[MediaContainer]) -> None:
@@ -1232,6 +3513,17 @@ Newly discovered files:
         except OSError:
             pass
 
+    @staticmethod
+    def message_verbose_report(helper: RequestHelper) -> None:
+        if not args.verbose:
+            return
+
+        report = helper.verbose_report()
+        if CourseDownloader.lanes is not None:
+            report.extend(CourseDownloader.lanes.report())
+
+        print("\n" + "\n".join(report))
+
     def stream_files(self, files: Dict[MediaType, List[MediaContainer]], throttler: DownloadThrottler, status: DownloadStatus, session: SessionWithKey) -> None:
         if is_windows or is_macos:
             return
@@ -1242,7 +3534,7 @@ Newly discovered files:
             def __init__(self, files: List[MediaContainer], throttler: DownloadThrottler, session: SessionWithKey, **kwargs: Any):
                 self.session = session
                 self.throttler = throttler
-                self.files: Dict[Path, MediaContainer] = {file.path: file for file in files}
+                self.files: Dict[str, MediaContainer] = {str(file.path): file for file in files}
 
                 super().__init__(**kwargs)
 
@@ -1250,7 +3542,7 @@ Newly discovered files:
                 if event.dir:
                     return
 
-                file = self.files.get(Path(event.pathname), None)
+                file = self.files.get(event.pathname, None)
                 if file is not None and file.current_size is not None:
                     return
 
@@ -1270,138 +3562,50 @@ Newly discovered files:
 
         notifier.loop()
 
-    def download_files(self, files: Dict[MediaType, List[MediaContainer]], throttler: DownloadThrottler, session: SessionWithKey, status: DownloadStatus) -> None:
-        # TODO: Dynamic calculation of num threads such that optimal Internet Usage is achieved
-        exception_lock = Lock()
-
-        def download(file: MediaContainer) -> bool:
-            if enable_multithread:
-                thread_id = int(current_thread().name.split("T_")[-1])
-            else:
-                thread_id = 0
-
-            status.add_container(thread_id, file)
-            try:
-                exit_ = file.download(throttler, session)
-                status.done(thread_id, file)
-                return exit_
-
-            except Exception as ex:
-                with exception_lock:
-                    generate_error_message(ex)
-
-        # TODO: Refactor this into a `sorted` expression with file.should_download as key.
-        first_files: List[MediaContainer] = []
-        second_files: List[MediaContainer] = []
-
-        for _files in files.values():
-            for file in _files:
-                if not file.should_download:
-                    first_files.append(file)
-                else:
-                    second_files.append(file)
+    _exception_lock = Lock()
 
+    @staticmethod
+    def download_file(file: MediaContainer, throttler: DownloadThrottler, session: SessionWithKey, status: DownloadStatus) -> bool:
         if enable_multithread:
-            with ThreadPoolExecutor(args.max_num_threads, thread_name_prefix="T") as ex:
-                list(ex.map(download, first_files + second_files))
+            thread_id = int(current_thread().name.split("T_")[-1])
         else:
-            for file in first_files + second_files:
-                download(file)
-
-    def _download_files(self, files: Dict[MediaType, List[MediaContainer]], throttler: DownloadThrottler, session: SessionWithKey, status: DownloadStatus) -> None:
+            thread_id = 0
 
-        # The threads only have to be re-filled once there is an item in ret_q.
-        # → The entire process could be blocking instead of active waiting
-        # → One could always store the bandwidth from before and evaluate on waking if there was a speedup
+        status.add_container(thread_id, file)
+        try:
+            exit_ = file.download(throttler, session)
+            status.done(thread_id, file)
+            return exit_
 
-        # We have to be explorative in + and - directions:
-        #   If we are currently at the maximum number of threads recorded, then sometimes just add a thread.
+        except Exception as ex:
+            with CourseDownloader._exception_lock:
+                generate_error_message(ex)
 
-        # Too many threads don't hurt: They just Make stopping the download slower.
+    def download_queue(self, lanes: DownloadLanes, throttler: DownloadThrottler, session: SessionWithKey, status: DownloadStatus) -> None:
+        """
+        Downloads the files of the lanes until they are closed.
+        """
+        CourseDownloader.lanes = status.lanes = lanes
+        DownloadController(throttler, args.max_num_threads).run(lanes, lambda file: self.download_file(file, throttler, session, status))
 
-        # Maybe add in two phases: First download all small files → (Everything below 30M?), then the big one.
-        # Use the same algorithm but with the maximum number of threads doubled.
+    def download_files(self, files: Dict[MediaType, List[MediaContainer]], throttler: DownloadThrottler, session: SessionWithKey, status: DownloadStatus) -> None:
+        def download(file: MediaContainer) -> bool:
+            return self.download_file(file, throttler, session, status)
 
-        # TODO: Add extern + corrupted + documents
-        files_to_download = files[MediaType.video]
-        files_to_download.sort(key=lambda it: it.should_download)
+        lanes = DownloadLanes()
+        for _files in files.values():
+            for file in _files:
+                lanes.put(file)
 
-        ret_q: Queue[Tuple[int, bool]] = Queue()
+        lanes.put(None)
+        CourseDownloader.lanes = status.lanes = lanes
 
         if enable_multithread:
-            threads = [Downloader(Queue(), ret_q, i, status, throttler, session) for i in range(args.max_num_threads)]
-
+            DownloadController(throttler, args.max_num_threads).run(lanes, download)
         else:
-            threads = [Downloader(Queue(), ret_q, 0, status, throttler, session)]
-
-        i = 0
-        for i in range(args.max_num_threads // 2):
-            threads[i].q.put(files_to_download.pop(0))
-
-        num_threads_downloading = i + 1
-
-        def eval_spawn_next_thread() -> Optional[bool]:
-            # TODO
-            # 2. Predict in which direction to 'jump'
-
-            num_times_counted
-            bandwidths
-
-            weights: Dict[Optional[bool], float] = {False: 0.0, True: 0.0, None: 0.0}
-
-            # Score metric consisting of
-            #   - number of times already sampled
-            #   - Expected utility → Fewer threads = better
-            if num_threads_downloading + 1 in bandwidths:
-                weights[True] += -2 * math.log(num_times_counted[num_threads_downloading + 1]) + 2
-
-            else:
-                weights[True] += 3
-
-            if num_threads_downloading - 1 in bandwidths:
-                weights[False] += -2 * math.log(num_times_counted[num_threads_downloading - 1]) + 2
-
-            else:
-                weights[False] += 3
-
-            choice = random.choices(list(weights.keys()), list(weights.values()))
-            return choice[0]
-
-        bandwidths: Dict[int, float] = {}
-        num_times_counted: Dict[int, int] = {}
-        time_last_measurement = time.perf_counter()
-
-        while files_to_download:
-            thread_id_woken_up, was_successful = ret_q.get()
-
-            if was_successful:
-                # Measure the bandwidth
-                time_taken = min(time.perf_counter() - time_last_measurement, token_queue_download_refresh_rate)
-                timestamps = [item for item in throttler.timestamps if time.perf_counter() - item < time_taken]
-
-                bandwidth_used = float(len(timestamps) * download_chunk_size / token_queue_download_refresh_rate)
-
-                if num_threads_downloading not in bandwidths:
-                    bandwidths[num_threads_downloading] = bandwidth_used
-                    num_times_counted[num_threads_downloading] = len(timestamps)
-                else:
-                    bandwidths[num_threads_downloading] = bandwidths[num_threads_downloading] * (1 - bandwidth_download_files_mavg_perc) + bandwidth_used * bandwidth_download_files_mavg_perc
-                    num_times_counted[num_threads_downloading] += len(timestamps)
-
-            spawn = eval_spawn_next_thread()
-
-            if spawn is True and num_threads_downloading < args.max_num_threads:
-                threads[thread_id_woken_up].q.put(files_to_download.pop(0))
-                threads[num_threads_downloading].q.put(files_to_download.pop(0))
-                num_threads_downloading += 1
-
-            elif spawn is False and num_threads_downloading > 1:
-                num_threads_downloading -= 1
-
-            else:
-                threads[thread_id_woken_up].q.put(files_to_download.pop(0))
-
-            time_last_measurement = time.perf_counter()
+            while (next_file := lanes.get(1)) is not None:
+                download(next_file)
+                lanes.done(next_file)
 
     @staticmethod
     @on_kill(2)
@@ -1428,9 +3632,12 @@ Newly discovered files:
 def maybe_create_log_file() -> None:
     if not path(log_file_location).exists():
         with path(log_file_location).open("w") as f:
-            containers = [MediaContainer(*item) for item in database_helper._url_container_mapping.values()]
-            # When getting the container mapping the media_type will be an integer corresponding to the media type.
-            containers = [item for item in containers if item.media_type != MediaType.corrupted.value]  # type: ignore
+            # The courses are not known yet → the course id is used in their place.
+            containers = [
+                MediaContainer(name, url, download_url, Path(location), time, course_id, MediaType(media_type), size, checksum)  # type: ignore[arg-type]
+                for name, url, download_url, location, time, course_id, media_type, size, checksum in database_helper._url_container_mapping.values()
+                if media_type != MediaType.corrupted.value
+            ]
 
             f.write(f"===== {datetime.now().strftime(datetime_str)} =====\n\n")
             f.write("Detected that the log file does not exist.\nHere is what I currently have in the database:\n\n")
@@ -6,13 +6,12 @@ import time
 from datetime import datetime, timedelta
 from threading import Thread, Lock
 from typing import List, Optional, Dict, Any, TYPE_CHECKING
-from urllib.parse import urlparse
 
 from isisdl.settings import status_chop_off, is_windows, status_time, status_progress_bar_resolution, is_testing, course_pad_minimum_width, hostname_pad_minimum_width
 from isisdl.utils import clear, HumanBytes, args, MediaType, DownloadThrottler
 
 if TYPE_CHECKING:
-    from isisdl.backend.request_helper import MediaContainer, PreMediaContainer, RequestHelper
+    from isisdl.backend.request_helper import MediaContainer, PreMediaContainer, RequestHelper, DownloadLanes
 
 
 def maybe_chop_off_str(st: str, width: int) -> str:
@@ -203,8 +202,14 @@ class DownloadStatus(Status):
 
         self.thread_files: Dict[int, Optional[MediaContainer]] = {i: None for i in range(num_threads)}
         self.stream_file: Optional[MediaContainer] = None
+        self.lanes: Optional[DownloadLanes] = None
         super().__init__("Downloading content", total=len(self.files))
 
+    def add_files(self, files: List[MediaContainer]) -> None:
+        with self._lock:
+            self.files.extend(files)
+            self.total = len(self.files)
+
     def add_container(self, thread_id: int, container: MediaContainer) -> None:
         self.thread_files[thread_id] = container
 
@@ -248,9 +253,18 @@ class DownloadStatus(Status):
         log_strings.append(f"Done in: {timedelta(seconds=int((total_size - downloaded_bytes) / max(self.throttler.bandwidth_used, 1)))}")
         log_strings.append("")
 
+        # The utilization of every host that is downloaded from
+        hosts = self.lanes.utilization() if self.lanes is not None else []
+        if len(hosts) > 1:
+            host_pad = max(max(len(host) for host, *_ in hosts), hostname_pad_minimum_width)
+            for host, num_busy, max_connections, num_pending in hosts:
+                log_strings.append(f"{host:<{host_pad}}  {num_busy} / {max_connections} connections  {num_pending} files waiting")
+
+            log_strings.append("")
+
         # Now determine the already downloaded amount and display it
         course_pad = max(max(len(str(item.course)) if item is not None else 1 for item in self.thread_files.values()), course_pad_minimum_width)
-        hostname_pad = max(max(len(urlparse(item.url).hostname or "") if item is not None else 1 for item in self.thread_files.values()), hostname_pad_minimum_width)
+        hostname_pad = max(max(len(item.host) if item is not None else 1 for item in self.thread_files.values()), hostname_pad_minimum_width)
 
         for thread_id, container in self.thread_files.items():
             if container is None:
@@ -15,7 +15,7 @@ from typing import List, Tuple, Optional, Dict, DefaultDict, Set, Union
 from isisdl.backend.crypt import get_credentials
 from isisdl.backend.request_helper import RequestHelper, MediaContainer
 from isisdl.backend.status import RequestHelperStatus, Status
-from isisdl.settings import database_file_location, lock_file_location, enable_multithread, log_file_location
+from isisdl.settings import database_file_location, lock_file_location, enable_multithread, log_file_location, download_part_suffix
 from isisdl.utils import path, calculate_local_checksum, database_helper, sanitize_name, do_ffprobe, get_input, MediaType, HumanBytes
 
 _checksum_cache: Dict[Path, str] = {}
@@ -66,7 +66,7 @@ def restore_file(
         file: Path, filename_mapping: Dict[Path, MediaContainer], files_for_course: Dict[Path, DefaultDict[int, List[MediaContainer]]], checksums: Set[str], status: Optional[Status] = None
 ) -> Tuple[Optional[FileStatus], Union[Path, MediaContainer]]:
     try:
-        if file in not_considered_files:
+        if file in not_considered_files or file.name.endswith(download_part_suffix):
             return None, file
         if not os.path.exists(file):
             return None, file
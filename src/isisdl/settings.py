@@ -12,7 +12,7 @@ from collections import defaultdict
 from hashlib import sha256
 from http.client import HTTPSConnection
 from pathlib import Path
-from typing import Any, DefaultDict, Dict, Optional, Set
+from typing import Any, DefaultDict, Dict, List, Optional, Set
 
 import psutil as psutil
 from cryptography.hazmat.primitives.hashes import SHA3_512
@@ -106,6 +106,10 @@ checksum_num_bytes = 1024 * 500
 # If the file size is not equal, but it is in this percentage the checksum will be computed in order to
 perc_diff_for_checksum = 0.1  # 10% ± is allowed
 
+# Compute the checksum of a downloaded file while downloading it, instead of reading the file again afterwards.
+# Resumed and segmented downloads are still read again.
+enable_inline_checksums = True
+
 # -/- Checksum options ---
 
 
@@ -121,6 +125,17 @@ master_password = "eeb36e726e3ffec16da7798415bb4e531bf8a57fbe276fcc3fc6ea986cb02
 
 # -/- Password options ---
 
+# --- Session options ---
+
+# Reuse the cookies, session key and token of the last login instead of going through the Shibboleth login every time.
+enable_session_cache = True
+
+# A cached session older than ↓ seconds is not trusted anymore.
+# The token is validated before it is used, but the validity of the cookies can't be checked for free.
+session_cache_max_age = 4 * 60 * 60
+
+# -/- Session options ---
+
 # --- Status options ---
 
 # The number of spaces a general status has.
@@ -143,12 +158,41 @@ status_time = 0.2 if not is_windows else 0.75
 
 # --- Download options ---
 
-# Chunks of this size are read and saved to file.
+# Chunks of (at least) this size are read and saved to file. A token of the DownloadThrottler is worth as many bytes.
 download_chunk_size = 2 ** 16
 
+# Without a download limit the chunks grow up to ↓ bytes as long as one is read within ↓↓ s.
+download_max_chunk_size = 2 ** 20
+download_chunk_target_time = 0.05
+
 # Number of threads to discover download urls.
 discover_num_threads = 32
 
+# If enabled, the discovery is scheduled by an asyncio event loop instead of the two thread pools.
+# Probing the files of a course starts as soon as its content is available, without waiting for the other courses.
+# The requests themselves are still blocking and run on a thread pool.
+discover_use_asyncio = False
+
+# The maximum number of requests the asyncio discovery keeps in flight at once. Per host, they are also limited to its pool size (see ↓).
+discover_async_max_in_flight = 128
+
+# The number of connections kept alive per host. Hosts not listed in `session_host_pool_sizes` use the default.
+session_default_pool_size = 16
+session_host_pool_sizes: Dict[str, int] = {
+    "isis.tu-berlin.de": 64,
+    "tubcloud.tu-berlin.de": 8,
+    "drive.google.com": 8,
+}
+
+# The maximum number of requests per host that wait for their response headers at once. Hosts not listed are not limited.
+# Streamed bodies are not covered by this limit, they are read after the request has returned.
+session_host_max_concurrency: Dict[str, int] = {
+    "tubcloud.tu-berlin.de": 8,
+}
+
+# The number of hosts for which connections are kept alive at once.
+session_max_num_pools = 256
+
 # Will fail a download if ISIS is not responding in
 """
 for i in range(num_tries_download):
@@ -158,14 +202,121 @@ num_tries_download = 4
 download_timeout = 10
 download_timeout_multiplier = 2
 
-# If a download fails (`except Exception`) will wait ↓ and retry.
-download_static_sleep_time = 3
+# If a request fails (`except Exception`) it is retried after an exponential backoff with jitter:
+"""
+random.uniform(0, min(download_backoff_max, download_backoff_base * 2 ** i))
+"""
+download_backoff_base = 0.5
+download_backoff_max = 8
+
+# Responses with these status codes are retried as well. A `Retry-After` header is honored, but never waited for longer than ↓.
+download_retry_status_codes = {429, 502, 503, 504}
+download_retry_after_max = 30
+
+# After ↓ consecutive failed requests to a host, every further request to it fails fast for `circuit_breaker_cooldown` s.
+# Once the cooldown passed, a single request is let through to probe the host.
+# Error responses only count once per url, so a single dead url can't take the host down. Connection errors always count.
+circuit_breaker_threshold = 6
+circuit_breaker_cooldown = 60
+
+# Get the contents of the courses with batched calls to the AJAX service (`lib/ajax/service.php`) instead of one REST call per course.
+discover_use_ajax_batches = True
+
+# The courses are spread over at least ↓ batches (if possible), so they can be requested in parallel. A batch carries at most ↓↓ courses.
+# Batches that fail are split in half, courses that still fail fall back to the REST call.
+discover_ajax_min_num_batches = 4
+discover_ajax_max_batch_size = 16
+
+# Only refetch the contents of courses that changed since their last sync (`core_course_get_updates_since`). The others reuse their stored containers.
+# Moodle does not track every change (e.g. section summaries), so every course is fully refetched after ↓ s.
+enable_incremental_discovery = True
+course_sync_max_age = 7 * 24 * 60 * 60
+
+# If the contents of a course hash to the same value as last time, the stored containers are used instead of parsing them again.
+enable_content_hash_cache = True
+
+# The contents of the courses are requested longest-expected-first, so a single large course can't delay the whole discovery by being requested last.
+# The expected time is a moving average of the previous discovery times. The newest one is weighted by ↓.
+enable_latency_scheduling = True
+course_latency_mavg_perc = 0.5
+
+# Start downloading the files of a course as soon as it is discovered, instead of waiting for all courses. Not used when streaming.
+enable_pipelined_download = False
+
+# Find links in the contents of a course by looking at the html / text of every field instead of running `url_finder` over the whole contents.
+enable_structured_link_extraction = True
+
+# Files that are not listed by ISIS are probed with a HEAD request, then with a GET of the first byte and only then with a plain GET.
+# Hosts that mishandle a cheaper request are remembered and it is skipped for them.
+enable_cheap_probes = True
+
+# Files that were probed with a request (external links) are re-checked after ↓ s.
+# This is done with a conditional request (ETag / Last-Modified), so unchanged files cost neither the body nor a database write.
+enable_revalidation = True
+revalidation_interval = 24 * 60 * 60
+
+# Files are downloaded to `<name>.part` and renamed once they are complete. A download that broke off (or a killed run) is resumed with a
+# range request, if the server confirms that the file did not change in the meantime (`If-Range`). Not used when streaming.
+enable_resumable_downloads = True
+download_part_suffix = ".part"
+
+# The .part file of a download of at least ↓ bytes is preallocated with `posix_fallocate`, such that it is not fragmented.
+# A preallocated .part file is cut to the received bytes once the download stops. After a crash its size is the full size → it is downloaded again.
+enable_preallocation = True
+preallocation_min_size = 1024 ** 2
+
+# When downloaded files are written to the disk: "none" leaves it to the operating system, "file" syncs every file before it is moved into place,
+# "batch" syncs ↓ files at once (and the remaining ones at the end).
+download_fsync_policy = "none"
+download_fsync_batch_size = 64
+
+# Files larger than ↓ bytes are downloaded over multiple connections, each of them requesting pieces of ↓↓ bytes. Not used on Windows.
+# Starting with a single connection, one is added every ↓↓↓↓ s as long as the last one raised the throughput by at least ↓↓↓↓↓ (up to ↓↓↓ connections).
+# Servers which don't support ranges are downloaded with a single stream.
+enable_segmented_downloads = True
+segmented_download_min_size = 64 * 1024 ** 2
+segmented_download_piece_size = 8 * 1024 ** 2
+segmented_download_max_connections = 6
+segmented_download_adapt_interval = 1
+segmented_download_min_gain = 0.15
+
+# The number of download threads (at most `--max-num-threads`) starts at ↓ and is adapted every ↓↓ s to the measured goodput.
+# A thread is added as long as that raised the goodput by at least ↓↓↓. If the goodput falls by as much, the number of threads is multiplied by ↓↓↓↓.
+# When an added thread did not help, it is removed again and the next one is tried after ↓↓↓↓↓ intervals.
+download_controller_initial_num_threads = 2
+download_controller_interval = 2
+download_controller_min_gain = 0.1
+download_controller_decrease_factor = 0.5
+download_controller_hold_intervals = 5
+
+# Files of at least ↓ bytes are downloaded in a separate lane, using up to ↓↓ of the download threads. Idle threads take files of the other lane.
+enable_download_lanes = True
+download_large_file_size = 32 * 1024 ** 2
+download_large_lane_share = 0.34
+
+# Every host has its own queue. While more than one host has files left, the hosts take turns, each with at most ↓ downloads at once
+# (up to ↓↓ once it is learned that more help). Downloads are summed up to samples of at least ↓↓↓ bytes to learn it:
+# If the throughput of the host rose by ↓↓↓↓ with the last connection, another one is allowed.
+enable_host_fair_share = True
+host_initial_max_connections = 2
+host_max_connections = 6
+host_min_sample_size = 256 * 1024
+host_min_gain = 0.1
+host_throughput_mavg_perc = 0.3
+
+# A file of at least ↓ bytes is looked for among the files which are already downloaded (in any course) before downloading it.
+# Files of the exact same size whose name is at least ↓↓ similar are candidates. Up to ↓↓↓ of them, the most similar first, are compared with the file on the server:
+# If its first, middle and last ↓↓↓↓ bytes (requested with `Range`) match those of the candidate, and the candidate still matches the checksum it was downloaded with,
+# the candidate is copied instead of downloading the file. The copy shares the data copy-on-write where the file system supports it. It is never hard linked: Editing one would change both.
+enable_deduplication = True
+deduplication_min_size = 256 * 1024
+deduplication_min_name_similarity = 0.6
+deduplication_max_candidates = 3
+deduplication_sample_size = 64 * 1024
 
 # Moving average percent for the bandwidth calculation
 bandwidth_mavg_perc = 0.2
 
-bandwidth_download_files_mavg_perc = 0.6
-
 # -/- Download options ---
 
 
@@ -221,44 +372,43 @@ systemd_service_file_location = os.path.join(systemd_dir_location, "isisdl.servi
 _url_finder = r"""(?i)\b((?:https?:(?:/{1,3}|[a-z0-9%])|[a-z0-9.\-]+[.](?:com|net|org|edu|gov|mil|aero|asia|biz|cat|coop|info|int|jobs|mobi|museum|name|post|pro|tel|travel|xxx|ac|ad|ae|af|ag|ai|al|am|an|ao|aq|ar|as|at|au|aw|ax|az|ba|bb|bd|be|bf|bg|bh|bi|bj|bm|bn|bo|br|bs|bt|bv|bw|by|bz|ca|cc|cd|cf|cg|ch|ci|ck|cl|cm|cn|co|cr|cs|cu|cv|cx|cy|cz|dd|de|dj|dk|dm|do|dz|ec|ee|eg|eh|er|es|et|eu|fi|fj|fk|fm|fo|fr|ga|gb|gd|ge|gf|gg|gh|gi|gl|gm|gn|gp|gq|gr|gs|gt|gu|gw|gy|hk|hm|hn|hr|ht|hu|id|ie|il|im|in|io|iq|ir|is|it|je|jm|jo|jp|ke|kg|kh|ki|km|kn|kp|kr|kw|ky|kz|la|lb|lc|li|lk|lr|ls|lt|lu|lv|ly|ma|mc|md|me|mg|mh|mk|ml|mm|mn|mo|mp|mq|mr|ms|mt|mu|mv|mw|mx|my|mz|na|nc|ne|nf|ng|ni|nl|no|np|nr|nu|nz|om|pa|pe|pf|pg|ph|pk|pl|pm|pn|pr|ps|pt|pw|py|qa|re|ro|rs|ru|rw|sa|sb|sc|sd|se|sg|sh|si|sj|Ja|sk|sl|sm|sn|so|sr|ss|st|su|sv|sx|sy|sz|tc|td|tf|tg|th|tj|tk|tl|tm|tn|to|tp|tr|tt|tv|tw|tz|ua|ug|uk|us|uy|uz|va|vc|ve|vg|vi|vn|vu|wf|ws|ye|yt|yu|za|zm|zw)/)(?:[^\s()<>{}\[\]]+|\([^\s()]*?\([^\s()]+\)[^\s()]*?\)|\([^\s]+?\))+(?:\([^\s()]*?\([^\s()]+\)[^\s()]*?\)|\([^\s]+?\)|[^\s`!()\[\]{};:'".,<>?«»“”‘’])|(?:(?<!@)[a-z0-9]+(?:[.\-][a-z0-9]+)*[.](?:com|net|org|edu|gov|mil|aero|asia|biz|cat|coop|info|int|jobs|mobi|museum|name|post|pro|tel|travel|xxx|ac|ad|ae|af|ag|ai|al|am|an|ao|aq|ar|as|at|au|aw|ax|az|ba|bb|bd|be|bf|bg|bh|bi|bj|bm|bn|bo|br|bs|bt|bv|bw|by|bz|ca|cc|cd|cf|cg|ch|ci|ck|cl|cm|cn|co|cr|cs|cu|cv|cx|cy|cz|dd|de|dj|dk|dm|do|dz|ec|ee|eg|eh|er|es|et|eu|fi|fj|fk|fm|fo|fr|ga|gb|gd|ge|gf|gg|gh|gi|gl|gm|gn|gp|gq|gr|gs|gt|gu|gw|gy|hk|hm|hn|hr|ht|hu|id|ie|il|im|in|io|iq|ir|is|it|je|jm|jo|jp|ke|kg|kh|ki|km|kn|kp|kr|kw|ky|kz|la|lb|lc|li|lk|lr|ls|lt|lu|lv|ly|ma|mc|md|me|mg|mh|mk|ml|mm|mn|mo|mp|mq|mr|ms|mt|mu|mv|mw|mx|my|mz|na|nc|ne|nf|ng|ni|nl|no|np|nr|nu|nz|om|pa|pe|pf|pg|ph|pk|pl|pm|pn|pr|ps|pt|pw|py|qa|re|ro|rs|ru|rw|sa|sb|sc|sd|se|sg|sh|si|sj|Ja|sk|sl|sm|sn|so|sr|ss|st|su|sv|sx|sy|sz|tc|td|tf|tg|th|tj|tk|tl|tm|tn|to|tp|tr|tt|tv|tw|tz|ua|ug|uk|us|uy|uz|va|vc|ve|vg|vi|vn|vu|wf|ws|ye|yt|yu|za|zm|zw)\b/?(?!@)))"""  # noqa
 url_finder = re.compile(_url_finder)
 
+# A much simpler (and faster) version of the above: Only finds urls with a scheme. The trailing punctuation is stripped afterwards.
+url_tokenizer = re.compile(r"""https?://[^\s<>"'`{}|\\^\[\]]+""", re.IGNORECASE)
+
 # Testing urls to be excluded. We know that they will not lead to a valid download.
 testing_bad_urls: Set[str] = {
     'https://tubcloud.tu-berlin.de/s/d8R6wdi2sTt5Jrj',
 }
 
-# In order to maintain a sense of order in the regex it is indented. Flake8 / PyCharm formatter do not seem to like that ...
-# @formatter:off
-
-# Regex to ignore a url depending on if there is some content
-isis_ignore = re.compile(
-    r".*isis\.tu-berlin\.de/(?:"
-        "mod/(?:"  # noqa:E131
-            "forum|choicegroup|assign|feedback|choice|quiz|glossary|questionnaire|scorm"  # noqa:E131
-            "|etherpadlite|lti|h5pactivity|page|data|ratingallocate|book|videoservice|lesson|wiki"
-            "|organizer|registration|journal|workshop|survey|"
-        ")"
-    "|"
-        "availability/condition/shibboleth2fa"
-    "|"
-        "h5p"
-    "|"
-        "theme/image.php"
-    "|"
-    ")/.*"
-)
-# @formatter:on
-
-regex_is_isis_document = re.compile(
-    r".*isis\.tu-berlin\.de/(?:webservice/|)pluginfile\.php/.*"
-)
-
-extern_ignore = re.compile(
-    ".*(?:"
-    "tu-berlin.zoom.us|moseskonto.tu-berlin.de|befragung.tu-berlin.de|tu-berlin.webex.com|git.tu-berlin.de|tubmeeting.tu-berlin.de"
-    "|wikipedia.org|github.com|gitlab.tubit.tu-berlin.de|kahoot.it|www.python.org|www.anaconda.com|miro.com"
-    ").*"
-)
-
+# URLs are ignored / classified by the host and the beginning of the path. A rule is either `host` or `host/path/prefix/`.
+# A rule for a host also applies to all of its subdomains. Matching a url is a lookup per label of the host and per segment of the path.
+
+# Modules on ISIS without downloadable content
+isis_ignore_rules = [
+    *(f"isis.tu-berlin.de/mod/{it}/" for it in [
+        "forum", "choicegroup", "assign", "feedback", "choice", "quiz", "glossary", "questionnaire", "scorm",
+        "etherpadlite", "lti", "h5pactivity", "page", "data", "ratingallocate", "book", "videoservice", "lesson", "wiki",
+        "organizer", "registration", "journal", "workshop", "survey",
+    ]),
+    "isis.tu-berlin.de/availability/condition/shibboleth2fa/",
+    "isis.tu-berlin.de/h5p/",
+    "isis.tu-berlin.de/theme/image.php/",
+]
+
+# External hosts that never lead to a download
+extern_ignore_rules = [
+    "tu-berlin.zoom.us", "moseskonto.tu-berlin.de", "befragung.tu-berlin.de", "tu-berlin.webex.com", "git.tu-berlin.de", "tubmeeting.tu-berlin.de",
+    "wikipedia.org", "github.com", "gitlab.tubit.tu-berlin.de", "kahoot.it", "www.python.org", "www.anaconda.com", "miro.com",
+]
+
+# Additional rules to ignore urls. Set them in the config file.
+user_ignore_rules: List[str] = []
+
+# Links to these are documents hosted on ISIS
+isis_document_rules = [
+    "isis.tu-berlin.de/pluginfile.php/",
+    "isis.tu-berlin.de/webservice/pluginfile.php/",
+]
 
 # -/- Regex stuff ---
 
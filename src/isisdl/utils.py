@@ -20,19 +20,21 @@ import subprocess
 import sys
 import time
 import traceback
-from collections import defaultdict
+from collections import defaultdict, deque
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from functools import wraps
-from itertools import repeat
+from hashlib import sha256
+from html.parser import HTMLParser
+from itertools import repeat, chain
 from packaging import version
 from packaging.version import Version
 from pathlib import Path
 from queue import PriorityQueue, Queue, Full, Empty
 from requests import Session
 from tempfile import TemporaryDirectory
-from threading import Thread
-from typing import Callable, List, Tuple, Dict, Any, Set, cast, Iterable, NoReturn, TYPE_CHECKING, DefaultDict
+from threading import Thread, Lock
+from typing import Callable, List, Tuple, Dict, Any, Set, cast, Iterable, NoReturn, TYPE_CHECKING, DefaultDict, Deque, BinaryIO
 from typing import Optional, Union
 from urllib.parse import unquote, parse_qs, urlparse
 
@@ -43,7 +45,8 @@ from isisdl.settings import download_chunk_size, token_queue_download_refresh_ra
 from isisdl.settings import working_dir_location, is_windows, checksum_algorithm, checksum_num_bytes, example_config_file_location, config_dir_location, database_file_location, status_time, \
     discover_num_threads, status_progress_bar_resolution, download_progress_bar_resolution, config_file_location, is_first_time, is_autorun, parse_config_file, lock_file_location, \
     enable_lock, error_directory_location, systemd_dir_location, master_password, is_testing, systemd_timer_file_location, systemd_service_file_location, export_config_file_location, \
-    python_executable, is_static, enable_multithread, subscribe_num_threads, subscribed_courses_file_location, error_text, token_queue_refresh_rate
+    python_executable, is_static, enable_multithread, subscribe_num_threads, subscribed_courses_file_location, error_text, token_queue_refresh_rate, \
+    url_tokenizer, isis_ignore_rules, extern_ignore_rules, user_ignore_rules, isis_document_rules
 from isisdl.version import __version__
 
 if TYPE_CHECKING:
@@ -55,8 +58,9 @@ def get_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(prog="isisdl", formatter_class=argparse.RawTextHelpFormatter, description="""
     This program downloads and synchronizes all of your ISIS content.""")
 
-    parser.add_argument("-t", "--max-num-threads", help="The maximum number of threads to spawn (for downloading files)\n ", type=int, default=3, metavar="{num}")
+    parser.add_argument("-t", "--max-num-threads", help="The maximum number of threads to spawn (for downloading files)\n ", type=int, default=8, metavar="{num}")
     parser.add_argument("-d", "--download-rate", help="Limits the download rate to {num} MiB/s\n ", type=float, default=None, metavar="{num}")
+    parser.add_argument("--verbose", help="Prints statistics about the requests and downloads after the run\n ", action="store_true")
 
     operations = parser.add_mutually_exclusive_group()
 
@@ -752,6 +756,69 @@ def path(*args: str) -> Path:
     return Path(working_dir_location, *args)
 
 
+def make_parent_directories(files: Iterable[Path]) -> None:
+    """
+    Creates the parent directories of the files. Directories that are shared by multiple files are only created once.
+    """
+    for directory in {file.parent for file in files}:
+        os.makedirs(directory, exist_ok=True)
+
+
+def preallocate(fd: int, offset: int, length: int) -> bool:
+    """
+    Reserves `length` bytes from `offset` on for the file, such that it is not fragmented. The file is extended to `offset + length` bytes.
+    Returns if it was possible: Not every platform and file system supports it.
+    """
+    if not hasattr(os, "posix_fallocate") or length <= 0:
+        return False
+
+    try:
+        os.posix_fallocate(fd, offset, length)
+        return True
+
+    except OSError:
+        return False
+
+
+# The `ioctl` which makes a file share the data of another one (Linux: btrfs, XFS, …).
+FICLONE = 0x40049409
+
+
+def clone_file(source: BinaryIO, target: BinaryIO) -> None:
+    """
+    Copies `source` into the empty file `target`. If the file system supports it, the data is shared copy-on-write instead of copied (a reflink).
+    Unlike with a hard link, changing either file later never changes the other one.
+    """
+    if not is_windows:
+        import fcntl
+
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+            return
+
+        except OSError:
+            pass
+
+    shutil.copyfileobj(source, target)
+
+
+def fsync_path(file: Path) -> None:
+    """
+    Writes the file or directory to the disk. Directories can't be opened on Windows → they are skipped.
+    """
+    try:
+        fd = os.open(file, os.O_RDONLY)
+    except OSError:
+        return
+
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
 def normalize_url(url: str) -> str:
     if url.endswith("?forcedownload=1"):
         url = url[:-len("?forcedownload=1")]
@@ -759,6 +826,155 @@ def normalize_url(url: str) -> str:
     return url
 
 
+class LinkExtractor(HTMLParser):
+    """
+    Collects the `href` / `src` attributes of a piece of html and the links in its text.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.links: List[str] = []
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        for name, value in attrs:
+            if name in {"href", "src"} and value is not None and value.lower().startswith(("http://", "https://")):
+                self.links.append(value.strip())
+
+    def handle_data(self, data: str) -> None:
+        self.links.extend(find_text_links(data))
+
+
+def find_text_links(text: str) -> List[str]:
+    links = []
+    for link in url_tokenizer.findall(text):
+        # Strip the trailing punctuation, except for the closing parenthesis of e.g. a wikipedia link.
+        link = link.rstrip(".,;:!?")
+        while link.endswith(")") and link.count("(") < link.count(")"):
+            link = link[:-1].rstrip(".,;:!?")
+
+        links.append(link)
+
+    return links
+
+
+def find_links(content: Any) -> Set[str]:
+    """
+    Finds all links in json content. Every string is looked at separately: html with an html parser, everything else with `url_tokenizer`.
+    """
+    links: Set[str] = set()
+    stack = [content]
+
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            if "://" not in item:
+                continue
+
+            if "<" not in item:
+                links.update(find_text_links(item))
+                continue
+
+            parser = LinkExtractor()
+            try:
+                parser.feed(item)
+                parser.close()
+                links.update(parser.links)
+            except Exception:
+                links.update(find_text_links(item))
+
+        elif isinstance(item, dict):
+            stack.extend(item.values())
+
+        elif isinstance(item, list):
+            stack.extend(item)
+
+    return links
+
+
+# Splits an url into its host and path. Cheaper than `urlparse`, since the query is never looked at.
+_url_host_and_path = re.compile(r"[a-zA-Z][a-zA-Z0-9+.\-]*://(?:[^/?#@]*@)?([^/?#:\[\]]*)(?::\d*)?([^?#]*)")
+
+
+class UrlFilter:
+    """
+    Matches urls against rules of the form `host` or `host/path/prefix/` (see `isis_ignore_rules`).
+    The host is parsed once and looked up label by label (so subdomains match as well), the path segment by segment.
+    Every hit is counted per rule.
+    """
+    rules: Dict[str, Dict[str, str]]
+    max_depth: int
+    fingerprint: str
+    hits: DefaultDict[str, int]
+    lock: Lock
+
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self, *rules: Iterable[str]) -> None:
+        self.rules = defaultdict(dict)
+        self.max_depth = 0
+        self.hits = defaultdict(int)
+        self.lock = Lock()
+
+        for rule in chain(*rules):
+            host, _, prefix = rule.strip().partition("/")
+            prefix = "/" + prefix.strip("/") + "/" if prefix.strip("/") else "/"
+
+            self.rules[host.lower()][prefix] = rule
+            self.max_depth = max(self.max_depth, prefix.count("/") - 1)
+
+        # A stable hash of the rules, independent of their order
+        self.fingerprint = sha256("\n".join(sorted(f"{host}{prefix}" for host, prefixes in self.rules.items() for prefix in prefixes)).encode()).hexdigest()[:16]
+
+    def match(self, url: str) -> Optional[str]:
+        """
+        Returns the rule that matched `url` or None.
+        """
+        parts = _url_host_and_path.match(url)
+        if parts is None or not parts[1]:
+            return None
+
+        host, path = parts[1].lower(), parts[2] + "/"
+        while True:
+            prefixes = self.rules.get(host)
+            if prefixes is not None:
+                rule = prefixes.get("/")
+
+                index = 0
+                for _ in range(self.max_depth):
+                    if rule is not None:
+                        break
+
+                    index = path.find("/", index + 1)
+                    if index == -1:
+                        break
+
+                    rule = prefixes.get(path[:index + 1])
+
+                if rule is not None:
+                    with self.lock:
+                        self.hits[rule] += 1
+
+                    return rule
+
+            if "." not in host:
+                return None
+
+            host = host.split(".", 1)[1]
+
+    def report(self, name: str) -> List[str]:
+        with self.lock:
+            hits = sorted(self.hits.items(), key=lambda it: it[1], reverse=True)
+
+        report = [f"{name}: {sum(it[1] for it in hits)} urls matched"]
+        report.extend(f"    {num:>6}  {rule}" for rule, num in hits)
+
+        return report
+
+
+url_ignore = UrlFilter(isis_ignore_rules, extern_ignore_rules, user_ignore_rules)
+isis_documents = UrlFilter(isis_document_rules)
+
+
 def remove_systemd_timer() -> None:
     if not os.path.exists(systemd_timer_file_location):
         return
@@ -1335,6 +1551,8 @@ class DownloadThrottler(Thread):
     This class acts in a way that the download speed is capped at a certain maximum speed.
     It does so by handing out tokens, which are limited.
     With every token you may download a number of bytes.
+
+    The bandwidth is measured with the bytes which were actually downloaded, as reported by `record`.
     """
     download_queue: Queue[Token]
     used_tokens: Queue[Token]
@@ -1343,8 +1561,8 @@ class DownloadThrottler(Thread):
 
     __slots__ = tuple(__annotations__)
 
-    token = Token()
-    timestamps: List[float] = []
+    # (time, number of bytes) of every downloaded chunk in the last `token_queue_download_refresh_rate` s
+    timestamps: Deque[Tuple[float, int]] = deque()
     _streaming_loc: Optional[Path] = None
 
     def __init__(self) -> None:
@@ -1370,8 +1588,8 @@ class DownloadThrottler(Thread):
 
             # Clear old timestamps
             while self.timestamps:
-                if self.timestamps[0] < start - token_queue_download_refresh_rate:
-                    self.timestamps.pop(0)
+                if self.timestamps[0][0] < start - token_queue_download_refresh_rate:
+                    self.timestamps.popleft()
                 else:
                     break
 
@@ -1392,21 +1610,29 @@ class DownloadThrottler(Thread):
         """
         Returns the bandwidth used in bytes / second
         """
-        return float(len(self.timestamps) * download_chunk_size / token_queue_download_refresh_rate)
+        return float(sum(num_bytes for _, num_bytes in list(self.timestamps)) / token_queue_download_refresh_rate)
 
-    def get(self, location: Path) -> Token:
-        try:
-            if self.download_rate == -1 or location == self._streaming_loc:
-                return self.token
+    def bandwidth_since(self, since: float) -> float:
+        """
+        Returns the bandwidth used since `since`, a `time.perf_counter()` at most `token_queue_download_refresh_rate` s ago, in bytes / second
+        """
+        num_bytes = sum(num_bytes for timestamp, num_bytes in list(self.timestamps) if timestamp >= since)
+        return float(num_bytes / max(time.perf_counter() - since, 1e-6))
+
+    def get(self, location: Path, num_bytes: int = download_chunk_size) -> int:
+        """
+        Waits until up to `num_bytes` bytes may be downloaded and returns how many. With a limit, this is at most one token's worth.
+        """
+        if self.download_rate == -1 or location == self._streaming_loc:
+            return num_bytes
 
-            token = self.download_queue.get()
-            self.used_tokens.put(token)
+        token = self.download_queue.get()
+        self.used_tokens.put(token)
 
-            return token
+        return min(token.num_bytes, num_bytes)
 
-        finally:
-            # Only append it at exit
-            self.timestamps.append(time.perf_counter())
+    def record(self, num_bytes: int) -> None:
+        self.timestamps.append((time.perf_counter(), num_bytes))
 
     def start_stream(self, location: Path) -> None:
         self._streaming_loc = location
@@ -35,3 +35,31 @@ def database_helper() -> Any:
 def request_helper(user: User) -> Any:
     helper = RequestHelper(user)
     yield helper
+
+
+@fixture
+def saved_file_tables() -> Any:
+    """
+    Restores the tables dropped by `delete_file_table` after the test, so the state of the other tests is left untouched.
+    """
+    from isisdl.utils import database_helper as helper
+
+    tables = ["fileinfo", "validators", "course_sync", "course_stats", "partial_downloads"]
+    with helper.lock:
+        saved = {table: helper.cur.execute(f"SELECT * FROM {table}").fetchall() for table in tables}
+    validators, containers = dict(helper._validators), dict(helper._url_container_mapping)
+
+    yield
+
+    with helper.lock:
+        for table, rows in saved.items():
+            helper.cur.execute(f"DELETE FROM {table}")
+            if rows:
+                helper.cur.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * len(rows[0]))})", rows)
+
+        helper.con.commit()
+
+    helper._validators.clear()
+    helper._validators.update(validators)
+    helper._url_container_mapping.clear()
+    helper._url_container_mapping.update(containers)
@@ -7,11 +7,22 @@ from cryptography.hazmat.primitives.hashes import SHA3_512
 from isisdl.backend.database_helper import DatabaseHelper
 from isisdl.settings import working_dir_location, _working_dir_location, database_file_location, checksum_algorithm, checksum_num_bytes, password_hash_iterations, \
     password_hash_algorithm, password_hash_length, download_progress_bar_resolution, status_chop_off, status_time, env_var_name_username, env_var_name_password, \
-    enable_multithread, download_chunk_size, download_static_sleep_time, num_tries_download, download_timeout, download_timeout_multiplier, _status_time, config_dir_location, \
+    enable_multithread, download_chunk_size, num_tries_download, download_timeout, download_timeout_multiplier, _status_time, config_dir_location, \
     example_config_file_location, config_file_location, systemd_timer_file_location, systemd_service_file_location, lock_file_location, enable_lock, error_directory_location, master_password, \
     status_progress_bar_resolution, token_queue_refresh_rate, token_queue_download_refresh_rate, discover_num_threads, systemd_dir_location, error_text, \
     throttler_low_prio_sleep_time, subscribed_courses_file_location, subscribe_num_threads, _config_dir_location, _config_file_location, _example_config_file_location, export_config_file_location, \
-    _export_config_file_location, is_static, python_executable, is_autorun
+    _export_config_file_location, is_static, python_executable, is_autorun, discover_use_asyncio, discover_async_max_in_flight, \
+    enable_session_cache, session_cache_max_age, download_backoff_base, download_backoff_max, download_retry_status_codes, download_retry_after_max, circuit_breaker_threshold, \
+    circuit_breaker_cooldown, enable_revalidation, revalidation_interval, discover_use_ajax_batches, discover_ajax_min_num_batches, discover_ajax_max_batch_size, \
+    enable_cheap_probes, enable_incremental_discovery, course_sync_max_age, enable_content_hash_cache, \
+    enable_pipelined_download, enable_structured_link_extraction, \
+    isis_ignore_rules, extern_ignore_rules, user_ignore_rules, isis_document_rules, enable_latency_scheduling, course_latency_mavg_perc, \
+    enable_resumable_downloads, download_part_suffix, enable_segmented_downloads, segmented_download_min_size, segmented_download_piece_size, \
+    segmented_download_max_connections, segmented_download_adapt_interval, segmented_download_min_gain, download_controller_initial_num_threads, download_controller_interval, \
+    download_controller_min_gain, download_controller_decrease_factor, download_controller_hold_intervals, enable_download_lanes, download_large_file_size, \
+    download_large_lane_share, download_max_chunk_size, download_chunk_target_time, enable_inline_checksums, enable_preallocation, preallocation_min_size, \
+    download_fsync_policy, download_fsync_batch_size, enable_host_fair_share, host_initial_max_connections, host_max_connections, host_min_sample_size, host_min_gain, \
+    host_throughput_mavg_perc, enable_deduplication, deduplication_min_size, deduplication_min_name_similarity, deduplication_max_candidates, deduplication_sample_size
 from isisdl.utils import Config
 
 
@@ -40,16 +51,79 @@ def test_settings() -> None:
     assert password_hash_length == 32
     assert master_password == "eeb36e726e3ffec16da7798415bb4e531bf8a57fbe276fcc3fc6ea986cb02e9a"
 
+    assert enable_session_cache is True
+    assert 60 * 60 <= session_cache_max_age <= 8 * 60 * 60
+
     assert 30 <= status_progress_bar_resolution <= 60
     assert 8 <= download_progress_bar_resolution <= 12
     assert 2 <= status_chop_off <= 3
 
     assert 2 ** 15 <= download_chunk_size <= 2 ** 17
+    assert download_chunk_size <= download_max_chunk_size <= 2 ** 24
+    assert 0.01 <= download_chunk_target_time <= 0.5
+    assert enable_inline_checksums is True
+
+    assert enable_preallocation is True
+    assert 0 <= preallocation_min_size <= segmented_download_min_size
+    assert download_fsync_policy in {"none", "file", "batch"}
+    assert 1 <= download_fsync_batch_size <= 1024
+
+    assert enable_host_fair_share is True
+    assert 1 <= host_initial_max_connections <= host_max_connections <= 16
+    assert 64 * 1024 <= host_min_sample_size <= download_large_file_size
+    assert 0 < host_min_gain < 1
+    assert 0 < host_throughput_mavg_perc < 1
+
+    assert enable_deduplication is True
+    assert deduplication_sample_size <= deduplication_min_size <= download_large_file_size
+    assert 0.3 <= deduplication_min_name_similarity < 1
+    assert 1 <= deduplication_max_candidates <= 8
+    assert 4 * 1024 <= deduplication_sample_size <= 1024 ** 2
     assert 16 <= discover_num_threads <= 48
+    assert discover_use_asyncio is False
+    assert 32 <= discover_async_max_in_flight <= 512
+    assert discover_use_ajax_batches is True
+    assert 1 <= discover_ajax_min_num_batches <= discover_num_threads
+    assert 4 <= discover_ajax_max_batch_size <= 64
     assert 3 <= num_tries_download <= 5
     assert 1 <= download_timeout <= 10
     assert 1.5 <= download_timeout_multiplier <= 3.5
-    assert 0 <= download_static_sleep_time <= 4
+    assert 0.1 <= download_backoff_base <= 2
+    assert download_backoff_base <= download_backoff_max <= 30
+    assert {429, 503} <= download_retry_status_codes
+    assert 5 <= download_retry_after_max <= 120
+    assert 3 <= circuit_breaker_threshold <= 20
+    assert 10 <= circuit_breaker_cooldown <= 300
+    assert enable_revalidation is True
+    assert enable_cheap_probes is True
+    assert enable_incremental_discovery is True
+    assert enable_content_hash_cache is True
+    assert enable_pipelined_download is False
+    assert enable_structured_link_extraction is True
+    assert enable_latency_scheduling is True
+    assert 0 < course_latency_mavg_perc <= 1
+    assert enable_resumable_downloads is True
+    assert download_part_suffix.startswith(".")
+
+    assert enable_segmented_downloads is True
+    assert segmented_download_piece_size * 4 <= segmented_download_min_size
+    assert 2 <= segmented_download_max_connections <= 16
+    assert 0.1 <= segmented_download_adapt_interval <= 5
+    assert 0 < segmented_download_min_gain < 1
+
+    assert 1 <= download_controller_initial_num_threads <= 4
+    assert 0.5 <= download_controller_interval <= token_queue_download_refresh_rate
+    assert 0 < download_controller_min_gain < 1
+    assert 0 < download_controller_decrease_factor < 1
+    assert 0 <= download_controller_hold_intervals <= 20
+
+    assert enable_download_lanes is True
+    assert segmented_download_piece_size <= download_large_file_size <= segmented_download_min_size
+    assert 0 < download_large_lane_share < 1
+    assert 24 * 60 * 60 <= course_sync_max_age <= 30 * 24 * 60 * 60
+    assert 60 * 60 <= revalidation_interval <= 7 * 24 * 60 * 60
+    assert user_ignore_rules == []
+    assert all("://" not in rule for rule in isis_ignore_rules + extern_ignore_rules + isis_document_rules)
 
     assert 0.001 <= token_queue_refresh_rate <= 0.2
     assert 1 <= token_queue_download_refresh_rate <= 5
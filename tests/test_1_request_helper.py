@@ -2,14 +2,28 @@ import os
 import random
 import shutil
 import string
-from typing import Any, List, Dict
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import current_thread, Thread, Lock
+from types import SimpleNamespace
+from typing import Any, List, Dict, Optional, Tuple, Callable
 
 import pytest
+from requests import Response, Session
+from requests.structures import CaseInsensitiveDict
+from urllib3 import HTTPResponse
 
+from isisdl.backend.crypt import session_key
 from isisdl.backend.database_helper import DatabaseHelper
-from isisdl.backend.request_helper import RequestHelper, MediaContainer, CourseDownloader
-from isisdl.settings import testing_download_sizes, env_var_name_username, env_var_name_password, database_file_location, lock_file_location, log_file_location
-from isisdl.utils import User, config, calculate_local_checksum, MediaType, path, startup, database_helper
+from isisdl.backend.request_helper import RequestHelper, MediaContainer, CourseDownloader, SessionWithKey, RetryPolicy, SingleFlight, Probe, Course, PreMediaContainer, \
+    SegmentedDownload, DownloadController, DownloadLanes, DownloadSync, HostShare, Deduplicator
+from isisdl.settings import testing_download_sizes, env_var_name_username, env_var_name_password, database_file_location, lock_file_location, log_file_location, \
+    num_tries_download, circuit_breaker_threshold, download_retry_after_max, discover_ajax_max_batch_size, course_latency_mavg_perc, \
+    download_part_suffix, download_controller_hold_intervals, download_large_file_size, download_chunk_size, download_max_chunk_size, host_initial_max_connections, \
+    host_min_sample_size, isis_ignore_rules, extern_ignore_rules, enable_structured_link_extraction
+from isisdl.utils import User, config, calculate_local_checksum, MediaType, path, startup, database_helper, preallocate, UrlFilter
 
 
 def remove_old_files() -> None:
@@ -77,8 +91,6 @@ def get_content_to_download(request_helper: RequestHelper, monkeypatch: Any) ->
 
 @pytest.mark.skip(reason="Currently disabled, will not be fixed until 2.0")
 def test_normal_download(request_helper: RequestHelper, database_helper: DatabaseHelper, user: User, monkeypatch: Any) -> None:
-    request_helper.make_course_paths()
-
     os.environ[env_var_name_username] = os.environ["ISISDL_ACTUAL_USERNAME"]
     os.environ[env_var_name_password] = os.environ["ISISDL_ACTUAL_PASSWORD"]
 
@@ -110,3 +122,1148 @@ def test_normal_download(request_helper: RequestHelper, database_helper: Databas
             assert container.current_size is None
             assert container.url in bad_urls
             assert container.path.stat().st_size == 0
+
+
+def test_session_cache() -> None:
+    user = User("".join(random.choice(string.ascii_letters) for _ in range(16)), "".join(random.choice(string.ascii_letters) for _ in range(16)))
+
+    session = SessionWithKey("key", "token")
+    session.cookies.set("MoodleSession", "cookie", domain="isis.tu-berlin.de", path="/")  # type: ignore[no-untyped-call]
+    session.save_to_cache(user)
+
+    restored = SessionWithKey.from_cache(user)
+    assert restored is not None
+    assert restored.key == "key" and restored.token == "token"
+    assert restored.cookies.get("MoodleSession", domain="isis.tu-berlin.de") == "cookie"  # type: ignore[no-untyped-call]
+
+    # Neither a different user nor a different password may restore the session
+    assert SessionWithKey.from_cache(User(user.username + "a", user.password)) is None
+    assert SessionWithKey.from_cache(User(user.username, user.password + "a")) is None
+
+    database_helper.delete_session_cache()
+    assert SessionWithKey.from_cache(user) is None
+
+    # The key is only derived once per password
+    assert session_key.cache_info().currsize >= 1
+    hits = session_key.cache_info().hits
+    session.save_to_cache(user)
+    assert session_key.cache_info().hits == hits + 1
+    database_helper.delete_session_cache()
+
+
+def test_retry_policy(monkeypatch: Any) -> None:
+    monkeypatch.setattr(time, "sleep", lambda _: None)
+
+    def response_with(status_code: int, headers: Dict[str, str]) -> Response:
+        response = Response()
+        response.status_code = status_code
+        response.headers.update(headers)
+        response._content = b""
+        response._content_consumed = True  # type: ignore[attr-defined]
+        return response
+
+    assert RetryPolicy.retry_after(response_with(429, {"Retry-After": "5"})) == 5
+    assert RetryPolicy.retry_after(response_with(429, {"Retry-After": str(download_retry_after_max * 10)})) == download_retry_after_max
+    assert RetryPolicy.retry_after(response_with(503, {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0
+    assert RetryPolicy.retry_after(response_with(503, {"Retry-After": "soon"})) is None
+    assert RetryPolicy.retry_after(response_with(503, {})) is None
+
+    policy = RetryPolicy()
+    num_calls = 0
+
+    def unavailable(url: str, *args: Any, **kwargs: Any) -> Response:
+        nonlocal num_calls
+        num_calls += 1
+        return response_with(503, {})
+
+    # The last response is handed to the caller
+    response = policy.request(unavailable, "https://example.com/", 1)
+    assert response is not None and response.status_code == 503
+    assert num_calls == num_tries_download
+    assert policy.num_retries == num_tries_download - 1
+
+    # A single url answering with errors does not take the host down …
+    for _ in range(circuit_breaker_threshold):
+        policy.request(unavailable, "https://example.com/", 1)
+
+    assert not policy.is_open("https://example.com/")
+
+    # … but errors across different urls do.
+    for i in range(circuit_breaker_threshold):
+        policy.request(unavailable, f"https://example.com/{i}", 1)
+
+    assert policy.is_open("https://example.com/")
+
+    policy = RetryPolicy()
+    num_calls = 0
+
+    def failing(url: str, *args: Any, **kwargs: Any) -> Response:
+        nonlocal num_calls
+        num_calls += 1
+        raise ConnectionError
+
+    while not policy.is_open("https://example.com/"):
+        assert policy.request(failing, "https://example.com/", 1) is None
+
+    assert num_calls == circuit_breaker_threshold
+
+    # The host is down → fail fast without a request. Other hosts are unaffected.
+    num_fast_fails = policy.num_fast_fails
+    assert policy.request(failing, "https://example.com/other", 1) is None
+    assert num_calls == circuit_breaker_threshold
+    assert policy.num_fast_fails == num_fast_fails + 1
+
+    response = policy.request(lambda url, *args, **kwargs: response_with(200, {}), "https://example.org/", 1)
+    assert response is not None and response.ok
+
+
+def test_validators() -> None:
+    url = "https://example.com/" + "".join(random.choice(string.ascii_letters) for _ in range(16))
+    assert database_helper.get_validators(url) is None
+
+    database_helper.set_validators(url, "\"abc\"", "Wed, 21 Oct 2015 07:28:00 GMT")
+    validators = database_helper.get_validators(url)
+    assert validators is not None
+    etag, last_modified, last_checked = validators
+    assert etag == "\"abc\"" and last_modified == "Wed, 21 Oct 2015 07:28:00 GMT"
+
+    # A confirmation is only written to the database once flushed
+    database_helper._validators[url] = (etag, last_modified, 0)
+    database_helper.mark_validated(url)
+    assert database_helper.get_all_validators()[url][2] == last_checked
+    database_helper.flush_validated()
+    assert database_helper.get_all_validators()[url] == database_helper.get_validators(url)
+    assert database_helper.get_all_validators()[url][2] != 0
+
+
+def test_webservice_file_urls() -> None:
+    content = [{"modules": [{"contents": [{"fileurl": "https://isis.tu-berlin.de/pluginfile.php/1/mod_resource/content/1/a.pdf?forcedownload=1"}]}],
+                "summary": "<a href=\"https://isis.tu-berlin.de/webservice/pluginfile.php/2/course/section/3/b.pdf\">b</a>"}]
+
+    converted = RequestHelper.webservice_file_urls(content)
+    assert converted[0]["modules"][0]["contents"][0]["fileurl"] == "https://isis.tu-berlin.de/webservice/pluginfile.php/1/mod_resource/content/1/a.pdf?forcedownload=1"
+    assert converted[0]["summary"] == content[0]["summary"]
+
+
+def test_single_flight() -> None:
+    flights: SingleFlight[int] = SingleFlight()
+    num_calls = 0
+
+    def probe(value: int) -> int:
+        nonlocal num_calls
+        num_calls += 1
+        time.sleep(0.1)
+        return value
+
+    with ThreadPoolExecutor(8) as ex:
+        results = list(ex.map(lambda i: flights.do(str(i % 2), probe, i % 2), range(16)))
+
+    assert results == [i % 2 for i in range(16)]
+    assert num_calls == 2
+    assert flights.num_calls == 2 and flights.num_saved == 14
+
+    flights.clear()
+    assert flights.do("0", probe, 5) == 5
+    assert num_calls == 3
+
+    url = "https://isis.tu-berlin.de/pluginfile.php/1/a.pdf"
+    assert SingleFlight.url_key(url + "?forcedownload=1") == SingleFlight.url_key(url + "#page=2") == SingleFlight.url_key(url)
+    assert SingleFlight.url_key(url + "?forcedownload=1#page=2") == SingleFlight.url_key(url)
+    assert SingleFlight.url_key(url + "?rev=2") != SingleFlight.url_key(url)
+
+
+def test_probe_answers() -> None:
+    def probe(ok: bool, status_code: int, headers: Dict[str, str]) -> Probe:
+        return Probe(ok, status_code, CaseInsensitiveDict(headers))
+
+    # A HEAD request is only good enough if it carries the size
+    assert probe(True, 200, {"Content-Length": "10"}).answers("head")
+    assert not probe(True, 200, {}).answers("head")
+    assert not probe(False, 405, {}).answers("head")
+    assert probe(False, 404, {}).answers("head")
+    assert probe(False, 304, {}).answers("head")
+
+    assert probe(True, 200, {}).answers("range")
+    assert not probe(False, 416, {}).answers("range")
+    assert probe(False, 500, {}).answers("get")
+
+
+def test_course_sync(saved_file_tables: None) -> None:
+    assert database_helper.get_course_sync(-1) is None
+
+    database_helper.set_course_sync(-1, 42, "fingerprint", "hash", 0.5, [["https://example.com/a.pdf", MediaType.extern.value, None, None, None, None]])
+    assert database_helper.get_course_sync(-1) == (42, "fingerprint", "hash", 0.5, [["https://example.com/a.pdf", MediaType.extern.value, None, None, None, None]])
+
+    database_helper.touch_course_sync(-1, 43)
+    sync = database_helper.get_course_sync(-1)
+    assert sync is not None and sync[0] == 43
+
+    database_helper.delete_file_table()
+    assert database_helper.get_course_sync(-1) is None
+
+
+def test_unchanged_courses(saved_file_tables: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    import isisdl.backend.request_helper as request_helper
+    monkeypatch.setattr(request_helper, "enable_incremental_discovery", True)
+
+    helper = object.__new__(RequestHelper)
+    courses = [Course(str(i), str(i), str(i), -i) for i in range(1, 4)]
+    for course in courses:
+        database_helper.set_course_sync(course.course_id, int(time.time()), RequestHelper.course_sync_fingerprint(), "hash", 0.5,
+                                        [[f"https://example.com/{-course.course_id}.pdf", MediaType.document.value, None, None, None, None]])
+
+    rest_calls: List[int] = []
+
+    def post_REST(function: str, data: Optional[Dict[str, Any]] = None, *args: Any, **kwargs: Any) -> Any:
+        assert function == "core_course_get_updates_since" and data is not None
+        rest_calls.append(data["courseid"])
+        return {"instances": [{"id": 1}] if data["courseid"] == -2 else []}
+
+    monkeypatch.setattr(helper, "post_REST", post_REST)
+
+    # AJAX fails → every course falls back to REST
+    monkeypatch.setattr(helper, "post_AJAX", lambda methodname, calls: None)
+    assert set(helper.get_unchanged_courses(courses)) == {-1, -3}
+    assert sorted(rest_calls) == [-3, -2, -1]
+
+    # Without AJAX batches only REST is used
+    rest_calls.clear()
+    monkeypatch.setattr(request_helper, "discover_use_ajax_batches", False)
+    ajax_calls: List[str] = []
+    monkeypatch.setattr(helper, "post_AJAX", lambda methodname, calls: ajax_calls.append(methodname))
+    unchanged = helper.get_unchanged_courses(courses)
+    assert set(unchanged) == {-1, -3} and len(rest_calls) == 3 and ajax_calls == []
+    assert [item.url for item in unchanged[-3]] == ["https://example.com/3.pdf"]
+
+
+def test_course_sync_fingerprint(saved_file_tables: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    import isisdl.backend.request_helper as request_helper
+    monkeypatch.setattr(request_helper, "enable_content_hash_cache", True)
+    monkeypatch.setattr(RequestHelper, "course_latencies", {})
+
+    parsed: List[Course] = []
+
+    def parse_documents(self: Course, content: Any) -> List[PreMediaContainer]:
+        parsed.append(self)
+        return []
+
+    monkeypatch.setattr(Course, "parse_documents", parse_documents)
+
+    helper = object.__new__(RequestHelper)
+    course = Course("Fingerprint", "Fingerprint", "Fingerprint", -1)
+    content: List[Dict[str, Any]] = [{"modules": []}]
+
+    helper._download_documents(course, content=content)
+    helper._download_documents(course, content=content)
+    assert len(parsed) == 1
+
+    # Changing a rule changes what is parsed → the stored parse is thrown away
+    fingerprint = RequestHelper.course_sync_fingerprint()
+    monkeypatch.setattr(request_helper, "url_ignore", UrlFilter(isis_ignore_rules, extern_ignore_rules, ["example.com"]))
+    assert RequestHelper.course_sync_fingerprint() != fingerprint
+    helper._download_documents(course, content=content)
+    assert len(parsed) == 2
+
+    # The order of the rules does not matter
+    monkeypatch.setattr(request_helper, "url_ignore", UrlFilter(["example.com"], extern_ignore_rules, isis_ignore_rules))
+    helper._download_documents(course, content=content)
+    assert len(parsed) == 2
+
+    monkeypatch.setattr(request_helper, "enable_structured_link_extraction", not enable_structured_link_extraction)
+    helper._download_documents(course, content=content)
+    assert len(parsed) == 3
+
+
+def test_get_batch(monkeypatch: pytest.MonkeyPatch) -> None:
+    helper = object.__new__(RequestHelper)
+    courses = [Course(str(i), str(i), str(i), -i) for i in range(1, 11)]
+    batches: List[List[int]] = []
+
+    def post_AJAX(failing: Callable[[int], Optional[str]]) -> Callable[[str, List[Dict[str, Any]]], Optional[List[Dict[str, Any]]]]:
+        def post(methodname: str, calls: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+            batches.append([call["courseid"] for call in calls])
+            res: List[Dict[str, Any]] = []
+            for call in calls:
+                if (error := failing(call["courseid"])) is not None:
+                    # The server stops at the first failing call
+                    res.append({"error": True, "exception": {"errorcode": error, "message": ""}})
+                    break
+
+                res.append({"error": False, "data": call["courseid"]})
+
+            return res
+
+        return post
+
+    def get_batch() -> Dict[int, Any]:
+        return helper.get_batch("core_course_get_contents", courses, lambda course: {"courseid": course.course_id})
+
+    # A single failing course → the rest is batched again
+    monkeypatch.setattr(helper, "post_AJAX", post_AJAX(lambda course_id: "nopermissions" if course_id == -3 else None))
+    assert get_batch() == {course.course_id: course.course_id for course in courses if course.course_id != -3}
+    assert batches == [[course.course_id for course in courses], [course.course_id for course in courses[3:]]]
+
+    # Every call fails the same way → the remaining courses are left to REST instead of being requested one by one
+    batches.clear()
+    monkeypatch.setattr(helper, "post_AJAX", post_AJAX(lambda course_id: "servicenotavailable"))
+    assert get_batch() == {}
+    assert len(batches) == 2
+
+    # Different errors are not systemic
+    batches.clear()
+    monkeypatch.setattr(helper, "post_AJAX", post_AJAX(lambda course_id: {-1: "invalidrecord", -2: "nopermissions"}.get(course_id)))
+    assert set(get_batch()) == {course.course_id for course in courses} - {-1, -2}
+    assert len(batches) == 3
+
+
+def test_plan_content_batches(saved_file_tables: None) -> None:
+    helper = object.__new__(RequestHelper)
+    helper.courses = [Course(str(i), str(i), str(i), -i) for i in range(1, 21)]
+
+    # Course -1 is by far the slowest, the courses -11 … -20 were never discovered.
+    database_helper.set_course_stats({-i: (100.0 if i == 1 else float(i), i) for i in range(1, 11)})
+    expected = helper.expected_latencies()
+    assert expected[-1] == 100 and expected[-2] == 2 and expected[-15] == 100
+
+    batches = helper.plan_content_batches()
+    assert sorted(course.course_id for batch in batches for course in batch) == sorted(course.course_id for course in helper.courses)
+    assert all(len(batch) <= discover_ajax_max_batch_size for batch in batches)
+
+    loads = [sum(expected[course.course_id] for course in batch) for batch in batches]
+    assert loads == sorted(loads, reverse=True)
+
+    # The slowest courses are requested first
+    assert {course.course_id for course in batches[0]} & ({-1} | {-i for i in range(11, 21)})
+
+    RequestHelper.course_latencies = {-1: (50.0, 3), -30: (1.0, 2)}
+    helper.store_course_latencies()
+    RequestHelper.course_latencies = {}
+
+    stats = database_helper.get_course_stats()
+    assert stats[-1] == (100 * (1 - course_latency_mavg_perc) + 50 * course_latency_mavg_perc, 3)
+    assert stats[-30] == (1.0, 2)
+
+
+class ProbeServer(SessionWithKey):
+    """
+    Answers every probe with a pdf of `len(url)` bytes.
+    """
+
+    def get_(self, url: str, *args: Any, **kwargs: Any) -> Optional[Response]:
+        response = Response()
+        response.status_code = 200
+        response.headers.update({"Content-Type": "application/pdf", "Content-Length": str(len(url))})
+        response._content = b""
+        response._content_consumed = True  # type: ignore[attr-defined]
+        return response
+
+    def head_(self, url: str, *args: Any, **kwargs: Any) -> Optional[Response]:
+        return self.get_(url, *args, **kwargs)
+
+
+def pipelined_helper(slow_course_id: Optional[int] = None, failing_course_id: Optional[int] = None) -> Tuple[RequestHelper, List[Course]]:
+    courses = [Course(f"Pipelined {i}", f"Pipelined {i}", f"Pipelined {i}", -i) for i in range(1, 6)]
+    helper = object.__new__(RequestHelper)
+    helper.courses = courses
+    helper.session = ProbeServer("key", "token")
+
+    def documents(batch: List[Course], status: Any = None) -> List[PreMediaContainer]:
+        if any(course.course_id == slow_course_id for course in batch):
+            time.sleep(0.2)
+        if any(course.course_id == failing_course_id for course in batch):
+            raise ValueError("Broken course")
+
+        # Every course has its own files and shares a script with the other courses
+        return [PreMediaContainer(f"https://example.com/{course.course_id}/{i}.pdf", course, MediaType.document, f"{i}.pdf") for course in batch for i in range(3)] + \
+               [PreMediaContainer("https://example.com/script.pdf", course, MediaType.document, "script.pdf") for course in batch]
+
+    helper._download_mod_assign = lambda _=None: []  # type: ignore[assignment]
+    helper._download_videos = lambda _: []  # type: ignore[assignment]
+    helper._download_documents_batch = documents  # type: ignore[assignment]
+    helper.plan_content_batches = lambda: [[course] for course in courses]  # type: ignore[assignment]
+
+    return helper, courses
+
+
+def test_pipelined_discovery(saved_file_tables: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    import isisdl.backend.request_helper as request_helper
+    monkeypatch.setattr(request_helper, "discover_use_asyncio", False)
+
+    def summary(containers: List[MediaContainer]) -> List[Tuple[str, int, int, str]]:
+        # Containers of the same file are either linked or deferred, depending on the mode
+        return sorted({(con.url, con.course.course_id, con.size, str(con.path)) for item in containers for con in [item, *item._links]})
+
+    helper, courses = pipelined_helper(slow_course_id=-1)
+    sequential = [item for row in helper.download_content().values() for item in row]
+
+    helper, courses = pipelined_helper(slow_course_id=-1)
+    handed_out: List[Tuple[int, List[MediaContainer]]] = []
+
+    def on_course(containers: List[MediaContainer]) -> None:
+        course_ids = {item.course.course_id for item in containers}
+        assert len(course_ids) == 1
+        handed_out.append((course_ids.pop(), containers))
+
+    mapping, deferred = helper.download_content_pipelined(on_course)
+    pipelined = [item for row in mapping.values() for item in row]
+
+    # The same containers are discovered …
+    assert summary(pipelined) == summary(sequential)
+    assert len(summary(pipelined)) == 4 * len(courses)
+
+    # … but every course is handed out once as soon as it is discovered, without waiting for the slow one.
+    assert sorted(course_id for course_id, _ in handed_out) == sorted(course.course_id for course in courses)
+    assert handed_out[-1][0] == -1
+
+    # The shared script is only downloaded once. The other courses link to it after the downloads.
+    scripts = list({item for _, containers in handed_out for item in containers if item.url == "https://example.com/script.pdf"})
+    assert len(scripts) == 1
+    assert sorted({container.course.course_id for _, container in deferred}) == sorted(course.course_id for course in courses if course.course_id != scripts[0].course.course_id)
+    assert all(resolution == scripts[0] for resolution, _ in deferred)
+
+
+def test_pipelined_discovery_error(saved_file_tables: None) -> None:
+    helper, courses = pipelined_helper(failing_course_id=-3)
+    handed_out: List[int] = []
+
+    with pytest.raises(ValueError, match="Broken course"):
+        helper.download_content_pipelined(lambda containers: handed_out.extend({item.course.course_id for item in containers}))
+
+    assert -3 not in handed_out
+
+
+def test_async_discovery_pool_size(saved_file_tables: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    import isisdl.backend.request_helper as request_helper
+    monkeypatch.setattr(request_helper, "discover_use_asyncio", True)
+
+    class CountingServer(ProbeServer):
+        def __init__(self) -> None:
+            super().__init__("key", "token")
+            self.num_running, self.max_running = 0, 0
+            self.lock = Lock()
+
+        def pool_size(self, url: str) -> int:
+            return 2
+
+        def get_(self, url: str, *args: Any, **kwargs: Any) -> Optional[Response]:
+            with self.lock:
+                self.num_running += 1
+                self.max_running = max(self.max_running, self.num_running)
+
+            time.sleep(0.01)
+            with self.lock:
+                self.num_running -= 1
+
+            return super().get_(url, *args, **kwargs)
+
+    helper, courses = pipelined_helper()
+    helper.session = server = CountingServer()
+    containers = [item for row in helper.download_content().values() for item in row]
+
+    # Never more requests to a host than connections are kept alive for it
+    assert {item.url for item in containers} == {f"https://example.com/{course.course_id}/{i}.pdf" for course in courses for i in range(3)} | {"https://example.com/script.pdf"}
+    assert server.max_running == 2
+
+
+def test_pre_container_is_lazy() -> None:
+    course = Course("Lazy", "Lazy", "Lazy", -1)
+    container = PreMediaContainer("https://example.com/a.pdf", course, MediaType.document, "a.pdf", "Folder/")
+
+    assert not course.path().exists()
+    assert container._is_cached is None
+    assert container.is_cached is False
+
+    container.is_cached = True
+    assert container.is_cached is True
+
+
+def test_container_table() -> None:
+    course = Course("Table", "Table", "Table", -1)
+    first = MediaContainer("a.pdf", "https://example.com/a.pdf", "https://example.com/a.pdf", course.path("Documents", "a.pdf"), 42, course, MediaType.document, 1024)
+    second = MediaContainer("b:c.pdf", "https://example.com/b.pdf", "https://example.com/b.pdf?download", course.path("Documents", "b_c.pdf"), 43, course, MediaType.extern, 2048,
+                            _newly_discovered=True)
+
+    table = MediaContainer.table
+    assert table.directories[first._row] == table.directories[second._row] and table.hosts[first._row] == table.hosts[second._row]
+    assert table.download_urls[first._row] is None and table.file_names[first._row] is None
+
+    assert first.path == course.path("Documents", "a.pdf") and second.path == course.path("Documents", "b_c.pdf")
+    assert first.download_url == first.url and second.download_url == "https://example.com/b.pdf?download"
+    assert first.host == "example.com"
+    assert first.current_size is None and first._links == ()
+    assert not first._done and not first._newly_discovered and second._newly_discovered
+
+    first.current_size = 0
+    first._done = True
+    first.media_type = MediaType.corrupted
+    first.path = course.path("Extern", "a.pdf")
+    first.add_link(second)
+
+    assert first.current_size == 0 and first._done and not first._stop
+    assert first.media_type == MediaType.corrupted and first.path == course.path("Extern", "a.pdf")
+    assert list(first._links) == [second] and second._links == ()
+
+    assert first == first and first != second
+    assert MediaContainer("a.pdf", "https://example.com/a.pdf", "https://example.com/a.pdf", course.path("Extern", "a.pdf"), 42, course, MediaType.corrupted, 1024) == first
+
+
+def test_container_table_rows_are_freed(saved_file_tables: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    course = Course("Rows", "Rows", "Rows", -1)
+    monkeypatch.setitem(RequestHelper.course_id_mapping, course.course_id, course)
+    container = MediaContainer("a.pdf", "https://example.com/rows/a.pdf", "https://example.com/rows/a.pdf", course.path("a.pdf"), 42, course, MediaType.document, 1024,
+                               checksum="abc").dump()
+
+    table = MediaContainer.table
+    num_rows, num_allocated = len(table), len(table.urls)
+
+    # Checking a file does not build a container
+    for _ in range(1000):
+        assert container.should_download
+
+    assert len(table) == num_rows and len(table.urls) == num_allocated
+
+    # The rows of dropped views are reused
+    for _ in range(1000):
+        assert MediaContainer.from_dump(container.url, course) == container
+
+    assert len(table) == num_rows and len(table.urls) <= num_allocated + 1
+
+    # A view may be dropped while the table is locked by the same thread
+    row = container._row
+    with table.lock:
+        del container
+
+    assert len(table) == num_rows - 1 and table.urls[row] == "" and row in table.free_rows
+
+
+class BreakingReader:
+    """
+    A raw stream that raises once `fail_after` bytes were read.
+    """
+
+    def __init__(self, data: bytes, fail_after: Optional[int] = None) -> None:
+        self.data, self.pos, self.fail_after = data, 0, fail_after
+
+    def read(self, num_bytes: int, decode_content: bool = True) -> bytes:
+        if self.fail_after is not None and self.pos >= self.fail_after:
+            raise ConnectionError("Connection reset")
+
+        end = self.pos + num_bytes if self.fail_after is None else min(self.pos + num_bytes, self.fail_after)
+        chunk, self.pos = self.data[self.pos:end], min(end, len(self.data))
+        return chunk
+
+    def readinto(self, buffer: memoryview) -> int:
+        chunk = self.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+    def close(self) -> None:
+        pass
+
+
+class RangeServer(SessionWithKey):
+    """
+    Serves `data` with an ETag and supports `Range` / `If-Range` if `ranges` is set. The first `num_failing` responses break off after `fail_after` bytes.
+    """
+
+    def __init__(self, data: bytes, etag: str, fail_after: Optional[int] = None, num_failing: int = 0, ranges: bool = True) -> None:
+        super().__init__("key", "token")
+        self.data, self.etag, self.fail_after, self.num_failing, self.ranges = data, etag, fail_after, num_failing, ranges
+        self.requests: List[Dict[str, str]] = []
+
+    def get_(self, url: str, *args: Any, **kwargs: Any) -> Optional[Response]:
+        headers = kwargs.get("headers") or {}
+        self.requests.append(headers)
+
+        response = Response()
+        response.headers["ETag"] = self.etag
+        offset, end = 0, len(self.data) - 1
+        if self.ranges and "Range" in headers and headers.get("If-Range", self.etag) == self.etag:
+            start, stop = headers["Range"][len("bytes="):].split("-")
+            offset, end = int(start), min(int(stop or end), end)
+            response.status_code = 206
+            response.headers["Content-Range"] = f"bytes {offset}-{end}/{len(self.data)}"
+        else:
+            response.status_code = 200
+
+        fail_after = None
+        if self.num_failing:
+            self.num_failing -= 1
+            fail_after = self.fail_after
+
+        response.headers["Content-Length"] = str(end + 1 - offset)
+        response.raw = BreakingReader(self.data[offset:end + 1], fail_after)
+        return response
+
+
+class ChunkThrottler:
+    def get(self, location: Path, num_bytes: int = 4096) -> int:
+        return min(num_bytes, 4096)
+
+    def record(self, num_bytes: int) -> None:
+        pass
+
+
+def test_resumable_download() -> None:
+    course = Course("Resume", "Resume", "Resume", -1)
+    os.makedirs(course.path(), exist_ok=True)
+    data, changed = os.urandom(50_000), os.urandom(60_000)
+    throttler: Any = ChunkThrottler()
+
+    def container(size: int = len(data)) -> MediaContainer:
+        file = course.path("video.mp4")
+        file.open("w").close()
+        return MediaContainer("video.mp4", "https://example.com/video.mp4", "https://example.com/video.mp4", file, 0, course, MediaType.document, size)
+
+    try:
+        # The connection breaks off and is resumed within the same run
+        server = RangeServer(data, '"v1"', fail_after=20_000, num_failing=1)
+        file = container()
+        assert file.download(throttler, server)
+        assert file.path.read_bytes() == data and not file.part_path.exists()
+        assert server.requests[1] == {"Range": "bytes=20000-", "If-Range": '"v1"'}
+        assert database_helper.get_partial_download(str(file.part_path)) is None
+
+        # Every attempt breaks off → the .part file is resumed on the next run
+        file.path.unlink()
+        server = RangeServer(data, '"v1"', fail_after=4_096, num_failing=num_tries_download + 1)
+        file = container()
+        file.download(throttler, server)
+
+        received = 4_096 * (num_tries_download + 1)
+        assert file.part_path.stat().st_size == received and file.path.stat().st_size == 0
+        assert database_helper.get_partial_download(str(file.part_path)) == (file.download_url, '"v1"')
+
+        server = RangeServer(data, '"v1"')
+        file = container()
+        assert file.download(throttler, server)
+        assert server.requests == [{"Range": f"bytes={received}-", "If-Range": '"v1"'}]
+        assert file.path.read_bytes() == data and not file.part_path.exists()
+
+        # The file changed since the .part file was written → start over
+        file.path.unlink()
+        file.part_path.write_bytes(data[:8_192])
+        database_helper.set_partial_download(str(file.part_path), file.download_url, '"v1"')
+
+        server = RangeServer(changed, '"v2"')
+        file = container(len(changed))
+        assert file.download(throttler, server)
+        assert file.path.read_bytes() == changed and not file.part_path.exists()
+
+        # Without a strong validator it can't be resumed → the partial file is thrown away instead of being moved into place
+        file.path.unlink()
+        server = RangeServer(data, 'W/"v1"', fail_after=4_096, num_failing=num_tries_download + 1)
+        file = container()
+        file.download(throttler, server)
+        assert file.path.stat().st_size == 0 and not file.part_path.exists()
+        assert file.checksum is None and file.current_size is None and MediaContainer.dumped_info(file.url, course) is True
+        assert database_helper.get_partial_download(str(file.part_path)) is None
+
+    finally:
+        shutil.rmtree(course.path(), ignore_errors=True)
+        database_helper.delete_partial_download(str(course.path("video.mp4" + download_part_suffix)))
+
+
+def test_segmented_download(monkeypatch: pytest.MonkeyPatch) -> None:
+    import isisdl.backend.request_helper as request_helper
+    monkeypatch.setattr(request_helper, "segmented_download_min_size", 100_000)
+    monkeypatch.setattr(request_helper, "segmented_download_piece_size", 16_384)
+    monkeypatch.setattr(request_helper, "segmented_download_adapt_interval", 0.001)
+
+    course = Course("Segmented", "Segmented", "Segmented", -1)
+    os.makedirs(course.path(), exist_ok=True)
+    data = os.urandom(300_000)
+    throttler: Any = ChunkThrottler()
+
+    def container(url: str = "https://example.com/video.mp4") -> MediaContainer:
+        file = course.path("video.mp4")
+        file.open("w").close()
+        return MediaContainer("video.mp4", url, url, file, 0, course, MediaType.document, len(data))
+
+    try:
+        # Some of the pieces break off and are requested again
+        server = RangeServer(data, '"v1"', fail_after=5_000, num_failing=3)
+        file = container()
+        assert file.download(throttler, server)
+        assert file.path.read_bytes() == data and not file.part_path.exists()
+        assert server.requests[0] == {"Range": "bytes=0-16383"}
+        assert all(request.get("If-Range") == '"v1"' for request in server.requests[1:])
+        assert len(server.requests) >= len(data) // 16_384 + 1
+        assert database_helper.get_partial_download(str(file.part_path)) is None
+
+        # The server ignores ranges → a single stream is used
+        file.path.unlink()
+        server = RangeServer(data, '"v1"', ranges=False)
+        file = container("https://no-ranges.example.com/video.mp4")
+        assert file.download(throttler, server)
+        assert file.path.read_bytes() == data
+        assert len(server.requests) == 2
+        assert "no-ranges.example.com" in SegmentedDownload.no_range_hosts
+
+    finally:
+        shutil.rmtree(course.path(), ignore_errors=True)
+        database_helper.delete_partial_download(str(course.path("video.mp4" + download_part_suffix)))
+
+
+def test_download_controller(monkeypatch: pytest.MonkeyPatch) -> None:
+    import isisdl.backend.request_helper as request_helper
+    monkeypatch.setattr(request_helper, "download_controller_interval", 0.005)
+    monkeypatch.setattr(request_helper, "enable_host_fair_share", False)
+    monkeypatch.setattr(DownloadController, "decisions", [])
+
+    throttler: Any = SimpleNamespace(bandwidth_since=lambda since: 0.0)
+    controller = DownloadController(throttler, 8)
+    assert controller.num_threads == 2
+
+    # Threads are added as long as they help ...
+    assert [controller.decide(goodput) for goodput in [20, 30, 40]] == ["probe", "increase", "increase"]
+    assert controller.num_threads == 5
+
+    # ... the last one didn't → it is removed and the next probe waits
+    assert controller.decide(41) == "revert" and controller.num_threads == 4
+    assert [controller.decide(40) for _ in range(download_controller_hold_intervals)] == ["hold"] * download_controller_hold_intervals
+    assert controller.decide(40) == "probe" and controller.num_threads == 5
+
+    # The goodput collapsed
+    assert controller.decide(10) == "decrease" and controller.num_threads == 2
+    assert len(DownloadController.decisions) == 6 + download_controller_hold_intervals
+
+    # The goodput saturates at 3 threads
+    controller = DownloadController(throttler, 6)
+    throttler.bandwidth_since = lambda since: min(controller.num_threads, 3) * 1000.0
+
+    lanes = DownloadLanes()
+    for i in range(200):
+        lanes.put(SimpleNamespace(size=i, should_download=True, host="example.com", current_size=i))  # type: ignore[arg-type]
+    lanes.put(None)
+
+    downloaded: List[Tuple[int, str]] = []
+
+    def download(file: Any) -> None:
+        time.sleep(0.001)
+        downloaded.append((file.size, current_thread().name))
+
+    controller.run(lanes, download)
+    assert sorted(size for size, _ in downloaded) == list(range(200))
+    assert {name for _, name in downloaded} <= {f"T_{i}" for i in range(6)}
+    assert max(num_threads for *_, num_threads in DownloadController.decisions[-8:]) <= 4
+    assert any(line.startswith("Download threads:") for line in DownloadController.report())
+
+
+def test_download_controller_host_caps(monkeypatch: pytest.MonkeyPatch) -> None:
+    import isisdl.backend.request_helper as request_helper
+    monkeypatch.setattr(request_helper, "download_controller_interval", 0.005)
+    monkeypatch.setattr(request_helper, "download_controller_initial_num_threads", 3)
+    monkeypatch.setattr(request_helper, "host_initial_max_connections", 1)
+    monkeypatch.setattr(request_helper, "host_max_connections", 1)
+    monkeypatch.setattr(DownloadController, "decisions", [])
+
+    # Two hosts with one connection each → one of the three threads always waits for a host
+    lanes = DownloadLanes()
+    for i in range(200):
+        lanes.put(SimpleNamespace(size=i, should_download=True, host=f"host{i % 2}.example.com", current_size=i))  # type: ignore[arg-type]
+    lanes.put(None)
+
+    def download(file: Any) -> None:
+        time.sleep(0.002)
+
+    throttler: Any = SimpleNamespace(bandwidth_since=lambda since: 1000.0)
+    controller = DownloadController(throttler, 8)
+    controller.run(lanes, download)
+
+    # The controller still decides, but doesn't add threads which would only wait as well
+    assert DownloadController.decisions
+    assert DownloadController.decisions[0][2] == "hold" and DownloadController.decisions[0][3] == 3
+
+
+def test_download_lanes(monkeypatch: pytest.MonkeyPatch) -> None:
+    import isisdl.backend.request_helper as request_helper
+    monkeypatch.setattr(request_helper, "enable_host_fair_share", False)
+
+    def file(size: int, should_download: bool = True) -> Any:
+        return SimpleNamespace(size=size, should_download=should_download, host="example.com", current_size=size)
+
+    lanes = DownloadLanes()
+    small, large = download_large_file_size // 1024, download_large_file_size
+    for item in [file(3 * small), file(2 * large), file(small), file(large), file(5 * large, False), file(4 * large), file(2 * small)]:
+        lanes.put(item)
+
+    small_lane, large_lane = lanes.hosts[""].lanes
+    assert len(large_lane) == 3 and len(small_lane) == 4
+
+    # The large lane hands out the largest file. The small lane the files which don't have to be downloaded first, then the smallest ones.
+    first, second = lanes.get(3), lanes.get(3)
+    assert first is not None and second is not None
+    assert first.size == 4 * large and (second.size, second.should_download) == (5 * large, False)
+
+    # The large lane is at its share → the small lane is used
+    assert [lanes.get(3).size for _ in range(3)] == [small, 2 * small, 3 * small]  # type: ignore[union-attr]
+
+    # The small lane is empty → the files of the large lane are stolen
+    assert [lanes.get(3).size for _ in range(2)] == [2 * large, large]  # type: ignore[union-attr]
+    assert lanes.num_large_busy == 3
+
+    lanes.done(second)
+    lanes.done(first)
+    assert lanes.num_large_busy == 2
+
+    lanes.put(None)
+    assert lanes.get(3) is None and len(lanes) == 0
+
+    # Every file is only checked once
+    class CountingFile:
+        host = "example.com"
+
+        def __init__(self, size: int) -> None:
+            self.size, self.current_size, self.num_checks = size, size, 0
+
+        @property
+        def should_download(self) -> bool:
+            self.num_checks += 1
+            return True
+
+    lanes, files = DownloadLanes(), [CountingFile(small), CountingFile(large)]
+    for item in files:
+        lanes.put(item)  # type: ignore[arg-type]
+
+    assert lanes.get(3) is not None and lanes.get(3) is not None
+    assert [item.num_checks for item in files] == [1, 1]
+
+
+def test_write_stream(tmp_path: Path) -> None:
+    class RecordingThrottler:
+        def __init__(self) -> None:
+            self.requested: List[int] = []
+            self.recorded: List[int] = []
+
+        def get(self, location: Path, num_bytes: int = 0) -> int:
+            self.requested.append(num_bytes)
+            return num_bytes
+
+        def record(self, num_bytes: int) -> None:
+            self.recorded.append(num_bytes)
+
+    data = os.urandom(5 * download_max_chunk_size + 123)
+    response = Response()
+    response.raw = BreakingReader(data)
+    throttler: Any = RecordingThrottler()
+
+    file = MediaContainer("stream.bin", "https://example.com/stream.bin", "https://example.com/stream.bin", tmp_path / "stream.bin", 0, Course("Stream", "Stream", "Stream", -1),
+                          MediaType.document, len(data))
+    file.current_size = 0
+
+    with file.path.open("wb", buffering=0) as f:
+        assert file.write_stream(response, f, throttler)
+
+    assert file.path.read_bytes() == data and file.current_size == len(data)
+    assert sum(throttler.recorded) == len(data)
+
+    # The chunks grow from the smallest size up to the largest one
+    assert throttler.requested[0] == download_chunk_size and max(throttler.requested) == download_max_chunk_size
+    assert throttler.requested == sorted(throttler.requested)
+
+    # The buffer is reused
+    assert MediaContainer.download_buffer() is MediaContainer.download_buffer()
+
+    # The connection breaks off
+    response.raw = BreakingReader(data, fail_after=download_chunk_size * 3)
+    file.current_size = 0
+    with file.path.open("wb", buffering=0) as f:
+        assert not file.write_stream(response, f, throttler)
+
+    assert file.path.read_bytes() == data[:download_chunk_size * 3] and file.current_size == download_chunk_size * 3
+
+
+def test_write_stream_keeps_connection(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    data = os.urandom(3 * download_max_chunk_size)
+    num_connections = 0
+
+    # The body is read from http.client directly, urllib3 would copy every chunk
+    urllib3_reads: List[Any] = []
+    monkeypatch.setattr(HTTPResponse, "readinto", lambda *args: urllib3_reads.append(args))
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self) -> None:
+            nonlocal num_connections
+            num_connections += 1
+            super().setup()
+
+        def do_GET(self) -> None:
+            self.send_response(200)
+            # The truncated file announces more than it sends and closes the connection
+            self.send_header("Content-Length", str(len(data) + (10 if self.path == "/truncated" else 0)))
+            self.end_headers()
+            self.wfile.write(data)
+            if self.path == "/truncated":
+                self.close_connection = True
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    throttler: Any = ChunkThrottler()
+
+    def download(session: Session, path: str) -> Tuple[MediaContainer, bool]:
+        file = MediaContainer("keep.bin", url + path, url + path, tmp_path / "keep.bin", 0, Course("Keep", "Keep", "Keep", -1), MediaType.document, len(data))
+        file.current_size = 0
+        response = session.get(url + path, stream=True)
+        with file.path.open("wb", buffering=0) as f:
+            is_complete = file.write_stream(response, f, throttler)
+
+        response.close()
+        return file, is_complete
+
+    try:
+        # The connection is put back into the pool and reused for every download
+        with Session() as session:
+            for _ in range(5):
+                file, is_complete = download(session, "/file")
+                assert is_complete and file.path.read_bytes() == data
+
+        assert num_connections == 1 and urllib3_reads == []
+
+        with Session() as session:
+            file, is_complete = download(session, "/truncated")
+            assert not is_complete and file.current_size == len(data)
+
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_inline_checksum(monkeypatch: pytest.MonkeyPatch) -> None:
+    import isisdl.backend.request_helper as request_helper
+    calls: List[Path] = []
+
+    def counting_checksum(file: Path) -> str:
+        calls.append(file)
+        return calculate_local_checksum(file)
+
+    monkeypatch.setattr(request_helper, "calculate_local_checksum", counting_checksum)
+
+    course = Course("Checksum", "Checksum", "Checksum", -1)
+    os.makedirs(course.path(), exist_ok=True)
+    data = os.urandom(70_000)
+    throttler: Any = ChunkThrottler()
+
+    def container() -> MediaContainer:
+        file = course.path("slides.pdf")
+        file.open("w").close()
+        return MediaContainer("slides.pdf", "https://example.com/slides.pdf", "https://example.com/slides.pdf", file, 0, course, MediaType.document, len(data))
+
+    try:
+        # Computed while downloading, even with a reconnect in between
+        file = container()
+        assert file.download(throttler, RangeServer(data, '"v1"', fail_after=30_000, num_failing=1))
+        assert file.checksum == calculate_local_checksum(file.path) and calls == []
+
+        # Resumed from a .part file → the file is read again
+        file.path.unlink()
+        file = container()
+        file.part_path.write_bytes(data[:8_192])
+        database_helper.set_partial_download(str(file.part_path), file.download_url, '"v1"')
+        assert file.download(throttler, RangeServer(data, '"v1"'))
+        assert file.checksum == calculate_local_checksum(file.path) and calls == [file.path]
+
+    finally:
+        shutil.rmtree(course.path(), ignore_errors=True)
+        database_helper.delete_partial_download(str(course.path("slides.pdf" + download_part_suffix)))
+
+
+def test_preallocated_download(monkeypatch: pytest.MonkeyPatch) -> None:
+    import isisdl.backend.request_helper as request_helper
+    monkeypatch.setattr(request_helper, "preallocation_min_size", 0)
+
+    allocated: List[Tuple[int, int]] = []
+
+    def recording_preallocate(fd: int, offset: int, length: int) -> bool:
+        allocated.append((offset, length))
+        return preallocate(fd, offset, length)
+
+    monkeypatch.setattr(request_helper, "preallocate", recording_preallocate)
+
+    course = Course("Preallocate", "Preallocate", "Preallocate", -1)
+    os.makedirs(course.path(), exist_ok=True)
+    data = os.urandom(60_000)
+    throttler: Any = ChunkThrottler()
+
+    def container() -> MediaContainer:
+        return MediaContainer("lecture.mp4", "https://example.com/lecture.mp4", "https://example.com/lecture.mp4", course.path("lecture.mp4"), 0, course, MediaType.document,
+                              len(data))
+
+    try:
+        # The download stops early → the .part file is cut to the received bytes, nothing is at the path yet
+        file = container()
+        file.download(throttler, RangeServer(data, '"v1"', fail_after=4_096, num_failing=num_tries_download + 1))
+
+        received = 4_096 * (num_tries_download + 1)
+        assert allocated == [(0, len(data))]
+        assert file.part_path.stat().st_size == received and not file.path.exists()
+
+        # It is resumed and the rest preallocated
+        file = container()
+        assert file.download(throttler, RangeServer(data, '"v1"'))
+        assert allocated[-1] == (received, len(data) - received)
+        assert file.path.read_bytes() == data and not file.part_path.exists()
+
+    finally:
+        shutil.rmtree(course.path(), ignore_errors=True)
+        database_helper.delete_partial_download(str(course.path("lecture.mp4" + download_part_suffix)))
+
+
+def test_download_sync(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    import isisdl.backend.request_helper as request_helper
+    synced: List[Path] = []
+    monkeypatch.setattr(request_helper, "fsync_path", synced.append)
+
+    sync = DownloadSync("batch", 2)
+    sync.after_replace(tmp_path / "a")
+    assert synced == []
+
+    sync.after_replace(tmp_path / "b")
+    assert synced == [tmp_path / "a", tmp_path / "b", tmp_path]
+
+    sync.after_replace(tmp_path / "c")
+    sync.flush()
+    assert synced[3:] == [tmp_path / "c", tmp_path] and sync.num_synced == 3 and sync.pending == []
+
+
+def test_host_fair_share() -> None:
+    def file(host: str, size: int = 1024) -> Any:
+        return SimpleNamespace(size=size, should_download=True, host=host, current_size=size)
+
+    lanes = DownloadLanes()
+    for _ in range(5):
+        lanes.put(file("isis.tu-berlin.de"))
+        lanes.put(file("tubcloud.tu-berlin.de"))
+
+    # The hosts take turns until both are at their limit
+    taken = [lanes.take(8) for _ in range(2 * host_initial_max_connections)]
+    assert [item.host for item in taken] == ["isis.tu-berlin.de", "tubcloud.tu-berlin.de"] * host_initial_max_connections  # type: ignore[union-attr]
+    assert lanes.take(8) is None
+    assert sorted(lanes.utilization()) == [("isis.tu-berlin.de", host_initial_max_connections, host_initial_max_connections, 5 - host_initial_max_connections),
+                                           ("tubcloud.tu-berlin.de", host_initial_max_connections, host_initial_max_connections, 5 - host_initial_max_connections)]
+
+    # A finished download frees the connection of its host
+    lanes.done(taken[1])  # type: ignore[arg-type]
+    item = lanes.take(8)
+    assert item is not None and item.host == "tubcloud.tu-berlin.de"
+
+    # More connections are allowed as long as they raise the throughput of the host …
+    share = HostShare("isis.tu-berlin.de")
+    share.learn(share.max_connections, 10 * host_min_sample_size, 1)
+    assert share.max_connections == host_initial_max_connections + 1
+
+    # … but not if the throughput per connection drops as much
+    share.learn(share.max_connections, 10 * host_min_sample_size * host_initial_max_connections // share.max_connections + 1, 1)
+    assert share.max_connections == host_initial_max_connections + 1
+
+    share.learn(share.max_connections, 2 * host_min_sample_size, 1)
+    assert share.max_connections == host_initial_max_connections
+
+    # Small downloads are summed up until they make up a sample
+    share.learn(share.max_connections, host_min_sample_size - 1, 1)
+    assert share.max_connections == host_initial_max_connections
+
+    share.learn(share.max_connections, host_min_sample_size - 1, 1)
+    assert share.max_connections == host_initial_max_connections + 1
+
+
+def test_host_fair_share_single_host(monkeypatch: pytest.MonkeyPatch) -> None:
+    import isisdl.backend.request_helper as request_helper
+    monkeypatch.setattr(request_helper, "download_controller_interval", 0.005)
+    monkeypatch.setattr(DownloadController, "decisions", [])
+
+    # Many small files of a single host
+    lanes = DownloadLanes()
+    for _ in range(300):
+        lanes.put(SimpleNamespace(size=100 * 1024, should_download=True, host="isis.tu-berlin.de", current_size=100 * 1024))  # type: ignore[arg-type]
+    lanes.put(None)
+
+    lock, num_running, max_running = Lock(), 0, 0
+
+    def download(file: Any) -> None:
+        nonlocal num_running, max_running
+        with lock:
+            num_running += 1
+            max_running = max(max_running, num_running)
+
+        time.sleep(0.002)
+        with lock:
+            num_running -= 1
+
+    throttler: Any = SimpleNamespace()
+    controller = DownloadController(throttler, 8)
+    throttler.bandwidth_since = lambda since: controller.num_threads * 1000.0
+    controller.run(lanes, download)
+
+    # Without another host there is nothing to share → the host is not limited and the controller adds threads
+    assert max_running > host_initial_max_connections
+    assert lanes.hosts["isis.tu-berlin.de"].num_bytes == 300 * 100 * 1024
+
+
+def test_deduplication(monkeypatch: pytest.MonkeyPatch) -> None:
+    import isisdl.backend.request_helper as request_helper
+    monkeypatch.setattr(request_helper, "deduplication_min_size", 50_000)
+    monkeypatch.setattr(request_helper, "deduplication_sample_size", 4_096)
+
+    first_course, second_course = Course("Dedup A", "Dedup A", "Dedup A", -1), Course("Dedup B", "Dedup B", "Dedup B", -1)
+    os.makedirs(first_course.path(), exist_ok=True)
+    os.makedirs(second_course.path(), exist_ok=True)
+    data, changed = os.urandom(100_000), os.urandom(100_000)
+    throttler: Any = ChunkThrottler()
+
+    def container(course: Course, name: str, url: str) -> MediaContainer:
+        return MediaContainer(name, url, url, course.path(name), 0, course, MediaType.document, len(data))
+
+    num_copied, num_rejected, num_bytes_saved = Deduplicator.num_copied, Deduplicator.num_rejected, Deduplicator.num_bytes_saved
+    try:
+        original = container(first_course, "Lecture 03 - Sorting.pdf", "https://example.com/a/sorting.pdf")
+        assert original.download(throttler, RangeServer(data, '"v1"'))
+
+        # The same file under another url → only its start, middle and end are requested
+        server = RangeServer(data, '"v1"')
+        duplicate = container(second_course, "Lecture_03_Sorting.pdf", "https://example.com/b/sorting.pdf")
+        assert not duplicate.download(throttler, server)
+        assert server.requests == [{"Range": f"bytes={start}-{start + 4_095}"} for start in [0, (len(data) - 4_096) // 2, len(data) - 4_096]]
+        assert duplicate.path.read_bytes() == data and duplicate.checksum == original.checksum and duplicate._done
+        assert Deduplicator.num_copied == num_copied + 1 and Deduplicator.num_bytes_saved == num_bytes_saved + len(data)
+
+        # The files are not linked: Editing the copy leaves the original alone
+        assert not os.path.samefile(original.path, duplicate.path)
+        with duplicate.path.open("r+b") as f:
+            f.seek(20_000)
+            f.write(b"edited")
+
+        assert original.path.read_bytes() == data
+
+        # The edited copy matches in the samples, but not its checksum → the original is copied
+        server = RangeServer(data, '"v1"')
+        third = container(first_course, "Lecture_03_Sorting.pdf", "https://example.com/c/sorting.pdf")
+        assert not third.download(throttler, server)
+        assert len(server.requests) == 6 and third.path.read_bytes() == data
+        assert Deduplicator.num_copied == num_copied + 2 and Deduplicator.num_rejected == num_rejected + 1
+
+        # Same size and a similar name, but another file → it is downloaded
+        server = RangeServer(changed, '"v2"')
+        other = container(second_course, "Lecture 03 - Sorting (v2).pdf", "https://example.com/b/sorting-v2.pdf")
+        assert other.download(throttler, server)
+        assert other.path.read_bytes() == changed
+        # The original and both copies are candidates
+        assert Deduplicator.num_rejected == num_rejected + 4
+
+        # The server does not support ranges → it is downloaded
+        server = RangeServer(data, '"v1"', ranges=False)
+        unranged = container(second_course, "Lecture 03 Sorting.pdf", "https://norange.example.com/sorting.pdf")
+        assert unranged.download(throttler, server)
+        assert "norange.example.com" in SegmentedDownload.no_range_hosts and len(server.requests) == 2
+        assert unranged.path.read_bytes() == data
+
+    finally:
+        SegmentedDownload.no_range_hosts.discard("norange.example.com")
+        shutil.rmtree(first_course.path(), ignore_errors=True)
+        shutil.rmtree(second_course.path(), ignore_errors=True)
@@ -0,0 +1,86 @@
+from pathlib import Path
+
+from isisdl.settings import url_finder
+from isisdl.utils import find_links, find_text_links, UrlFilter, url_ignore, isis_documents, make_parent_directories
+
+
+def test_find_text_links() -> None:
+    assert find_text_links("See https://example.com/a.pdf.") == ["https://example.com/a.pdf"]
+    assert find_text_links("(https://example.com/a.pdf), http://example.org/b?c=d!") == ["https://example.com/a.pdf", "http://example.org/b?c=d"]
+    assert find_text_links("https://en.wikipedia.org/wiki/Python_(programming_language)") == ["https://en.wikipedia.org/wiki/Python_(programming_language)"]
+    assert find_text_links("example.com/without/scheme") == []
+
+
+def test_find_links() -> None:
+    content = [{
+        "summary": '<p>Slides: <a href="https://example.com/slides.pdf?a=1&amp;b=2">here</a>, script at https://example.org/script.pdf.</p>'
+                   '<img src="https://example.com/image.png"><a href="/relative/link">relative</a>',
+        "modules": [{
+            "url": "https://isis.tu-berlin.de/mod/resource/view.php?id=1",
+            "description": "Plain text linking http://example.net/notes.txt",
+            "contents": [{"fileurl": "https://isis.tu-berlin.de/webservice/pluginfile.php/1/a.pdf?forcedownload=1", "filesize": 1}],
+        }],
+    }]
+
+    assert find_links(content) == {
+        "https://example.com/slides.pdf?a=1&b=2",
+        "https://example.org/script.pdf",
+        "https://example.com/image.png",
+        "https://isis.tu-berlin.de/mod/resource/view.php?id=1",
+        "http://example.net/notes.txt",
+        "https://isis.tu-berlin.de/webservice/pluginfile.php/1/a.pdf?forcedownload=1",
+    }
+
+    # Every link with a scheme that the old regex finds is found as well (modulo html escaping)
+    old = {link for link in url_finder.findall(str(content)) if "://" in link}
+    assert {link.replace("&amp;", "&") for link in old} <= find_links(content)
+
+
+def test_url_filter() -> None:
+    url_filter = UrlFilter(["isis.tu-berlin.de/mod/forum/", "isis.tu-berlin.de/theme/image.php", "github.com"], ["Example.org/private/"])
+
+    assert url_filter.match("https://isis.tu-berlin.de/mod/forum/view.php?id=1") == "isis.tu-berlin.de/mod/forum/"
+    assert url_filter.match("https://isis.tu-berlin.de/theme/image.php/nephthys/core/1/f/pdf") == "isis.tu-berlin.de/theme/image.php"
+    assert url_filter.match("https://isis.tu-berlin.de/mod/resource/view.php?id=1") is None
+    assert url_filter.match("https://isis.tu-berlin.de/mod/forumx/view.php") is None
+    assert url_filter.match("https://isis.tu-berlin.de/mod/forum") == "isis.tu-berlin.de/mod/forum/"
+
+    assert url_filter.match("https://github.com") == "github.com"
+    assert url_filter.match("https://gist.github.com/user/1") == "github.com"
+    assert url_filter.match("https://notgithub.com/") is None
+
+    assert url_filter.match("https://example.org/private/a.pdf") == "Example.org/private/"
+    assert url_filter.match("https://example.org/public/a.pdf") is None
+    assert url_filter.match("not a url") is None
+    assert url_filter.match("http://[invalid") is None
+
+    assert url_filter.hits == {"isis.tu-berlin.de/mod/forum/": 2, "isis.tu-berlin.de/theme/image.php": 1, "github.com": 2, "Example.org/private/": 1}
+
+
+def test_default_url_filters() -> None:
+    ignored = [
+        "https://isis.tu-berlin.de/mod/quiz/view.php?id=12",
+        "https://isis.tu-berlin.de/h5p/embed.php?url=abc",
+        "https://isis.tu-berlin.de/availability/condition/shibboleth2fa/index.php",
+        "https://tu-berlin.zoom.us/j/123",
+        "https://de.wikipedia.org/wiki/Moodle",
+    ]
+    kept = [
+        "https://isis.tu-berlin.de/mod/resource/view.php?id=12",
+        "https://isis.tu-berlin.de/webservice/pluginfile.php/1/mod_resource/content/1/a.pdf",
+        "https://tubcloud.tu-berlin.de/s/abc",
+    ]
+
+    assert all(url_ignore.match(url) is not None for url in ignored)
+    assert all(url_ignore.match(url) is None for url in kept)
+
+    assert isis_documents.match("https://isis.tu-berlin.de/webservice/pluginfile.php/1/mod_resource/content/1/a.pdf") is not None
+    assert isis_documents.match("https://isis.tu-berlin.de/pluginfile.php/1/mod_folder/content/0/a.pdf") is not None
+    assert isis_documents.match("https://isis.tu-berlin.de/mod/resource/view.php?id=12") is None
+
+
+def test_make_parent_directories(tmp_path: Path) -> None:
+    files = [tmp_path / "a" / "b" / "1.pdf", tmp_path / "a" / "b" / "2.pdf", tmp_path / "c" / "3.pdf"]
+    make_parent_directories(files)
+
+    assert sorted(str(item.relative_to(tmp_path)) for item in tmp_path.rglob("*")) == ["a", "a/b", "c"]